@@ -23,6 +23,9 @@ class DistributionSignedRpmScanner(Actor):
     where <distro> is distribution ID of the installed system (e.g. centos, rhel).
 
     If the file for the installed distribution is not find, end with error.
+
+    The deprecated InstalledRedHatSignedRPM message is not produced when
+    the LEAPP_PRODUCE_DEPRECATED_RPM_MSGS=0 envar is set.
     """
 
     name = 'distribution_signed_rpm_scanner'
@@ -48,10 +48,24 @@ def is_exceptional(pkg, allowlist):
     return pkg.name == 'gpg-pubkey' or pkg.name.startswith('katello-ca-consumer') or pkg.name in allowlist
 
 
+def _produce_deprecated_msgs():
+    """
+    Return True if the deprecated InstalledRedHatSignedRPM should be produced.
+
+    The message is just another full copy of the DistributionSignedRPM data
+    stored in the leapp database, and nothing in the leapp repositories
+    consumes it anymore. It is still produced by default for custom actors
+    that have not been migrated yet, unless LEAPP_PRODUCE_DEPRECATED_RPM_MSGS=0
+    is set.
+    """
+    return get_env('LEAPP_PRODUCE_DEPRECATED_RPM_MSGS', '1') != '0'
+
+
 def process():
     distribution = api.current_actor().configuration.os_release.release_id
     distro_keys = get_distribution_data(distribution)
     all_signed = get_env('LEAPP_DEVEL_RPMS_ALL_SIGNED', '0') == '1'
+    produce_deprecated = _produce_deprecated_msgs()
     rhui_pkgs = rhui.get_all_known_rhui_pkgs_for_current_upg()
 
     signed_pkgs = DistributionSignedRPM()
@@ -62,11 +76,12 @@ def process():
         for pkg in rpm_pkgs.items:
             if all_signed or is_distro_signed(pkg, distro_keys) or is_exceptional(pkg, rhui_pkgs):
                 signed_pkgs.items.append(pkg)
-                if distribution == 'rhel':
+                if produce_deprecated and distribution == 'rhel':
                     rh_signed_pkgs.items.append(pkg)
                 continue
             unsigned_pkgs.items.append(pkg)
 
     api.produce(signed_pkgs)
-    api.produce(rh_signed_pkgs)
+    if produce_deprecated:
+        api.produce(rh_signed_pkgs)
     api.produce(unsigned_pkgs)
@@ -4,6 +4,7 @@ from leapp.libraries.common import rpms
 from leapp.libraries.common.config import mock_configs
 from leapp.models import (
     DistributionSignedRPM,
+    EnvVar,
     fields,
     InstalledRedHatSignedRPM,
     InstalledRPM,
@@ -11,7 +12,8 @@ from leapp.models import (
     IPUConfig,
     Model,
     OSRelease,
-    RPM
+    RPM,
+    Version
 )
 
 RH_PACKAGER = 'Red Hat, Inc. <http://bugzilla.redhat.com/bugzilla>'
@@ -187,6 +189,34 @@ def test_gpg_pubkey_pkg(current_actor_context):
     assert not current_actor_context.consume(InstalledUnsignedRPM)[0].items
 
 
+def test_deprecated_msgs_opt_out(current_actor_context):
+    installed_rpm = [
+        RPM(name='sample01', version='0.1', release='1.sm01', epoch='1', packager=RH_PACKAGER, arch='noarch',
+            pgpsig='RSA/SHA256, Mon 01 Jan 1970 00:00:00 AM -03, Key ID 199e2f91fd431d51'),
+        RPM(name='sample02', version='0.1', release='1.sm01', epoch='1', packager=RH_PACKAGER, arch='noarch',
+            pgpsig='SOME_OTHER_SIG_X'),
+    ]
+    config = IPUConfig(
+        leapp_env_vars=[EnvVar(name='LEAPP_PRODUCE_DEPRECATED_RPM_MSGS', value='0')],
+        os_release=OSRelease(
+            release_id='rhel',
+            name='Red Hat Enterprise Linux Server',
+            pretty_name='RHEL',
+            version='7.6 (Maipo)',
+            version_id='7.6'
+        ),
+        version=Version(source='7.6', target='8.0'),
+        architecture='x86_64',
+        kernel='3.10.0-957.43.1.el7.x86_64',
+    )
+
+    current_actor_context.feed(InstalledRPM(items=installed_rpm))
+    current_actor_context.run(config_model=config)
+    assert len(current_actor_context.consume(DistributionSignedRPM)[0].items) == 1
+    assert not current_actor_context.consume(InstalledRedHatSignedRPM)
+    assert len(current_actor_context.consume(InstalledUnsignedRPM)[0].items) == 1
+
+
 def test_create_lookup():
     # NOTE(ivasilev) Ideally should be tested separately from the actor, but since library
     # testing functionality is not yet implemented in leapp-repository the tests will reside here.
@@ -4,12 +4,16 @@ import re
 import shutil
 import tempfile
 
-from six.moves import urllib
-
 from leapp import reporting
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.common.config.version import get_target_major_version
-from leapp.libraries.common.gpg import get_gpg_fp_from_file, get_path_to_gpg_certs, is_nogpgcheck_set
+from leapp.libraries.common.gpg import (
+    fetch_keys,
+    get_gpg_fp_from_file,
+    get_path_to_gpg_certs,
+    is_nogpgcheck_set,
+    Keyring
+)
 from leapp.libraries.stdlib import api
 from leapp.models import (
     DNFWorkaround,
@@ -291,9 +295,8 @@ def process():
     invalid_keys = list()
     repos_missing_keys = list()
 
-    pubkeys = [key.fingerprint for key in trusted_gpg_keys.items]
-    processed_gpgkey_urls = set()
-    tmpdir = None
+    keyring = Keyring(trusted_gpg_keys.items)
+    gpgkey_urls = []
     for repoid in used_target_repos:
         if repoid.repoid not in target_repo_id_to_repositories_facts_map:
             api.current_logger().warning('The target repository {} metadata not available'.format(repoid.repoid))
@@ -305,40 +308,42 @@ def process():
             repos_missing_keys.append(repo.repoid)
             continue
         for gpgkey_url in gpgkeys:
-            if gpgkey_url in processed_gpgkey_urls:
-                continue
-            processed_gpgkey_urls.add(gpgkey_url)
-
-            if gpgkey_url.startswith('file:///'):
-                key_file = _get_abs_file_path(target_userspace, gpgkey_url)
-            elif gpgkey_url.startswith('http://') or gpgkey_url.startswith('https://'):
-                # delay creating temporary directory until we need it
-                tmpdir = tempfile.mkdtemp() if tmpdir is None else tmpdir
-                # FIXME: what to do with dummy? it's fd, that should be closed also
-                dummy, tmp_file = tempfile.mkstemp(dir=tmpdir)
-                try:
-                    urllib.request.urlretrieve(gpgkey_url, tmp_file)
-                    key_file = tmp_file
-                except urllib.error.URLError as err:
-                    api.current_logger().warning(
-                        'Failed to download the gpgkey {}: {}'.format(gpgkey_url, str(err)))
-                    failed_download.append(gpgkey_url)
-                    continue
-            else:
-                unknown_protocol.append(gpgkey_url)
-                api.current_logger().error(
-                    'Skipping unknown protocol for gpgkey {}'.format(gpgkey_url))
-                continue
-            fps = get_gpg_fp_from_file(key_file)
-            if not fps:
-                invalid_keys.append(gpgkey_url)
+            if gpgkey_url not in gpgkey_urls:
+                gpgkey_urls.append(gpgkey_url)
+
+    # download all the remote keys at once
+    remote_keys = fetch_keys([url for url in gpgkey_urls if url.startswith(('http://', 'https://'))])
+
+    tmpdir = None
+    for gpgkey_url in gpgkey_urls:
+        if gpgkey_url.startswith('file:///'):
+            key_file = _get_abs_file_path(target_userspace, gpgkey_url)
+        elif gpgkey_url in remote_keys:
+            data, err = remote_keys[gpgkey_url]
+            if data is None:
                 api.current_logger().warning(
-                    'Cannot get any gpg key from the file: {}'.format(gpgkey_url)
-                )
+                    'Failed to download the gpgkey {}: {}'.format(gpgkey_url, str(err)))
+                failed_download.append(gpgkey_url)
                 continue
-            for fp in fps:
-                if fp not in pubkeys and gpgkey_url not in missing_keys:
-                    missing_keys.append(_get_abs_file_path(target_userspace, gpgkey_url))
+            # delay creating temporary directory until we need it
+            tmpdir = tempfile.mkdtemp() if tmpdir is None else tmpdir
+            fd, key_file = tempfile.mkstemp(dir=tmpdir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        else:
+            unknown_protocol.append(gpgkey_url)
+            api.current_logger().error(
+                'Skipping unknown protocol for gpgkey {}'.format(gpgkey_url))
+            continue
+        fps = get_gpg_fp_from_file(key_file)
+        if not fps:
+            invalid_keys.append(gpgkey_url)
+            api.current_logger().warning(
+                'Cannot get any gpg key from the file: {}'.format(gpgkey_url)
+            )
+            continue
+        if keyring.get_missing(fps) and gpgkey_url not in missing_keys:
+            missing_keys.append(_get_abs_file_path(target_userspace, gpgkey_url))
 
     if tmpdir:
         # clean up temporary directory with downloaded gpg keys
@@ -1,3 +1,5 @@
+import socket
+
 import pytest
 from six.moves.urllib.error import URLError
 
@@ -28,6 +30,14 @@ from leapp.utils.deprecation import suppress_deprecation
 # whole process as I was initially advised not to use these component tests.
 
 
+@pytest.fixture(autouse=True)
+def _no_key_files(monkeypatch):
+    """
+    Do not parse key files present on the host, the output of gpg is mocked instead
+    """
+    monkeypatch.setattr('leapp.libraries.common.gpg._parse_key_file', lambda key_path: None)
+
+
 def _get_test_gpgkeys_missing():
     """
     Return list of Trusted GPG keys without the epel9 key we look for
@@ -401,8 +411,16 @@ def get_test_tmptargetrepositoriesfacts_ftp():
     )
 
 
-def _urlretrive_mocked(url, filename=None, reporthook=None, data=None):
-    return filename
+class _ResponseMocked(object):
+    def read(self):
+        return b''
+
+    def close(self):
+        pass
+
+
+def _urlopen_mocked(url, data=None, timeout=None):
+    return _ResponseMocked()
 
 
 def test_perform_https_gpgkey(monkeypatch):
@@ -418,7 +436,7 @@ def test_perform_https_gpgkey(monkeypatch):
     monkeypatch.setattr(api, 'current_logger', logger_mocked())
     monkeypatch.setattr(reporting, 'create_report', create_report_mocked())
     monkeypatch.setattr('leapp.libraries.common.gpg._gpg_show_keys', _gpg_show_keys_mocked)
-    monkeypatch.setattr('six.moves.urllib.request.urlretrieve', _urlretrive_mocked)
+    monkeypatch.setattr('six.moves.urllib.request.urlopen', _urlopen_mocked)
 
     process()
     assert api.produce.called == 1
@@ -428,11 +446,16 @@ def test_perform_https_gpgkey(monkeypatch):
     assert "https://example.com/rpm-gpg/key.gpg" in reporting.create_report.reports[0]['summary']
 
 
-def _urlretrive_mocked_urlerror(url, filename=None, reporthook=None, data=None):
+def _urlopen_mocked_urlerror(url, data=None, timeout=None):
     raise URLError('error')
 
 
-def test_perform_https_gpgkey_urlerror(monkeypatch):
+def _urlopen_mocked_timeout(url, data=None, timeout=None):
+    raise socket.timeout('timed out')
+
+
+@pytest.mark.parametrize('urlopen_mocked', [_urlopen_mocked_urlerror, _urlopen_mocked_timeout])
+def test_perform_https_gpgkey_urlerror(monkeypatch, urlopen_mocked):
     """
     Executes the "main" function with repositories providing keys over internet
 
@@ -445,7 +468,7 @@ def test_perform_https_gpgkey_urlerror(monkeypatch):
     monkeypatch.setattr(api, 'current_logger', logger_mocked())
     monkeypatch.setattr(reporting, 'create_report', create_report_mocked())
     monkeypatch.setattr('leapp.libraries.common.gpg._gpg_show_keys', _gpg_show_keys_mocked)
-    monkeypatch.setattr('six.moves.urllib.request.urlretrieve', _urlretrive_mocked_urlerror)
+    monkeypatch.setattr('six.moves.urllib.request.urlopen', urlopen_mocked)
 
     process()
     assert len(api.current_logger.warnmsg) == 1
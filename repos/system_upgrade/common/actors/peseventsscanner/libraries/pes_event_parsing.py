@@ -7,7 +7,7 @@ from itertools import chain
 from leapp import reporting
 from leapp.exceptions import StopActorExecution
 from leapp.libraries.common import fetch
-from leapp.libraries.common.config import architecture
+from leapp.libraries.common.config import architecture, get_env, version
 from leapp.libraries.common.rpms import get_leapp_packages, LeappComponents
 from leapp.libraries.stdlib import api
 
@@ -39,6 +39,9 @@ class Package(_Package):  # noqa: E0102; pylint: disable=function-redefined
         return (self.name, self.modulestream) == (other.name, other.modulestream)
 
 
+# Version of the format of PES events stored in the data asset cache. Bump it whenever the parsing of events changes.
+PES_EVENTS_CACHE_VERSION = 1
+
 Event = namedtuple('Event', ['id',            # int
                              'action',        # An instance of Action
                              'in_pkgs',       # A set of Package named tuples
@@ -60,30 +63,83 @@ class Action(IntEnum):
     RENAMED = 7
 
 
+def is_relevant_release(release):
+    """
+    Check whether the release (major, minor) is relevant for this IPU.
+
+    Relevant release happened between the source OS version and the target OS version.
+    """
+    relevant_releases_match_list = [
+        '> {0}'.format(api.current_actor().configuration.version.source),
+        '<= {0}'.format(api.current_actor().configuration.version.target)
+    ]
+    return version.matches_version(relevant_releases_match_list, '{}.{}'.format(*release))
+
+
+def is_streaming_parse_enabled():
+    return get_env('LEAPP_PES_STREAMING_PARSER', '0') == '1'
+
+
 def get_pes_events(pes_json_directory, pes_json_filename):
     """
     Get all the events from the source JSON file exported from PES.
 
+    The events matching the current architecture are cached (see :class:`fetch.DataAssetCache`), so following
+    executions do not need to parse the JSON file again unless it is modified.
+
+    When LEAPP_PES_STREAMING_PARSER=1, the JSON file is parsed incrementally and entries for
+    other architectures and releases not relevant for this IPU are dropped before any events
+    are created from them, lowering the memory consumption. Such entries are not validated.
+
     :return: List of Event tuples, where each event contains event type and input/output pkgs
     """
+    arch = api.current_actor().configuration.architecture
+    streaming_parse = is_streaming_parse_enabled()
+    cache_id = arch
+    if streaming_parse:
+        # Events are filtered by releases as well, so they are specific for the source and target versions
+        cache_id = '{0}.{1}-{2}'.format(arch,
+                                        api.current_actor().configuration.version.source,
+                                        api.current_actor().configuration.version.target)
+
+    events_cache = fetch.DataAssetCache(pes_json_filename,
+                                        cache_id=cache_id,
+                                        version=PES_EVENTS_CACHE_VERSION,
+                                        directory=pes_json_directory)
+    cached_events = events_cache.load(api.current_actor(),
+                                      asset_fulltext_name='PES events file',
+                                      docs_url='',
+                                      docs_title='')
+    if cached_events is not None:
+        return [event_from_cache_entry(entry) for entry in cached_events]
+
     try:
-        # NOTE(pstodulk): load_data_assert raises StopActorExecutionError, see
-        # the code for more info. Keeping the handling on the framework in such
-        # a case as we have no work to do in such a case here.
-        events_data = fetch.load_data_asset(api.current_actor(),
-                                            pes_json_filename,
-                                            asset_fulltext_name='PES events file',
-                                            docs_url='',
-                                            docs_title='')
-        if not events_data:
-            return None
-
-        if not events_data.get('packageinfo'):
-            raise ValueError('Found PES data with invalid structure')
-
-        all_events = list(chain(*[parse_entry(entry) for entry in events_data['packageinfo']]))
-        arch = api.current_actor().configuration.architecture
-        events_matching_arch = [e for e in all_events if not e.architectures or arch in e.architectures]
+        if streaming_parse:
+            events_data, events_matching_arch = get_pes_events_streamed(pes_json_directory, pes_json_filename, arch)
+            if not events_data:
+                return None
+
+            if not events_data.get('packageinfo'):
+                raise ValueError('Found PES data with invalid structure')
+        else:
+            # NOTE(pstodulk): load_data_assert raises StopActorExecutionError, see
+            # the code for more info. Keeping the handling on the framework in such
+            # a case as we have no work to do in such a case here.
+            events_data = fetch.load_data_asset(api.current_actor(),
+                                                pes_json_filename,
+                                                asset_fulltext_name='PES events file',
+                                                docs_url='',
+                                                docs_title='')
+            if not events_data:
+                return None
+
+            if not events_data.get('packageinfo'):
+                raise ValueError('Found PES data with invalid structure')
+
+            all_events = list(chain(*[parse_entry(entry) for entry in events_data['packageinfo']]))
+            events_matching_arch = [e for e in all_events if not e.architectures or arch in e.architectures]
+
+        events_cache.store(events_data, [event_to_cache_entry(event) for event in events_matching_arch])
         return events_matching_arch
     except (ValueError, KeyError):
         local_path = os.path.join(pes_json_directory, pes_json_filename)
@@ -112,6 +168,67 @@ def get_pes_events(pes_json_directory, pes_json_filename):
         raise StopActorExecution()
 
 
+def get_pes_events_streamed(pes_json_directory, pes_json_filename, arch):
+    """
+    Parse the PES events incrementally, keeping only events matching the arch and relevant releases.
+
+    :return: A tuple (events_data, events), where events_data contains the data of the JSON file except
+             the 'packageinfo' field, which contains just the number of all PES entries.
+    """
+    events = []
+    release_relevance = {}
+
+    def process_entry(entry):
+        architectures = entry.get('architectures')
+        if architectures and arch not in architectures:
+            return
+
+        to_release = parse_release(entry.get('release'))
+        if to_release not in release_relevance:
+            release_relevance[to_release] = is_relevant_release(to_release)
+        if not release_relevance[to_release]:
+            return
+
+        events.extend(parse_entry(entry))
+
+    events_data = fetch.load_data_asset_streamed(api.current_actor(),
+                                                 pes_json_filename,
+                                                 asset_fulltext_name='PES events file',
+                                                 docs_url='',
+                                                 docs_title='',
+                                                 streamed_field='packageinfo',
+                                                 item_handler=process_entry,
+                                                 directory=pes_json_directory)
+    return events_data, events
+
+
+def event_to_cache_entry(event):
+    """Convert the event into a tuple composed only of basic types, so it can be stored in the data asset cache."""
+    return (
+        event.id,
+        int(event.action),
+        tuple(tuple(pkg) for pkg in event.in_pkgs),
+        tuple(tuple(pkg) for pkg in event.out_pkgs),
+        tuple(event.from_release),
+        tuple(event.to_release),
+        list(event.architectures),
+    )
+
+
+def event_from_cache_entry(entry):
+    """Create the event from its data asset cache representation created by event_to_cache_entry."""
+    event_id, action, in_pkgs, out_pkgs, from_release, to_release, architectures = entry
+    return Event(
+        event_id,
+        Action(action),
+        {Package(*pkg) for pkg in in_pkgs},
+        {Package(*pkg) for pkg in out_pkgs},
+        from_release,
+        to_release,
+        architectures
+    )
+
+
 def generate_event_for_ms_mapping_entry(from_ms_to_ms_entry, event):
     from_modulestream, to_modulestreams = from_ms_to_ms_entry
 
@@ -3,9 +3,8 @@ from functools import partial
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecutionError
-from leapp.libraries.actor import peseventsscanner_repomap
-from leapp.libraries.actor.pes_event_parsing import Action, get_pes_events, Package
-from leapp.libraries.common import rpms
+from leapp.libraries.actor.pes_event_parsing import Action, get_pes_events, is_relevant_release, Package
+from leapp.libraries.common import repomaputils, rpms
 from leapp.libraries.common.config import version
 from leapp.libraries.stdlib import api
 from leapp.libraries.stdlib.config import is_verbose
@@ -100,13 +99,8 @@ def get_relevant_releases(events):
 
     Relevant release happened between the source OS version and the target OS version.
     """
-    # Collect releases that happened between source OS version and target OS version
-    relevant_releases_match_list = [
-        '> {0}'.format(api.current_actor().configuration.version.source),
-        '<= {0}'.format(api.current_actor().configuration.version.target)
-    ]
     releases = {event.to_release for event in events}
-    releases = [r for r in releases if version.matches_version(relevant_releases_match_list, '{}.{}'.format(*r))]
+    releases = [r for r in releases if is_relevant_release(r)]
     return sorted(releases)
 
 
@@ -171,6 +165,106 @@ def compute_pkg_changes_between_consequent_releases(source_installed_pkgs,
     return (target_pkgs, pkgs_to_demodularize)
 
 
+class EventIndex(object):
+    """
+    Index of PES events by their to_release and by the names of their input packages.
+
+    The index is built once and allows to apply events of a release without scanning all PES events. Only events that
+    can possibly be applied are inspected - events with at least one of their input packages (matched by name) present
+    in the given set of packages, and events without any input packages.
+    """
+
+    def __init__(self, events):
+        self.events_by_release = defaultdict(list)
+        self._in_pkg_name_index = defaultdict(lambda: defaultdict(list))  # release -> pkg name -> [event positions]
+        self._events_without_in_pkgs = defaultdict(list)  # release -> [event positions]
+
+        for event in events:
+            release_events = self.events_by_release[event.to_release]
+            position = len(release_events)
+            release_events.append(event)
+
+            if not event.in_pkgs:
+                self._events_without_in_pkgs[event.to_release].append(position)
+                continue
+
+            release_index = self._in_pkg_name_index[event.to_release]
+            for in_pkg_name in {pkg.name for pkg in event.in_pkgs}:
+                release_index[in_pkg_name].append(position)
+
+    def get_events_with_in_pkg(self, release, pkg):
+        """Get events of the given release having the given package among their input packages."""
+        release_events = self.events_by_release.get(release, [])
+        positions = self._in_pkg_name_index.get(release, {}).get(pkg.name, [])
+        return [release_events[pos] for pos in positions if pkg in release_events[pos].in_pkgs]
+
+    def get_candidate_events(self, release, pkgs):
+        """
+        Get events of the given release that might be applicable to the given packages.
+
+        The events are returned in the same order as they were in the list used to build the index.
+        """
+        release_events = self.events_by_release.get(release)
+        if not release_events:
+            return []
+
+        release_index = self._in_pkg_name_index.get(release, {})
+        positions = set(self._events_without_in_pkgs.get(release, []))
+        for pkg_name in {pkg.name for pkg in pkgs}:
+            positions.update(release_index.get(pkg_name, []))
+
+        return [release_events[pos] for pos in sorted(positions)]
+
+
+def compute_pkg_changes_using_event_index(source_installed_pkgs,
+                                          event_index,
+                                          release,
+                                          seen_pkgs,
+                                          pkgs_to_demodularize):
+    """
+    Apply events of the given release using the prebuilt event index.
+
+    Produces the same results as compute_pkg_changes_between_consequent_releases, however, only the events
+    having their input packages among the seen packages are considered and the target state is modified in-place.
+    As the seen packages always contain all the packages of the source_installed_pkgs, no applicable event is missed.
+    """
+    logger = api.current_logger()
+    target_pkgs = set(source_installed_pkgs)
+
+    for event in event_index.get_candidate_events(release, seen_pkgs):
+        if event.action == Action.PRESENT:
+            for pkg in event.in_pkgs:
+                if pkg in seen_pkgs:
+                    # Remove the package with the old repository, add the one with the new one
+                    target_pkgs.discard(pkg)
+                    target_pkgs.add(pkg)
+        elif event.action == Action.DEPRECATED:
+            if not event.in_pkgs.isdisjoint(source_installed_pkgs):
+                # Remove packages with old repositories add packages with the new one
+                target_pkgs.difference_update(event.in_pkgs)
+                target_pkgs.update(event.in_pkgs)
+        else:
+            are_all_in_pkgs_present = all(in_pkg in source_installed_pkgs for in_pkg in event.in_pkgs)
+            is_any_in_pkg_present = any(in_pkg in source_installed_pkgs for in_pkg in event.in_pkgs)
+
+            if are_all_in_pkgs_present or (event.action == Action.MERGED and is_any_in_pkg_present):
+                removed_pkgs = target_pkgs.intersection(event.in_pkgs)
+                removed_pkgs_str = ', '.join(str(pkg) for pkg in removed_pkgs) if removed_pkgs else '[]'
+                added_pkgs_str = ', '.join(str(pkg) for pkg in event.out_pkgs) if event.out_pkgs else '[]'
+                logger.debug('Applying event %d (%s): replacing packages %s with %s',
+                             event.id, event.action, removed_pkgs_str, added_pkgs_str)
+
+                target_pkgs.difference_update(event.in_pkgs)
+                target_pkgs.update(event.out_pkgs)
+
+    # Any event of the release mentioning a package as its input package means the package should not be demodularized
+    pkgs_to_demodularize = {
+        pkg for pkg in pkgs_to_demodularize if not event_index.get_events_with_in_pkg(release, pkg)
+    }
+
+    return (target_pkgs, pkgs_to_demodularize)
+
+
 def remove_undesired_events(events, relevant_to_releases):
     """
     Conservatively remove events that needless, or cause problems for the current implementation:
@@ -220,7 +314,14 @@ def remove_undesired_events(events, relevant_to_releases):
     return cleaned_events
 
 
-def compute_packages_on_target_system(source_pkgs, events, releases):
+def compute_packages_on_target_system(source_pkgs, events, releases, use_event_index=True):
+    """
+    Compute the packages that should be present on the target system by applying events of the given releases.
+
+    :param use_event_index: Index the events by their release and input packages once and apply only events that
+                            can affect the packages. When False, all events are rescanned for every release.
+    """
+    event_index = EventIndex(events) if use_event_index else None
 
     seen_pkgs = set(source_pkgs)  # Used to track whether PRESENCE events can be applied
     target_pkgs = set(source_pkgs)
@@ -234,12 +335,21 @@ def compute_packages_on_target_system(source_pkgs, events, releases):
             did_processing_cross_major_version = True
             pkgs_to_demodularize = {pkg for pkg in target_pkgs if pkg.modulestream}
 
+        if event_index:
+            target_pkgs, pkgs_to_demodularize = compute_pkg_changes_using_event_index(target_pkgs, event_index,
+                                                                                      release, seen_pkgs,
+                                                                                      pkgs_to_demodularize)
+            seen_pkgs.update(target_pkgs)
+            continue
+
         target_pkgs, pkgs_to_demodularize = compute_pkg_changes_between_consequent_releases(target_pkgs, events,
                                                                                             release, seen_pkgs,
                                                                                             pkgs_to_demodularize)
         seen_pkgs = seen_pkgs.union(target_pkgs)
 
-    demodularized_pkgs = {Package(pkg.name, pkg.repository, None) for pkg in pkgs_to_demodularize}
+    # Iterate in a sorted order so the resulting repository of a package with multiple modulestreams does not depend
+    # on the internal ordering of the set
+    demodularized_pkgs = {Package(pkg.name, pkg.repository, None) for pkg in sorted(pkgs_to_demodularize)}
     demodularized_target_pkgs = target_pkgs.difference(pkgs_to_demodularize).union(demodularized_pkgs)
 
     return (demodularized_target_pkgs, pkgs_to_demodularize)
@@ -359,13 +469,13 @@ def get_pesid_to_repoid_map(target_pesids):
     rhui_info = next(api.consume(RHUIInfo), None)
     cloud_provider = rhui_info.provider if rhui_info else ''
 
-    repomap = peseventsscanner_repomap.RepoMapDataHandler(repositories_map_msg, cloud_provider=cloud_provider)
+    repomap = repomaputils.RepoMapDataHandler(repositories_map_msg, cloud_provider=cloud_provider)
 
     # NOTE: We have to calculate expected target repositories like in the setuptargetrepos actor.
     # It's planned to handle this in different a way in future...
 
     enabled_repoids = get_enabled_repoids()
-    default_channels = peseventsscanner_repomap.get_default_repository_channels(repomap, enabled_repoids)
+    default_channels = repomaputils.get_default_repository_channels(repomap, enabled_repoids)
     repomap.set_default_channels(default_channels)
 
     exp_pesid_repos = repomap.get_expected_target_pesid_repos(enabled_repoids)
@@ -375,7 +485,7 @@ def get_pesid_to_repoid_map(target_pesids):
     # data for a guess of the best repository from the requires target pesid..
     # FIXME: this could now fail in case all repos are disabled...
     representative_repo = exp_pesid_repos.get(
-        peseventsscanner_repomap.DEFAULT_PESID[version.get_target_major_version()], None
+        repomaputils.DEFAULT_PESID[version.get_target_major_version()], None
     )
     if not representative_repo:
         api.current_logger().warning('Cannot determine the representative target base repository.')
@@ -383,7 +493,7 @@ def get_pesid_to_repoid_map(target_pesids):
             'Fallback: Create an artificial representative PESIDRepositoryEntry for the repository mapping'
         )
         representative_repo = PESIDRepositoryEntry(
-            pesid=peseventsscanner_repomap.DEFAULT_PESID[version.get_target_major_version()],
+            pesid=repomaputils.DEFAULT_PESID[version.get_target_major_version()],
             arch=api.current_actor().configuration.architecture,
             major_version=version.get_target_major_version(),
             repoid='artificial-repoid',
@@ -1,21 +1,25 @@
+import json
 import os.path
+import shutil
+import sys
 from collections import namedtuple
 
 import pytest
 
 from leapp import reporting
-from leapp.exceptions import StopActorExecution
+from leapp.exceptions import StopActorExecution, StopActorExecutionError
 from leapp.libraries.actor.pes_event_parsing import (
     Action,
     Event,
     get_pes_events,
+    is_relevant_release,
     Package,
     parse_entry,
     parse_packageset,
     parse_pes_events
 )
 from leapp.libraries.common import fetch
-from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked
+from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked, produce_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import ConsumedDataAsset
 
@@ -168,3 +172,164 @@ def test_get_pes_events_invalid_data_reported(monkeypatch):
         get_pes_events("doesn't", "matter")
 
     assert created_reports.called
+
+
+def test_get_pes_events_cached(monkeypatch, tmpdir):
+    """
+    Tests that parsed PES events are cached and the cache is invalidated when the PES data file changes.
+    """
+    asset_dir = tmpdir.mkdir('files')
+    asset_path = os.path.join(str(asset_dir), 'pes-events.json')
+    shutil.copy(os.path.join(CUR_DIR, 'files/sample04.json'), asset_path)
+
+    load_data_asset_calls = []
+
+    def load_data_asset_mocked(actor, asset_filename, **dummy_kwargs):
+        load_data_asset_calls.append(asset_filename)
+        with open(asset_path) as f:
+            return json.load(f)
+
+    actor = CurrentActorMocked()
+    actor.produces = (ConsumedDataAsset,)
+    monkeypatch.setattr(api, 'current_actor', actor)
+    monkeypatch.setattr(api, 'produce', produce_mocked())
+    monkeypatch.setattr(fetch, 'load_data_asset', load_data_asset_mocked)
+    monkeypatch.setattr(fetch, 'DATA_ASSET_CACHE_DIR', str(tmpdir.join('cache')))
+
+    parsed_events = get_pes_events(str(asset_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 1
+
+    cached_events = get_pes_events(str(asset_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 1
+    assert cached_events == parsed_events
+
+    consumed_assets = [msg for msg in api.produce.model_instances if isinstance(msg, ConsumedDataAsset)]
+    assert len(consumed_assets) == 1
+    assert consumed_assets[0].filename == 'pes-events.json'
+
+    # the same content with a different stat signature is hashed just once
+    hashed = []
+    get_asset_sha256 = fetch.DataAssetCache._get_asset_sha256
+
+    def get_asset_sha256_mocked(self):
+        hashed.append(self.asset_path)
+        return get_asset_sha256(self)
+
+    monkeypatch.setattr(fetch.DataAssetCache, '_get_asset_sha256', get_asset_sha256_mocked)
+    stat = os.stat(asset_path)
+    os.utime(asset_path, (stat.st_atime, stat.st_mtime + 10))
+    assert get_pes_events(str(asset_dir), 'pes-events.json') == parsed_events
+    assert get_pes_events(str(asset_dir), 'pes-events.json') == parsed_events
+    assert len(load_data_asset_calls) == 1
+    assert hashed == [asset_path]
+
+    shutil.copy(os.path.join(CUR_DIR, 'files/sample01.json'), asset_path)
+    events = get_pes_events(str(asset_dir), 'pes-events.json')
+    assert len(load_data_asset_calls) == 2
+    assert len(events) == 2
+
+
+def _generate_pes_data(entries_count):
+    architectures = [['x86_64'], ['s390x'], ['ppc64le'], ['aarch64'], []]
+    releases = [(7, 6), (7, 9), (8, 0), (8, 2), (8, 6), (8, 8), (9, 0), (9, 2)]
+
+    def release(major, minor):
+        return {'z_stream': None, 'major_version': major, 'tag': None, 'os_name': 'RHEL', 'minor_version': minor}
+
+    packageinfo = []
+    for i in range(entries_count):
+        from_release = releases[i % (len(releases) - 1)]
+        to_release = releases[i % (len(releases) - 1) + 1]
+        packageinfo.append({
+            'id': i,
+            'action': i % 8,
+            'architectures': architectures[i % len(architectures)],
+            'initial_release': release(*from_release),
+            'release': release(*to_release),
+            'in_packageset': {'set_id': 2 * i, 'package': [{'name': 'in-pkg{0}'.format(i), 'repository': 'repo'}]},
+            'out_packageset': {'set_id': 2 * i + 1,
+                               'package': [{'name': 'out-pkg{0}'.format(i), 'repository': 'repo'}]},
+        })
+    return {'packageinfo': packageinfo, 'provided_data_streams': ['3.0']}
+
+
+def _write_pes_events_file(asset_dir, entries_count):
+    with open(os.path.join(asset_dir, 'pes-events.json'), 'w') as f:
+        json.dump(_generate_pes_data(entries_count), f)
+
+
+def _mock_pes_events_loading(monkeypatch, asset_dir, cache_dir, streaming):
+    def load_data_asset_mocked(actor, asset_filename, **dummy_kwargs):
+        with open(os.path.join(asset_dir, asset_filename)) as f:
+            return json.load(f)
+
+    envars = {'LEAPP_PES_STREAMING_PARSER': '1' if streaming else '0'}
+    actor = CurrentActorMocked(src_ver='7.9', dst_ver='8.6', envars=envars)
+    actor.produces = (ConsumedDataAsset,)
+    monkeypatch.setattr(api, 'current_actor', actor)
+    monkeypatch.setattr(api, 'produce', produce_mocked())
+    monkeypatch.setattr(fetch, 'load_data_asset', load_data_asset_mocked)
+    monkeypatch.setattr(fetch, 'DATA_ASSET_CACHE_DIR', cache_dir)
+
+
+def test_get_pes_events_streamed(monkeypatch, tmpdir):
+    """
+    Tests that the streaming parser returns the same events as the full parse except the irrelevant releases.
+    """
+    asset_dir = str(tmpdir)
+    cache_dir = str(tmpdir.join('cache'))
+    _write_pes_events_file(asset_dir, 200)
+
+    _mock_pes_events_loading(monkeypatch, asset_dir, cache_dir, streaming=False)
+    all_events = get_pes_events(asset_dir, 'pes-events.json')
+    expected_events = [event for event in all_events if is_relevant_release(event.to_release)]
+
+    _mock_pes_events_loading(monkeypatch, asset_dir, cache_dir, streaming=True)
+    for dummy_attempt in range(2):  # The second attempt uses the cached events
+        streamed_events = get_pes_events(asset_dir, 'pes-events.json')
+        assert streamed_events == expected_events
+        assert all(event.architectures in ([], ['x86_64']) for event in streamed_events)
+
+    consumed_assets = [msg for msg in api.produce.model_instances if isinstance(msg, ConsumedDataAsset)]
+    assert len(consumed_assets) == 2
+    assert all(asset.provided_data_streams == ['3.0'] for asset in consumed_assets)
+
+
+@pytest.mark.parametrize(('content', 'error_msg'), (
+    ('{"packageinfo": [{"id": 1}, ', 'does not contain a valid JSON object'),
+    ('{"packageinfo": []} []', 'does not contain a valid JSON object'),
+    ('[{"packageinfo": []}]', 'does not contain a JSON object at the topmost level'),
+    ('', 'exists but is empty'),
+))
+def test_get_pes_events_streamed_invalid_data(monkeypatch, tmpdir, content, error_msg):
+    _mock_pes_events_loading(monkeypatch, str(tmpdir), str(tmpdir.join('cache')), streaming=True)
+    with open(os.path.join(str(tmpdir), 'pes-events.json'), 'w') as f:
+        f.write(content)
+
+    with pytest.raises(StopActorExecutionError) as err:
+        get_pes_events(str(tmpdir), 'pes-events.json')
+    assert error_msg in '{0} {1}'.format(err.value.message, err.value.details)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason='tracemalloc is not available')
+def test_get_pes_events_streamed_memory_benchmark(monkeypatch, tmpdir):
+    """
+    Compares the peak memory consumption of the streaming parser with the full parse.
+    """
+    import tracemalloc  # pylint: disable=import-outside-toplevel
+
+    asset_dir = str(tmpdir)
+    _write_pes_events_file(asset_dir, 5000)
+
+    peaks = {}
+    for streaming in (False, True):
+        # Use separate cache directories, so the events are always parsed
+        _mock_pes_events_loading(monkeypatch, asset_dir, str(tmpdir.join('cache-{0}'.format(streaming))), streaming)
+        tracemalloc.start()
+        get_pes_events(asset_dir, 'pes-events.json')
+        dummy_current, peaks[streaming] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    api.current_logger().info('Peak memory of the PES events parsing: full: {0} B, streamed: {1} B'
+                              .format(peaks[False], peaks[True]))
+    assert peaks[True] < peaks[False] / 2
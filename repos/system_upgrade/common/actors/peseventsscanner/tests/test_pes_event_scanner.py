@@ -1,3 +1,4 @@
+import random
 from functools import partial
 
 import pytest
@@ -466,3 +467,71 @@ def test_remove_leapp_related_events(monkeypatch):
 
     out_events = pes_events_scanner.remove_leapp_related_events(in_events)
     assert out_events == expected_out_events
+
+
+def _generate_random_events_and_pkgs(seed):
+    """Generate a random set of installed packages and PES events referencing a small pool of packages."""
+    rng = random.Random(seed)
+
+    pkg_names = ['pkg{0}'.format(i) for i in range(25)]
+    modulestreams = [None, None, ('module1', 'stream1'), ('module2', 'stream2')]
+    repos = ['repo-a', 'repo-b', 'repo-c']
+    releases = [(7, 9), (8, 0), (8, 1), (8, 2)]
+
+    def random_pkgs(max_count):
+        return {
+            Package(rng.choice(pkg_names), rng.choice(repos), rng.choice(modulestreams))
+            for dummy_i in range(rng.randint(0, max_count))
+        }
+
+    events = []
+    for event_id in range(rng.randint(20, 80)):
+        from_release_idx = rng.randint(0, len(releases) - 2)
+        to_release_idx = rng.randint(from_release_idx + 1, len(releases) - 1)
+        events.append(Event(event_id, rng.choice(list(Action)), random_pkgs(3), random_pkgs(3),
+                            releases[from_release_idx], releases[to_release_idx], []))
+
+    return random_pkgs(20), events, releases[1:]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_event_index_matches_full_rescan(monkeypatch, seed):
+    """Differential test - the indexed event application has to produce exactly the same result as the full rescan."""
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='7.9', dst_ver='8.2'))
+    installed_pkgs, events, releases = _generate_random_events_and_pkgs(seed)
+
+    indexed_target, indexed_demodularized = compute_packages_on_target_system(installed_pkgs, events, releases)
+    rescan_target, rescan_demodularized = compute_packages_on_target_system(installed_pkgs, events, releases,
+                                                                            use_event_index=False)
+
+    assert pkgs_into_tuples(indexed_target) == pkgs_into_tuples(rescan_target)
+    assert pkgs_into_tuples(indexed_demodularized) == pkgs_into_tuples(rescan_demodularized)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_event_index_produces_same_messages(monkeypatch, seed):
+    """Differential test - the actor has to produce the same messages regardless of the event application engine."""
+    installed_pkgs, events, dummy_releases = _generate_random_events_and_pkgs(seed)
+
+    monkeypatch.setattr(pes_events_scanner, 'get_installed_pkgs', lambda: installed_pkgs)
+    monkeypatch.setattr(pes_events_scanner, 'get_pes_events', lambda folder, filename: events)
+    monkeypatch.setattr(pes_events_scanner, 'remove_leapp_related_events', lambda events: events)
+    monkeypatch.setattr(pes_events_scanner, 'apply_transaction_configuration', lambda pkgs: pkgs)
+    monkeypatch.setattr(pes_events_scanner, 'get_blacklisted_repoids', lambda: {'repo-c'})
+    monkeypatch.setattr(pes_events_scanner, 'replace_pesids_with_repoids_in_packages',
+                        lambda pkgs, src_pkgs_repoids: pkgs)
+    monkeypatch.setattr(pes_events_scanner, '_get_enabled_modules', lambda: [])
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='7.9', dst_ver='8.2'))
+    monkeypatch.setattr(reporting, 'create_report', create_report_mocked())
+
+    compute_target_pkgs = pes_events_scanner.compute_packages_on_target_system
+
+    produced_msgs = []
+    for use_event_index in (True, False):
+        monkeypatch.setattr(pes_events_scanner, 'compute_packages_on_target_system',
+                            partial(compute_target_pkgs, use_event_index=use_event_index))
+        monkeypatch.setattr(api, 'produce', produce_mocked())
+        pes_events_scanner.process()
+        produced_msgs.append([msg.dump() for msg in api.produce.model_instances])
+
+    assert produced_msgs[0] == produced_msgs[1]
@@ -1,3 +1,5 @@
+import os
+import sqlite3
 import warnings
 
 from leapp.exceptions import StopActorExecutionError
@@ -17,11 +19,38 @@ except ImportError:
 no_dnf = False
 no_dnf_warning_msg = "package `dnf` is unavailable"
 try:
-    import dnf
+    import dnf  # noqa: F401; pylint: disable=unused-import
 except ImportError:
     no_dnf = True
     warnings.warn(no_dnf_warning_msg, ImportWarning)
 
+no_rpm = False
+no_rpm_warning_msg = "package `rpm` (python bindings) is unavailable"
+try:
+    import rpm
+except ImportError:
+    no_rpm = True
+    warnings.warn(no_rpm_warning_msg, ImportWarning)
+
+YUMDB_PATH = '/var/lib/yum/yumdb'
+DNF_HISTORY_DB_PATH = '/var/lib/dnf/history.sqlite'
+
+# Repository reported by yum / dnf for installed packages without any information about their origin
+YUM_UNKNOWN_REPOSITORY = 'installed'
+DNF_UNKNOWN_REPOSITORY = 'System'
+
+# Query equivalent to the one used by libdnf (Swdb::getRPMRepo) to get the repository a package has been
+# installed from, but returning the repository of every package in the transaction history at once. Actions
+# 3, 5, 7, 10 (downgraded, obsoleted, upgraded, reinstalled) describe the removed side of a transaction.
+_DNF_HISTORY_REPOS_QUERY = """
+    SELECT rpm.name, rpm.epoch, rpm.version, rpm.release, rpm.arch, repo.repoid
+    FROM trans_item ti
+    JOIN rpm USING (item_id)
+    JOIN repo ON ti.repo_id == repo.id
+    WHERE ti.action NOT IN (3, 5, 7, 10)
+    ORDER BY ti.id ASC
+"""
+
 
 def _get_package_repository_data_yum():
     yum_base = yum.YumBase()
@@ -44,13 +73,12 @@ def _get_package_repository_data_yum():
 
 
 def _get_package_repository_data_dnf():
-    dnf_base = dnf.Base()
     pkg_repos = {}
 
     try:
         # NOTE: currently we do not initialize/load DNF plugins here as we are
         # working just with the local stuff (load_system_repo=True)
-        dnf_base.fill_sack(load_system_repo=True, load_available_repos=False)
+        dnf_base = module_lib.get_dnf_base(load_available_repos=False)
         for pkg in dnf_base.sack.query():
             pkg_repos[pkg.name] = pkg._from_repo.lstrip('@')
     except ValueError as e:
@@ -80,6 +108,106 @@ def get_package_repository_data():
     raise StopActorExecutionError(message=no_yum_warning_msg)
 
 
+def _format_header(hdr, queryformat):
+    # hdr.sprintf has been renamed to hdr.format in newer versions of rpm bindings
+    format_fn = getattr(hdr, 'format', None) or hdr.sprintf
+    result = format_fn(queryformat)
+    if not isinstance(result, str):
+        result = result.decode('utf-8')
+    return result
+
+
+def _get_yumdb_repositories():
+    """
+    Get a mapping of yumdb directory names (without the package ID prefix) to the repository files.
+
+    The yumdb directories are named <first letter of name>/<pkgid>-<name>-<version>-<release>-<arch>.
+    """
+    yumdb_repo_files = {}
+    for letter_dir in os.listdir(YUMDB_PATH):
+        letter_path = os.path.join(YUMDB_PATH, letter_dir)
+        if not os.path.isdir(letter_path):
+            continue
+        for pkg_dir in os.listdir(letter_path):
+            dummy_pkgid, sep, nvra = pkg_dir.partition('-')
+            if sep:
+                yumdb_repo_files[nvra] = os.path.join(letter_path, pkg_dir, 'from_repo')
+    return yumdb_repo_files
+
+
+def _read_yumdb_repository(repo_file):
+    try:
+        with open(repo_file) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _get_dnf_history_repositories():
+    """
+    Get a mapping of (name, epoch, version, release, arch) to the repository the package has been installed from.
+    """
+    history_repos = {}
+    connection = sqlite3.connect(DNF_HISTORY_DB_PATH)
+    try:
+        for name, epoch, version, release, arch, repoid in connection.execute(_DNF_HISTORY_REPOS_QUERY):
+            # Later transactions override the earlier ones
+            history_repos[(name, str(epoch or 0), version, release, arch)] = repoid
+    finally:
+        connection.close()
+    return history_repos
+
+
+def get_installed_rpms_from_rpmdb():
+    """
+    Get installed packages together with repositories they have been installed from in a single rpmdb pass.
+
+    The headers of installed packages are read using the rpm python bindings and formatted the same way
+    as :func:`rpms.get_installed_rpms` does. The repository is looked up in the yumdb on systems with yum
+    and in the DNF history database on systems with DNF, without the need to load the yum/dnf sack.
+    In case the repository information store is not available, get_package_repository_data is used.
+
+    :returns: A tuple (list of lines as returned by rpms.get_installed_rpms, dict mapping package names
+              to their repositories)
+    """
+    yumdb_repo_files = None
+    history_repos = None
+    unknown_repository = None
+    if not no_yum and os.path.isdir(YUMDB_PATH):
+        yumdb_repo_files = _get_yumdb_repositories()
+        unknown_repository = YUM_UNKNOWN_REPOSITORY
+    elif no_yum and not no_dnf and os.path.isfile(DNF_HISTORY_DB_PATH):
+        history_repos = _get_dnf_history_repositories()
+        unknown_repository = DNF_UNKNOWN_REPOSITORY
+
+    entries = []
+    pkg_repos = {}
+    ts = rpm.TransactionSet()
+    try:
+        for hdr in ts.dbMatch():
+            entry = _format_header(hdr, rpms.INSTALLED_RPMS_QUERYFORMAT)
+            entries.append(entry)
+            if unknown_repository is None:
+                continue
+
+            name, version, release, epoch, dummy_packager, arch, dummy_pgpsig = entry.strip().split('|')
+            repository = None
+            if yumdb_repo_files is not None:
+                repo_file = yumdb_repo_files.get('{}-{}-{}-{}'.format(name, version, release, arch))
+                repository = _read_yumdb_repository(repo_file) if repo_file else None
+            else:
+                repository = history_repos.get((name, epoch, version, release, arch))
+            pkg_repos[name] = repository or unknown_repository
+    finally:
+        ts.closeDB()
+
+    if unknown_repository is None:
+        api.current_logger().debug('Neither yumdb nor DNF history found, loading repository data using yum/dnf.')
+        pkg_repos = get_package_repository_data()
+
+    return entries, pkg_repos
+
+
 def map_modular_rpms_to_modules():
     """
     Map modular packages to the module streams they come from.
@@ -93,9 +221,9 @@ def map_modular_rpms_to_modules():
     # value: tuple of 2 strings representing a module and its stream
     rpm_streams = {}
     for module in modules:
-        for rpm in module.getArtifacts():
+        for artifact in module.getArtifacts():
             # we transform the NEVRA string into a tuple
-            name, epoch_version, release_arch = rpm.rsplit('-', 2)
+            name, epoch_version, release_arch = artifact.rsplit('-', 2)
             epoch, version = epoch_version.split(':', 1)
             release, arch = release_arch.rsplit('.', 1)
             rpm_key = (name, epoch, version, release, arch)
@@ -105,9 +233,25 @@ def map_modular_rpms_to_modules():
 
 
 # TODO(drehak) unit tests
+def get_installed_rpms():
+    """
+    Get installed packages and the repositories they have been installed from.
+
+    The rpmdb is read directly using the rpm python bindings when available. Otherwise, the installed packages
+    are queried using the rpm command and the repository data are loaded from the yum/dnf sack.
+    """
+    if not no_rpm:
+        try:
+            return get_installed_rpms_from_rpmdb()
+        except (rpm.error, sqlite3.Error, OSError, IOError, ValueError) as err:
+            api.current_logger().warning(
+                'Cannot read the rpmdb using rpm python bindings, falling back to the rpm command: {}'.format(err)
+            )
+    return rpms.get_installed_rpms(), get_package_repository_data()
+
+
 def process():
-    output = rpms.get_installed_rpms()
-    pkg_repos = get_package_repository_data()
+    output, pkg_repos = get_installed_rpms()
     rpm_streams = map_modular_rpms_to_modules()
 
     result = InstalledRPM()
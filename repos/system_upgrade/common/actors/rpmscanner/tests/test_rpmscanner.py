@@ -1,3 +1,4 @@
+import sqlite3
 import sys
 
 import pytest
@@ -153,6 +154,7 @@ PACKAGE_REPOS = {
 
 
 def test_process(monkeypatch):
+    monkeypatch.setattr(rpmscanner, 'no_rpm', True)
     monkeypatch.setattr(module_lib, 'get_modules', lambda: MODULES)
     monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: PACKAGE_REPOS)
     monkeypatch.setattr(rpms, 'get_installed_rpms', lambda: INSTALLED_RPMS)
@@ -192,3 +194,152 @@ def test_process(monkeypatch):
     assert items['passwd'].arch == 'x86_64'
     assert not items['passwd'].module
     assert not items['passwd'].stream
+
+
+class HeaderMocked(object):
+    def __init__(self, entry):
+        self.entry = entry
+
+    def format(self, queryformat):
+        assert queryformat == rpms.INSTALLED_RPMS_QUERYFORMAT
+        return self.entry + '\n'
+
+
+class RpmMocked(object):
+    error = RuntimeError
+
+    def __init__(self, entries=None, broken=False):
+        self.entries = INSTALLED_RPMS if entries is None else entries
+        self.broken = broken
+
+    def TransactionSet(self):
+        rpm_mocked = self
+
+        class TransactionSetMocked(object):
+            def dbMatch(self):
+                if rpm_mocked.broken:
+                    raise rpm_mocked.error('cannot open Packages database')
+                return iter([HeaderMocked(entry) for entry in rpm_mocked.entries])
+
+            def closeDB(self):
+                pass
+
+        return TransactionSetMocked()
+
+
+def _mock_rpmdb_backend(monkeypatch, rpm_mocked, use_yum):
+    monkeypatch.setattr(rpmscanner, 'rpm', rpm_mocked, raising=False)
+    monkeypatch.setattr(rpmscanner, 'no_rpm', False)
+    monkeypatch.setattr(rpmscanner, 'no_yum', not use_yum)
+    monkeypatch.setattr(rpmscanner, 'no_dnf', use_yum)
+    monkeypatch.setattr(rpms, 'get_installed_rpms', lambda: pytest.fail('rpm command should not be used'))
+    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: pytest.fail('sack should not be loaded'))
+
+
+def test_rpmdb_backend_yumdb(monkeypatch, tmpdir):
+    for pkgid, pkg_dir, repo in (('e2b7', 'afterburn-4.2.0-1.module_f31+6825+8330d585-x86_64', 'repo1'),
+                                 ('0a1f', 'subversion-1.10.6-1.module_f31+5204+aeb0fc0d-x86_64', 'repo2'),
+                                 ('93cd', 'tcpdump-4.9.2-1.fc31-x86_64', 'old-repo')):
+        pkg_yumdb = tmpdir.join(pkg_dir[0]).join('{}-{}'.format(pkgid, pkg_dir))
+        pkg_yumdb.ensure(dir=True)
+        pkg_yumdb.join('from_repo').write(repo)
+
+    _mock_rpmdb_backend(monkeypatch, RpmMocked(), use_yum=True)
+    monkeypatch.setattr(rpmscanner, 'YUMDB_PATH', str(tmpdir))
+
+    entries, pkg_repos = rpmscanner.get_installed_rpms()
+
+    assert [entry.strip() for entry in entries] == INSTALLED_RPMS
+    assert pkg_repos == {
+        'afterburn': 'repo1',
+        'subversion': 'repo2',
+        'tcpdump': rpmscanner.YUM_UNKNOWN_REPOSITORY,
+        'passwd': rpmscanner.YUM_UNKNOWN_REPOSITORY,
+    }
+
+
+def test_rpmdb_backend_dnf_history(monkeypatch, tmpdir):
+    history_db = str(tmpdir.join('history.sqlite'))
+    connection = sqlite3.connect(history_db)
+    connection.executescript("""
+        CREATE TABLE repo (id INTEGER PRIMARY KEY, repoid TEXT NOT NULL);
+        CREATE TABLE rpm (item_id INTEGER PRIMARY KEY, name TEXT NOT NULL, epoch INTEGER NOT NULL,
+                          version TEXT NOT NULL, release TEXT NOT NULL, arch TEXT NOT NULL);
+        CREATE TABLE trans_item (id INTEGER PRIMARY KEY, trans_id INTEGER, item_id INTEGER, repo_id INTEGER,
+                                 action INTEGER NOT NULL);
+        INSERT INTO repo VALUES (1, 'repo1'), (2, 'repo2'), (3, 'updates');
+        INSERT INTO rpm VALUES (1, 'afterburn', 0, '4.2.0', '1.module_f31+6825+8330d585', 'x86_64'),
+                               (2, 'tcpdump', 14, '4.9.3', '2.fc31', 'x86_64'),
+                               (3, 'tcpdump', 14, '4.9.2', '1.fc31', 'x86_64');
+        -- tcpdump installed from repo2, reinstalled from updates, then upgraded from repo2 to the current version
+        INSERT INTO trans_item VALUES (1, 1, 1, 1, 1), (2, 1, 3, 2, 1), (3, 2, 3, 3, 10), (4, 2, 3, 3, 9),
+                                      (5, 3, 2, 2, 6), (6, 3, 3, 3, 7);
+    """)
+    connection.commit()
+    connection.close()
+
+    _mock_rpmdb_backend(monkeypatch, RpmMocked(), use_yum=False)
+    monkeypatch.setattr(rpmscanner, 'DNF_HISTORY_DB_PATH', history_db)
+
+    entries, pkg_repos = rpmscanner.get_installed_rpms()
+
+    assert [entry.strip() for entry in entries] == INSTALLED_RPMS
+    assert pkg_repos == {
+        'afterburn': 'repo1',
+        'subversion': rpmscanner.DNF_UNKNOWN_REPOSITORY,
+        'tcpdump': 'repo2',
+        'passwd': rpmscanner.DNF_UNKNOWN_REPOSITORY,
+    }
+
+
+def test_rpmdb_backend_without_repository_store(monkeypatch, tmpdir):
+    _mock_rpmdb_backend(monkeypatch, RpmMocked(), use_yum=True)
+    monkeypatch.setattr(rpmscanner, 'YUMDB_PATH', str(tmpdir.join('missing')))
+    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: PACKAGE_REPOS)
+    monkeypatch.setattr(api, 'current_logger', testutils.logger_mocked())
+
+    entries, pkg_repos = rpmscanner.get_installed_rpms()
+
+    assert [entry.strip() for entry in entries] == INSTALLED_RPMS
+    assert pkg_repos == PACKAGE_REPOS
+
+
+def test_rpmdb_backend_fallback(monkeypatch):
+    monkeypatch.setattr(rpmscanner, 'rpm', RpmMocked(broken=True), raising=False)
+    monkeypatch.setattr(rpmscanner, 'no_rpm', False)
+    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: PACKAGE_REPOS)
+    monkeypatch.setattr(rpms, 'get_installed_rpms', lambda: INSTALLED_RPMS)
+    monkeypatch.setattr(api, 'current_logger', testutils.logger_mocked())
+
+    assert rpmscanner.get_installed_rpms() == (INSTALLED_RPMS, PACKAGE_REPOS)
+    assert api.current_logger.warnmsg
+
+
+def test_process_rpmdb_backend_same_output(monkeypatch, tmpdir):
+    monkeypatch.setattr(module_lib, 'get_modules', lambda: MODULES)
+
+    def produced_rpms():
+        monkeypatch.setattr(api, 'produce', testutils.produce_mocked())
+        rpmscanner.process()
+        return [pkg.dump() for pkg in api.produce.model_instances[0].items]
+
+    monkeypatch.setattr(rpmscanner, 'no_rpm', True)
+    monkeypatch.setattr(rpmscanner, 'get_package_repository_data', lambda: PACKAGE_REPOS)
+    monkeypatch.setattr(rpms, 'get_installed_rpms', lambda: INSTALLED_RPMS)
+    expected = produced_rpms()
+
+    _mock_rpmdb_backend(monkeypatch, RpmMocked(), use_yum=True)
+    monkeypatch.setattr(rpmscanner, 'YUMDB_PATH', str(tmpdir))
+    for pkg_name, repo in PACKAGE_REPOS.items():
+        entry = next(entry for entry in INSTALLED_RPMS if entry.startswith(pkg_name + '|'))
+        dummy_name, version, release, dummy_epoch, dummy_packager, arch, dummy_pgpsig = entry.split('|')
+        pkg_yumdb = tmpdir.join(pkg_name[0]).join('0123-{}-{}-{}-{}'.format(pkg_name, version, release, arch))
+        pkg_yumdb.ensure(dir=True)
+        pkg_yumdb.join('from_repo').write(repo)
+
+    actual = produced_rpms()
+    for pkg in expected:
+        if pkg['name'] not in PACKAGE_REPOS:
+            # The sack mock does not know about the package, yum reports it as installed from 'installed'
+            pkg['repository'] = rpmscanner.YUM_UNKNOWN_REPOSITORY
+    assert actual == expected
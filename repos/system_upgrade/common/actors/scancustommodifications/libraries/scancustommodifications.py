@@ -1,5 +1,12 @@
 import ast
+import grp
+import hashlib
+import json
 import os
+import pwd
+import stat
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 from leapp.exceptions import StopActorExecution
 from leapp.libraries.common import rpms
@@ -9,6 +16,35 @@ from leapp.models import CustomModifications
 LEAPP_REPO_DIRS = ['/usr/share/leapp-repository']
 LEAPP_PACKAGES_TO_IGNORE = ['snactor']
 
+# Digests of verified files with (size, mtime, inode) of the files kept between
+# leapp executions, so files that have not been changed are not hashed again
+DIGESTS_CACHE_PATH = '/var/lib/leapp/scancustommodifications_digests.json'
+HASHING_WORKERS = 4
+
+# Files in rpm headers with the metadata needed for their verification
+_RPM_FILES_QUERYFORMAT = (
+    r'[%{=NAME}\t%{=FILEDIGESTALGO}\t%{FILESTATES}\t%{FILEFLAGS}\t%{FILEVERIFYFLAGS}\t%{FILEMODES}\t'
+    r'%{FILESIZES}\t%{FILEUSERNAME}\t%{FILEGROUPNAME}\t%{FILELINKTOS}\t%{FILEDIGESTS}\t%{FILENAMES}\n]'
+)
+_RPM_FILE_FIELDS = ('package', 'algo', 'state', 'flags', 'verify', 'mode', 'size', 'user', 'group', 'linkto',
+                    'digest', 'path')
+_RpmFile = namedtuple('_RpmFile', _RPM_FILE_FIELDS)
+
+# Values of the FILEDIGESTALGO tag, rpm uses MD5 when it's not set
+_DIGEST_ALGOS = {'(none)': 'md5', '1': 'md5', '2': 'sha1', '8': 'sha256', '9': 'sha384', '10': 'sha512',
+                 '11': 'sha224'}
+# FILEFLAGS bits and the file attributes printed by rpm -V
+_RPMFILE_MISSINGOK = 1 << 3
+_RPMFILE_GHOST = 1 << 6
+_RPMFILE_ATTRIBUTES = ((1 << 0, 'c'), (1 << 1, 'd'), (1 << 6, 'g'), (1 << 7, 'l'), (1 << 8, 'r'))
+# FILEVERIFYFLAGS bits
+_RPMVERIFY_FILEDIGEST = 1 << 0
+_RPMVERIFY_FILESIZE = 1 << 1
+_RPMVERIFY_LINKTO = 1 << 2
+_RPMVERIFY_USER = 1 << 3
+_RPMVERIFY_GROUP = 1 << 4
+_RPMVERIFY_MODE = 1 << 6
+
 
 def _get_dirs_to_check(component):
     if component == 'repository':
@@ -87,6 +123,213 @@ def _run_command(cmd, warning_to_log, checked=True):
         raise StopActorExecution()
 
 
+def _get_rpm_files(packages):
+    """
+    Get files of the given installed packages from their rpm headers by one rpm call.
+
+    Returns a dict mapping names of installed packages to the list of _RpmFile
+    in the order printed by rpm -ql. None is returned when the output cannot be
+    used for the verification.
+    """
+    cmd = ['rpm', '-q', '--queryformat', _RPM_FILES_QUERYFORMAT] + list(packages)
+    try:
+        result = run(cmd, split=True, checked=False)
+    except OSError as err:
+        api.current_logger().warning('Could not query files of leapp packages: {}'.format(err))
+        return None
+    rpm_files = {}
+    for line in result['stdout']:
+        if line.startswith('package ') and line.endswith(' is not installed'):
+            continue
+        fields = line.split('\t', len(_RPM_FILE_FIELDS) - 1)
+        if len(fields) != len(_RPM_FILE_FIELDS) or fields[1] not in _DIGEST_ALGOS:
+            api.current_logger().debug('Unexpected rpm output, files cannot be verified directly: {}'.format(line))
+            return None
+        (name, algo, state, flags, verify, mode, size, user, group, linkto, digest, path) = fields
+        try:
+            rpm_file = _RpmFile(package=name, algo=_DIGEST_ALGOS[algo], state=int(state), flags=int(flags),
+                                verify=int(verify), mode=int(mode) & 0xffff, size=int(size), user=user, group=group,
+                                linkto=linkto, digest=digest, path=path)
+        except ValueError:
+            api.current_logger().debug('Unexpected rpm output, files cannot be verified directly: {}'.format(line))
+            return None
+        rpm_files.setdefault(name, []).append(rpm_file)
+    return rpm_files
+
+
+def _load_digests_cache():
+    try:
+        with open(DIGESTS_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _store_digests_cache(cache):
+    tmp_path = '{}.tmp'.format(DIGESTS_CACHE_PATH)
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.rename(tmp_path, DIGESTS_CACHE_PATH)
+    except (IOError, OSError) as err:
+        api.current_logger().debug('Could not store digests of leapp files: {}'.format(err))
+
+
+def _is_digest_supported(algo):
+    try:
+        hashlib.new(algo)
+    except ValueError:
+        # e.g. md5 is not available on FIPS enabled systems
+        return False
+    return True
+
+
+def _get_file_digest(path, algo):
+    digest = hashlib.new(algo)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_file_digests(rpm_files, stats, cache):
+    """
+    Compute digests of the given files, reusing digests from the cache.
+
+    Digests are computed in a thread pool. Files that cannot be read get None.
+    Returns the dict mapping paths to digests and updates the cache.
+    """
+    digests = {}
+    to_hash = []
+    for rpm_file in rpm_files:
+        st = stats[rpm_file.path]
+        key = [st.st_size, st.st_mtime, st.st_ino, rpm_file.algo]
+        cached = cache.get(rpm_file.path)
+        if cached and cached[:-1] == key:
+            digests[rpm_file.path] = cached[-1]
+        else:
+            to_hash.append((rpm_file, key))
+
+    def _hash(item):
+        rpm_file, key = item
+        try:
+            return rpm_file.path, key, _get_file_digest(rpm_file.path, rpm_file.algo)
+        except (IOError, OSError):
+            return rpm_file.path, key, None
+
+    if to_hash:
+        pool = ThreadPool(min(HASHING_WORKERS, len(to_hash)))
+        try:
+            results = pool.map(_hash, to_hash)
+        finally:
+            pool.close()
+            pool.join()
+        for path, key, digest in results:
+            digests[path] = digest
+            if digest is not None:
+                cache[path] = key + [digest]
+    return digests
+
+
+def _get_owner_name(getter, owner_id):
+    try:
+        return getter(owner_id)[0]
+    except KeyError:
+        return None
+
+
+def _verify_rpm_file(rpm_file, st, digest):
+    """
+    Return the verification flags of the file as printed by rpm -V --nomtime.
+
+    Devices and file capabilities are not verified.
+    """
+    if st is None:
+        return 'missing'
+    verify = rpm_file.verify
+    if stat.S_ISDIR(st.st_mode):
+        verify &= ~(_RPMVERIFY_FILEDIGEST | _RPMVERIFY_FILESIZE | _RPMVERIFY_LINKTO)
+    elif stat.S_ISLNK(st.st_mode):
+        verify &= ~(_RPMVERIFY_FILEDIGEST | _RPMVERIFY_FILESIZE | _RPMVERIFY_MODE)
+    else:
+        verify &= ~_RPMVERIFY_LINKTO
+    result = ['.'] * 9
+    if verify & _RPMVERIFY_FILESIZE and st.st_size != rpm_file.size:
+        result[0] = 'S'
+    if verify & _RPMVERIFY_MODE and st.st_mode != rpm_file.mode:
+        result[1] = 'M'
+    if verify & _RPMVERIFY_FILEDIGEST and rpm_file.digest:
+        if digest is None:
+            result[2] = '?'
+        elif digest != rpm_file.digest:
+            result[2] = '5'
+    if verify & _RPMVERIFY_LINKTO:
+        try:
+            if os.readlink(rpm_file.path) != rpm_file.linkto:
+                result[4] = 'L'
+        except OSError:
+            result[4] = '?'
+    if verify & _RPMVERIFY_USER and _get_owner_name(pwd.getpwuid, st.st_uid) != rpm_file.user:
+        result[5] = 'U'
+    if verify & _RPMVERIFY_GROUP and _get_owner_name(grp.getgrgid, st.st_gid) != rpm_file.group:
+        result[6] = 'G'
+    return ''.join(result)
+
+
+def _verify_rpm_files(rpm_files):
+    """
+    Verify files of packages like rpm -V --nomtime does, without executing rpm.
+
+    Digests of regular files are computed in a thread pool and reused between
+    leapp executions for files with unchanged size, mtime and inode. Python
+    bytecode files are skipped as they are not reported anyway. Ghost files and
+    files that have not been installed are skipped like rpm does.
+
+    Returns a dict mapping package names to the list of VerifiedFile (see the rpms
+    library) of changed files.
+    """
+    files = []
+    stats = {}
+    for rpm_file in (f for pkg_files in rpm_files.values() for f in pkg_files):
+        if rpm_file.path.endswith('.pyc') or rpm_file.state != 0 or rpm_file.flags & _RPMFILE_GHOST:
+            continue
+        try:
+            stats[rpm_file.path] = os.lstat(rpm_file.path)
+        except OSError:
+            if rpm_file.flags & _RPMFILE_MISSINGOK:
+                continue
+            stats[rpm_file.path] = None
+        files.append(rpm_file)
+
+    cache = _load_digests_cache()
+    to_hash = [
+        f for f in files
+        if f.verify & _RPMVERIFY_FILEDIGEST and f.digest and stats[f.path] is not None
+        and stat.S_ISREG(stats[f.path].st_mode)
+    ]
+    digests = _get_file_digests(to_hash, stats, cache)
+    # Drop just the outdated entries of the verified packages, the cache is shared
+    # with the other leapp components
+    pkg_paths = {f.path for pkg_files in rpm_files.values() for f in pkg_files}
+    _store_digests_cache({path: entry for path, entry in cache.items()
+                          if path not in pkg_paths or digests.get(path) is not None})
+
+    modifications = {pkg: [] for pkg in rpm_files}
+    for rpm_file in files:
+        flags = _verify_rpm_file(rpm_file, stats[rpm_file.path], digests.get(rpm_file.path))
+        if flags == '.' * 9:
+            continue
+        attribute = next((attr for bit, attr in _RPMFILE_ATTRIBUTES if rpm_file.flags & bit), ' ')
+        if flags == 'missing':
+            line = 'missing   {} {}'.format(attribute, rpm_file.path)
+        else:
+            line = '{}  {} {}'.format(flags, attribute, rpm_file.path)
+        modifications[rpm_file.package].append(
+            rpms.VerifiedFile(flags=flags, attribute=attribute.strip(), path=rpm_file.path, line=line))
+    return modifications
+
+
 def _modification_model(filename, change_type, component, rpm_checks_str=''):
     # XXX FIXME(ivasilev) Actively thinking if different model classes inheriting from CustomModifications
     # are needed or let's get away with one model for everything (as is implemented now).
@@ -100,14 +343,21 @@ def check_for_modifications(component):
     This will return a list of any untypical files or changes to shipped leapp files discovered on the system.
     An empty list means that no modifications have been found.
     """
-    rpms = _get_rpms_to_check(component)
+    leapp_rpms = _get_rpms_to_check(component)
     dirs = _get_dirs_to_check(component)
     source_of_truth = []
     leapp_files = []
     # Let's collect data about what should have been installed from rpm
-    for rpm in rpms:
-        res = _run_command(['rpm', '-ql', rpm], 'Could not get a list of installed files from rpm {}'.format(rpm))
-        source_of_truth.extend(res)
+    rpm_files = _get_rpm_files(leapp_rpms)
+    if rpm_files is None:
+        rpms_files = rpms.get_packages_files(leapp_rpms)
+    else:
+        rpms_files = {pkg: [f.path for f in pkg_files] for pkg, pkg_files in rpm_files.items()}
+    for rpm in leapp_rpms:
+        if rpm not in rpms_files:
+            api.current_logger().warning('Could not get a list of installed files from rpm {}'.format(rpm))
+            raise StopActorExecution()
+        source_of_truth.extend(rpms_files[rpm])
     # Let's collect data about what's really on the system
     for directory in dirs:
         res = _run_command(['find', directory, '-type', 'f'],
@@ -118,28 +368,35 @@ def check_for_modifications(component):
     # Now let's check for modifications
     modified_files = []
     modified_configs = []
-    for rpm in rpms:
-        res = _run_command(
-                ['rpm', '-V', '--nomtime', rpm], 'Could not check authenticity of the files from {}'.format(rpm),
-                # NOTE(ivasilev) check is False here as in case of any changes found exit code will be 1
-                checked=False)
+    if rpm_files is None:
+        rpms_modifications = rpms.verify_packages(leapp_rpms)
+    else:
+        # Packages with digests python cannot compute (md5 in FIPS mode) are verified by rpm itself
+        unsupported = sorted(pkg for pkg, pkg_files in rpm_files.items()
+                             if not all(_is_digest_supported(algo) for algo in {f.algo for f in pkg_files}))
+        rpms_modifications = _verify_rpm_files(
+            {pkg: pkg_files for pkg, pkg_files in rpm_files.items() if pkg not in unsupported})
+        if unsupported:
+            rpms_modifications.update(rpms.verify_packages(unsupported))
+    for rpm in leapp_rpms:
+        res = rpms_modifications.get(rpm)
         if res:
-            api.current_logger().warning('Modifications to leapp files detected!\n%s', res)
-            for modification_str in res:
-                modification = tuple(modification_str.split())
-                if len(modification) == 3 and modification[1] == 'c':
-                    # Dealing with a configuration that will be displayed as ('S.5......', 'c', '/file/path')
+            api.current_logger().warning('Modifications to leapp files detected!\n%s', [f.line for f in res])
+            for modification in res:
+                if modification.attribute == 'c':
+                    # Dealing with a configuration that will be displayed as 'S.5......  c /file/path'
                     modified_configs.append(modification)
                 else:
                     # Modification of any other rpm file detected
                     modified_files.append(modification)
-    return ([_modification_model(filename=f[1], component=component, rpm_checks_str=f[0], change_type='modified')
+    return ([_modification_model(filename=f.path, component=component, rpm_checks_str=f.flags, change_type='modified')
              # Let's filter out pyc files not to clutter the output as pyc will be present even in case of
              # a plain open & save-not-changed that we agreed not to react upon.
-             for f in modified_files if not f[1].endswith('.pyc')] +
+             for f in modified_files if not f.path.endswith('.pyc')] +
             [_modification_model(filename=f, component=component, change_type='custom')
              for f in custom_files] +
-            [_modification_model(filename=f[2], component='configuration', rpm_checks_str=f[0], change_type='modified')
+            [_modification_model(filename=f.path, component='configuration', rpm_checks_str=f.flags,
+                                 change_type='modified')
             for f in modified_configs])
 
 
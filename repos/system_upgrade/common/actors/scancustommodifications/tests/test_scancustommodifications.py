@@ -1,6 +1,13 @@
+import grp
+import hashlib
+import os
+import pwd
+import stat
+
 import pytest
 
 from leapp.libraries.actor import scancustommodifications
+from leapp.libraries.common import rpms
 from leapp.libraries.common.testutils import CurrentActorMocked, produce_mocked
 from leapp.libraries.stdlib import api
 
@@ -46,12 +53,11 @@ S.5....T.  c etc/leapp/files/pes-events.json
     ('repos/system_upgrade/common/libraries/dnfplugin.py', ''),
     ('repos/system_upgrade/common/libraries/testutils.py', ''),
     # the rest of false positives discovered by dkubek
-    ('repos/system_upgrade/common/actors/setuptargetrepos/libraries/setuptargetrepos_repomap.py', 'setuptargetrepos'),
+    ('repos/system_upgrade/common/actors/setuptargetrepos/libraries/setuptargetrepos.py', 'setuptargetrepos'),
     ('repos/system_upgrade/el8toel9/actors/sssdfacts/libraries/sssdfacts8to9.py', 'sssd_facts_8to9'),
     ('repos/system_upgrade/el8toel9/actors/nisscanner/libraries/nisscan.py', 'nis_scanner'),
-    ('repos/system_upgrade/common/actors/setuptargetrepos/libraries/setuptargetrepos_repomap.py', 'setuptargetrepos'),
     ('repos/system_upgrade/common/actors/repositoriesmapping/libraries/repositoriesmapping.py', 'repository_mapping'),
-    ('repos/system_upgrade/common/actors/peseventsscanner/libraries/peseventsscanner_repomap.py',
+    ('repos/system_upgrade/common/actors/peseventsscanner/libraries/pes_events_scanner.py',
      'pes_events_scanner')
 ])
 def test_deduce_actor_name_from_file(a_file, name):
@@ -59,21 +65,29 @@ def test_deduce_actor_name_from_file(a_file, name):
 
 
 def mocked__run_command(list_of_args, log_message, checked=True):
-    if list_of_args == ['rpm', '-ql', 'leapp-upgrade-el8toel9']:
-        # get source of truth
-        return FILES_FROM_RPM.strip().split('\n')
     if list_of_args and list_of_args[0] == 'find':
         # listing files in directory
         return FILES_ON_SYSTEM.strip().split('\n')
-    if list_of_args == ['rpm', '-V', '--nomtime', 'leapp-upgrade-el8toel9']:
-        # checking authenticity
-        return VERIFIED_FILES.strip().split('\n')
     return []
 
 
+def mocked_get_packages_files(packages):
+    # get source of truth
+    return {pkg: FILES_FROM_RPM.strip().split('\n') for pkg in packages if pkg == 'leapp-upgrade-el8toel9'}
+
+
+def mocked_verify_packages(packages):
+    # checking authenticity
+    verified = [rpms._parse_verify_line(line) for line in VERIFIED_FILES.strip().split('\n')]
+    return {pkg: verified for pkg in packages if pkg == 'leapp-upgrade-el8toel9'}
+
+
 def test_check_for_modifications(monkeypatch):
     monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.9', dst_ver='9.3'))
     monkeypatch.setattr(scancustommodifications, '_run_command', mocked__run_command)
+    monkeypatch.setattr(scancustommodifications, '_get_rpm_files', lambda packages: None)
+    monkeypatch.setattr(rpms, 'get_packages_files', mocked_get_packages_files)
+    monkeypatch.setattr(rpms, 'verify_packages', mocked_verify_packages)
     modifications = scancustommodifications.check_for_modifications('repository')
     modified = [m for m in modifications if m.type == 'modified']
     custom = [m for m in modifications if m.type == 'custom']
@@ -87,3 +101,141 @@ def test_check_for_modifications(monkeypatch):
     assert len(configurations) == 1
     assert configurations[0].filename == 'etc/leapp/files/pes-events.json'
     assert configurations[0].rpm_checks_str == 'S.5....T.'
+
+
+def _rpm_file(path, content=None, **kwargs):
+    st = os.lstat(path) if os.path.lexists(path) else None
+    attributes = {
+        'package': 'leapp-upgrade-el8toel9',
+        'algo': 'sha256',
+        'state': 0,
+        'flags': 0,
+        'verify': -1,
+        'mode': st.st_mode if st else stat.S_IFREG | 0o644,
+        'size': len(content) if content is not None else 0,
+        'user': pwd.getpwuid(os.getuid())[0],
+        'group': grp.getgrgid(os.getgid())[0],
+        'linkto': '',
+        'digest': hashlib.sha256(content).hexdigest() if content is not None else '',
+        'path': path,
+    }
+    attributes.update(kwargs)
+    return scancustommodifications._RpmFile(**attributes)
+
+
+def test_verify_rpm_files(monkeypatch, tmpdir):
+    monkeypatch.setattr(scancustommodifications, 'DIGESTS_CACHE_PATH', str(tmpdir.join('digests.json')))
+    files_dir = tmpdir.mkdir('files')
+    for name in ('unchanged.py', 'changed.py', 'config.json', 'actor.pyc'):
+        files_dir.join(name).write_binary(b'original')
+    files_dir.join('changed.py').write_binary(b'changed content')
+    files_dir.join('config.json').chmod(0o600)
+    os.symlink('changed.py', str(files_dir.join('link')))
+
+    rpm_files = [
+        _rpm_file(str(files_dir.join('unchanged.py')), b'original'),
+        _rpm_file(str(files_dir.join('changed.py')), b'original'),
+        _rpm_file(str(files_dir.join('config.json')), b'original', flags=1, mode=stat.S_IFREG | 0o644),
+        _rpm_file(str(files_dir.join('actor.pyc')), b'different'),
+        _rpm_file(str(files_dir.join('missing.py')), b'original'),
+        _rpm_file(str(files_dir.join('ghost.log')), flags=1 << 6),
+        _rpm_file(str(files_dir.join('link')), linkto='unchanged.py'),
+        _rpm_file(str(files_dir)),
+    ]
+
+    modifications = scancustommodifications._verify_rpm_files({'leapp-upgrade-el8toel9': rpm_files})
+
+    assert [f.line for f in modifications['leapp-upgrade-el8toel9']] == [
+        'S.5......    {}'.format(files_dir.join('changed.py')),
+        '.M.......  c {}'.format(files_dir.join('config.json')),
+        'missing     {}'.format(files_dir.join('missing.py')),
+        '....L....    {}'.format(files_dir.join('link')),
+    ]
+
+
+def test_verify_rpm_files_reuses_digests(monkeypatch, tmpdir):
+    monkeypatch.setattr(scancustommodifications, 'DIGESTS_CACHE_PATH', str(tmpdir.join('digests.json')))
+    hashed = []
+
+    def get_file_digest_mocked(path, algo):
+        hashed.append(path)
+        return hashlib.new(algo, open(path, 'rb').read()).hexdigest()
+
+    monkeypatch.setattr(scancustommodifications, '_get_file_digest', get_file_digest_mocked)
+    paths = [str(tmpdir.join('file{}.py'.format(i))) for i in range(20)]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(b'content')
+    rpm_files = {'leapp-upgrade-el8toel9': [_rpm_file(path, b'content') for path in paths]}
+
+    assert not scancustommodifications._verify_rpm_files(rpm_files)['leapp-upgrade-el8toel9']
+    assert sorted(hashed) == sorted(paths)
+
+    # just the changed file is hashed again
+    with open(paths[0], 'wb') as f:
+        f.write(b'changed')
+    del hashed[:]
+    modifications = scancustommodifications._verify_rpm_files(rpm_files)['leapp-upgrade-el8toel9']
+    assert hashed == [paths[0]]
+    assert [f.flags for f in modifications] == ['..5......']
+
+
+def test_check_for_modifications_unsupported_digest(monkeypatch, tmpdir):
+    monkeypatch.setattr(scancustommodifications, 'DIGESTS_CACHE_PATH', str(tmpdir.join('digests.json')))
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.9', dst_ver='9.3'))
+    packages = ['leapp-upgrade-el8toel9', 'leapp']
+    monkeypatch.setattr(scancustommodifications, '_get_rpms_to_check', lambda component: packages)
+    monkeypatch.setattr(scancustommodifications, '_get_dirs_to_check', lambda component: [])
+    # md5 cannot be used on FIPS enabled systems
+    monkeypatch.setattr(scancustommodifications, '_is_digest_supported', lambda algo: algo != 'md5')
+    verified = []
+
+    def verify_packages_mocked(packages):
+        verified.extend(packages)
+        return mocked_verify_packages(packages)
+
+    monkeypatch.setattr(rpms, 'verify_packages', verify_packages_mocked)
+    leapp_file = tmpdir.join('leapp.py')
+    leapp_file.write_binary(b'original')
+    rpm_files = {
+        'leapp-upgrade-el8toel9': [_rpm_file(str(tmpdir.join('missing.py')), b'original', algo='md5')],
+        'leapp': [_rpm_file(str(leapp_file), b'changed', package='leapp')],
+    }
+    monkeypatch.setattr(scancustommodifications, '_get_rpm_files', lambda packages: rpm_files)
+
+    modifications = scancustommodifications.check_for_modifications('framework')
+
+    assert verified == ['leapp-upgrade-el8toel9']
+    modified = sorted(m.filename for m in modifications if m.type == 'modified')
+    assert str(leapp_file) in modified
+    assert str(tmpdir.join('missing.py')) not in modified
+    assert 'repos/system_upgrade/el8toel9/actors/xorgdrvfact/libraries/xorgdriverlib.py' in modified
+
+
+def test_scan_reuses_digests_of_all_components(monkeypatch, tmpdir):
+    monkeypatch.setattr(scancustommodifications, 'DIGESTS_CACHE_PATH', str(tmpdir.join('digests.json')))
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.9', dst_ver='9.3'))
+    packages = {'framework': ['leapp'], 'repository': ['leapp-upgrade-el8toel9']}
+    monkeypatch.setattr(scancustommodifications, '_get_rpms_to_check', lambda component: packages[component])
+    monkeypatch.setattr(scancustommodifications, '_get_dirs_to_check', lambda component: [])
+    rpm_files = {}
+    for pkg in ('leapp', 'leapp-upgrade-el8toel9'):
+        path = str(tmpdir.join('{}.py'.format(pkg)))
+        with open(path, 'wb') as f:
+            f.write(b'content')
+        rpm_files[pkg] = [_rpm_file(path, b'content', package=pkg)]
+    monkeypatch.setattr(scancustommodifications, '_get_rpm_files',
+                        lambda packages: {pkg: rpm_files[pkg] for pkg in packages})
+    hashed = []
+
+    def get_file_digest_mocked(path, algo):
+        hashed.append(path)
+        return hashlib.new(algo, open(path, 'rb').read()).hexdigest()
+
+    monkeypatch.setattr(scancustommodifications, '_get_file_digest', get_file_digest_mocked)
+
+    assert not scancustommodifications.scan()
+    assert len(hashed) == 2
+    del hashed[:]
+    assert not scancustommodifications.scan()
+    assert not hashed
@@ -1,8 +1,8 @@
 import glob
 import os
 
-from leapp.libraries.common.rpms import has_package
-from leapp.libraries.stdlib import api, CalledProcessError, run
+from leapp.libraries.common.rpms import get_files_owners, has_package, verify_files
+from leapp.libraries.stdlib import api
 from leapp.models import DistributionSignedRPM, DynamicLinkerConfiguration, LDConfigFile, MainLDConfigFile
 
 LD_SO_CONF_DIR = '/etc/ld.so.conf.d'
@@ -20,12 +20,11 @@ def _read_file(file_path):
 
 def _is_modified(config_path):
     """ Decide if the configuration file was modified based on the package it belongs to. """
-    result = run(['rpm', '-Vf', config_path], checked=False)
-    if not result['exit_code']:
+    verified = verify_files([config_path]).get(config_path)
+    if not verified:
         return False
-    modification_flags = result['stdout'].split(' ', 1)[0]
     # The file is considered modified only when the checksum does not match
-    return '5' in modification_flags
+    return '5' in verified.flags
 
 
 def _is_included_config_custom(config_path):
@@ -43,14 +42,12 @@ def _is_included_config_custom(config_path):
     if not has_effective_line:
         return False
 
-    is_custom = False
-    try:
-        package_name = run(['rpm', '-qf', '--queryformat', '%{NAME}', config_path])['stdout']
-        is_custom = not has_package(DistributionSignedRPM, package_name) or _is_modified(config_path)
-    except CalledProcessError:
-        is_custom = True
-
-    return is_custom
+    package_names = get_files_owners([config_path]).get(config_path)
+    if not package_names:
+        # not owned by any package
+        return True
+    is_signed = any(has_package(DistributionSignedRPM, package_name) for package_name in package_names)
+    return not is_signed or _is_modified(config_path)
 
 
 def _parse_main_config():
@@ -100,6 +97,8 @@ def scan_dynamic_linker_configuration():
         for cfg in glob.glob(cfg_glob):
             config_paths.add(cfg)
 
+    # Resolve owners of all configs and verify them at once, results are cached
+    verify_files(config_paths)
     included_config_files = []
     for config_path in config_paths:
         config_file = LDConfigFile(path=config_path, modified=_is_included_config_custom(config_path))
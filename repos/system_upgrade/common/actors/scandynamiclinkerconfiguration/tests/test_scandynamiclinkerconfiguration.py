@@ -5,8 +5,9 @@ import pytest
 
 from leapp import reporting
 from leapp.libraries.actor import scandynamiclinkerconfiguration
+from leapp.libraries.common.rpms import VerifiedFile
 from leapp.libraries.common.testutils import produce_mocked
-from leapp.libraries.stdlib import api, CalledProcessError
+from leapp.libraries.stdlib import api
 from leapp.models import DistributionSignedRPM
 
 INCLUDED_CONFIGS_GLOB_DICT_1 = {'/etc/ld.so.conf.d/*.conf': ['/etc/ld.so.conf.d/dyninst-x86_64.conf',
@@ -47,6 +48,7 @@ def test_scan_dynamic_linker_configuration(monkeypatch, included_configs_glob_di
     monkeypatch.setattr(glob, 'glob', lambda glob: included_configs_glob_dict[glob])
     monkeypatch.setattr(scandynamiclinkerconfiguration, '_is_included_config_custom',
                         lambda config: config in custom_configs)
+    monkeypatch.setattr(scandynamiclinkerconfiguration, 'verify_files', lambda paths: {})
     monkeypatch.setattr(api, 'produce', produce_mocked())
 
     for var in used_variables:
@@ -107,7 +109,7 @@ def test_parse_main_config(monkeypatch, config_contents, included_config_paths,
     assert _other_lines == other_lines
 
 
-@pytest.mark.parametrize(('config_path', 'run_result', 'is_modified'),
+@pytest.mark.parametrize(('config_path', 'verify_line', 'is_modified'),
                          [
                             ('/etc/ld.so.conf.d/dyninst-x86_64.conf',
                              '.......T.  c /etc/ld.so.conf.d/dyninst-x86_64.conf', False),
@@ -116,21 +118,22 @@ def test_parse_main_config(monkeypatch, config_contents, included_config_paths,
                             ('/etc/ld.so.conf.d/kernel-3.10.0-1160.el7.x86_64.conf',
                              '', False)
                          ])
-def test_is_modified(monkeypatch, config_path, run_result, is_modified):
-    def mocked_run(command, checked):
-        assert config_path in command
-        assert checked is False
-        exit_code = 1 if run_result else 0
-        return {'stdout': run_result, 'exit_code': exit_code}
+def test_is_modified(monkeypatch, config_path, verify_line, is_modified):
+    def mocked_verify_files(paths):
+        assert paths == [config_path]
+        if not verify_line:
+            return {}
+        flags = verify_line.split()[0]
+        return {config_path: VerifiedFile(flags=flags, attribute='c', path=config_path, line=verify_line)}
 
-    monkeypatch.setattr(scandynamiclinkerconfiguration, 'run', mocked_run)
+    monkeypatch.setattr(scandynamiclinkerconfiguration, 'verify_files', mocked_verify_files)
 
     _is_modified = scandynamiclinkerconfiguration._is_modified(config_path)
     assert _is_modified == is_modified
 
 
 @pytest.mark.parametrize(('config_path',
-                          'config_contents', 'run_result',
+                          'config_contents', 'package_name',
                           'is_installed_rh_signed_package', 'is_modified', 'has_effective_lines'),
                          [
                             ('/etc/ld.so.conf.d/dyninst-x86_64.conf',
@@ -146,36 +149,34 @@ def test_is_modified(monkeypatch, config_path, run_result, is_modified):
                              ['#/usr/lib64/custom\n'], 'custom',
                              False, None, False),  # Third-party package without effective lines - Not custom
                             ('/etc/ld.so.conf.d/somelib.conf',
-                             ['/usr/lib64/somelib\n'], CalledProcessError,
+                             ['/usr/lib64/somelib\n'], None,
                              None, None, True),  # User created configuration file - Custom
                             ('/etc/ld.so.conf.d/somelib.conf',
-                             ['#/usr/lib64/somelib\n'], CalledProcessError,
+                             ['#/usr/lib64/somelib\n'], None,
                              None, None, False)  # User created configuration file without effective lines - Not custom
                          ])
-def test_is_included_config_custom(monkeypatch, config_path, config_contents, run_result,
+def test_is_included_config_custom(monkeypatch, config_path, config_contents, package_name,
                                    is_installed_rh_signed_package, is_modified, has_effective_lines):
-    def mocked_run(command):
-        assert config_path in command
-        if run_result and not isinstance(run_result, str):
-            raise CalledProcessError("message", command, "result")
-        return {'stdout': run_result}
+    def mocked_get_files_owners(paths):
+        assert paths == [config_path]
+        return {config_path: [package_name]} if package_name else {}
 
-    def mocked_has_package(model, package_name):
+    def mocked_has_package(model, name):
         assert model is DistributionSignedRPM
-        assert package_name == run_result
+        assert name == package_name
         return is_installed_rh_signed_package
 
     def mocked_read_file(path):
         assert path == config_path
         return config_contents
 
-    monkeypatch.setattr(scandynamiclinkerconfiguration, 'run', mocked_run)
+    monkeypatch.setattr(scandynamiclinkerconfiguration, 'get_files_owners', mocked_get_files_owners)
     monkeypatch.setattr(scandynamiclinkerconfiguration, 'has_package', mocked_has_package)
     monkeypatch.setattr(scandynamiclinkerconfiguration, '_read_file', mocked_read_file)
     monkeypatch.setattr(scandynamiclinkerconfiguration, '_is_modified', lambda *_: is_modified)
     monkeypatch.setattr(os.path, 'isfile', lambda _: True)
 
     result = scandynamiclinkerconfiguration._is_included_config_custom(config_path)
-    is_custom = not isinstance(run_result, str) or not is_installed_rh_signed_package or is_modified
+    is_custom = not package_name or not is_installed_rh_signed_package or is_modified
     is_custom &= has_effective_lines
     assert result == is_custom
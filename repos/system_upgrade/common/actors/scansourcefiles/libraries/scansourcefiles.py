@@ -1,7 +1,8 @@
 import os
 
+from leapp.libraries.common import rpms
 from leapp.libraries.common.config.version import get_source_major_version
-from leapp.libraries.stdlib import api, CalledProcessError, run
+from leapp.libraries.stdlib import api
 from leapp.models import FileInfo, TrackedFilesInfoSource
 
 # TODO(pstodulk): make linter happy about this
@@ -25,9 +26,8 @@ TRACKED_FILES = {
 
 
 def _get_rpm_name(input_file):
-    try:
-        rpm_names = run(['rpm', '-qf', '--queryformat', r'%{NAME}\n', input_file], split=True)['stdout']
-    except CalledProcessError:
+    rpm_names = rpms.get_files_owners([input_file]).get(input_file)
+    if not rpm_names:
         # is not owned by any rpm
         return ''
 
@@ -48,11 +48,10 @@ def is_modified(input_file):
 
     Ignores mode, user, type, ...
     """
-    result = run(['rpm', '-Vf', '--nomtime', input_file], checked=False)
-    if not result['exit_code']:
+    verified = rpms.verify_files([input_file]).get(input_file)
+    if not verified:
         return False
-    status = result['stdout'].split()[0]
-    return status == 'missing' or '5' in status
+    return verified.flags == 'missing' or '5' in verified.flags
 
 
 def scan_file(input_file):
@@ -72,6 +71,9 @@ def scan_file(input_file):
 
 
 def scan_files(files):
+    # resolve owners and verify all files at once, results are cached
+    # for the checks of particular files
+    rpms.verify_files(files)
     return [scan_file(fname) for fname in files]
 
 
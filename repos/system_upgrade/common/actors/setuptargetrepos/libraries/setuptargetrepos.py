@@ -1,5 +1,5 @@
 
-from leapp.libraries.actor import setuptargetrepos_repomap
+from leapp.libraries.common import repomaputils
 from leapp.libraries.common.config.version import get_source_major_version
 from leapp.libraries.stdlib import api
 from leapp.models import (
@@ -89,7 +89,7 @@ def process():
     rhui_info = next(api.consume(RHUIInfo), None)
     cloud_provider = rhui_info.provider if rhui_info else ''
 
-    repomap = setuptargetrepos_repomap.RepoMapDataHandler(repo_mappig_msg, cloud_provider=cloud_provider)
+    repomap = repomaputils.RepoMapDataHandler(repo_mappig_msg, cloud_provider=cloud_provider)
 
     # Filter set of repoids from installed packages so that it contains only repoids with mapping
     repoids_from_installed_packages_with_mapping = _get_mapped_repoids(repomap, repoids_from_installed_packages)
@@ -101,7 +101,7 @@ def process():
 
     # Set default repository channels for the repomap
     # TODO(pstodulk): what about skip this completely and keep the default 'ga'..?
-    default_channels = setuptargetrepos_repomap.get_default_repository_channels(repomap, repoids_to_map)
+    default_channels = repomaputils.get_default_repository_channels(repomap, repoids_to_map)
     repomap.set_default_channels(default_channels)
 
     # Get target RHEL repoids based on the repomap
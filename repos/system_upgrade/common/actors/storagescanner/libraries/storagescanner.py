@@ -1,10 +1,14 @@
 import functools
 import os
 import subprocess
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 import pyudev
 
 from leapp import reporting
+from leapp.libraries.common.config import get_env
 from leapp.libraries.stdlib import api
 from leapp.models import (
     FstabEntry,
@@ -18,6 +22,9 @@ from leapp.models import (
     VgsEntry
 )
 
+# Commands running longer are killed and their output is ignored
+DEFAULT_CMD_TIMEOUT = 600
+
 
 def aslist(f):
     """ Decorator used to convert generator to list """
@@ -32,20 +39,44 @@ def _is_file_readable(path):
     return os.path.isfile(path) and os.access(path, os.R_OK)
 
 
+def _get_cmd_timeout():
+    try:
+        return int(get_env('LEAPP_STORAGE_CMD_TIMEOUT', str(DEFAULT_CMD_TIMEOUT)))
+    except ValueError:
+        api.current_logger().warning('Invalid value of LEAPP_STORAGE_CMD_TIMEOUT, using the default timeout.')
+        return DEFAULT_CMD_TIMEOUT
+
+
 def _get_cmd_output(cmd, delim, expected_len):
     """ Verify if command exists and return output """
     if not any(os.access(os.path.join(path, cmd[0]), os.X_OK) for path in os.environ['PATH'].split(os.pathsep)):
         api.current_logger().warning("'%s': command not found" % cmd[0])
         return
 
+    # FIXME: Will keep call to subprocess until our stdlib supports "env" parameter
+    # when there is any fd except 0,1,2 open, lvm closes the fd and prints a warning.
+    # In our case /dev/urandom has other fd opened, probably for caching purposes.
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            env={'LVM_SUPPRESS_FD_WARNINGS': '1', 'PATH': os.environ['PATH']})
+    timeout = _get_cmd_timeout()
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _kill)
+    timer.start()
     try:
-        # FIXME: Will keep call to subprocess until our stdlib supports "env" parameter
-        # when there is any fd except 0,1,2 open, lvm closes the fd and prints a warning.
-        # In our case /dev/urandom has other fd opened, probably for caching purposes.
-        output = subprocess.check_output(cmd, env={'LVM_SUPPRESS_FD_WARNINGS': '1', 'PATH': os.environ['PATH']})
+        output, _ = proc.communicate()
+    finally:
+        timer.cancel()
 
-    except subprocess.CalledProcessError as e:
-        api.current_logger().debug("Command '%s' return non-zero exit status: %s" % (" ".join(cmd), e.returncode))
+    if timed_out.is_set():
+        api.current_logger().warning("Command '%s' has been killed after %s seconds" % (" ".join(cmd), timeout))
+        return
+    if proc.returncode:
+        api.current_logger().debug("Command '%s' return non-zero exit status: %s" % (" ".join(cmd), proc.returncode))
         return
 
     if bytes is not str:
@@ -261,14 +292,42 @@ def _get_systemd_mount_info():
         )
 
 
+def _run_probe(name, probe, *args):
+    """ Run the probe and log how long it took """
+    start = time.time()
+    try:
+        return probe(*args)
+    finally:
+        api.current_logger().debug('Storage probe %s finished in %.2f seconds', name, time.time() - start)
+
+
 def get_storage_info():
-    """ Collect multiple info about storage and return it """
-    return StorageInfo(
-        partitions=_get_partitions_info('/proc/partitions'),
-        fstab=_get_fstab_info('/etc/fstab'),
-        mount=_get_mount_info('/proc/mounts'),
-        lsblk=_get_lsblk_info(),
-        pvs=_get_pvs_info(),
-        vgs=_get_vgs_info(),
-        lvdisplay=_get_lvdisplay_info(),
-        systemdmount=_get_systemd_mount_info())
+    """
+    Collect multiple info about storage and return it
+
+    Probes running external commands and querying udev are independent and
+    can take long on systems with many devices (e.g. LVM commands on hosts with
+    many multipath LUNs), so they run concurrently. Files are parsed in the main
+    thread meanwhile, as an invalid fstab is reported.
+    """
+    probes = (
+        ('lsblk', _get_lsblk_info),
+        ('pvs', _get_pvs_info),
+        ('vgs', _get_vgs_info),
+        ('lvdisplay', _get_lvdisplay_info),
+        ('systemdmount', _get_systemd_mount_info),
+    )
+    pool = ThreadPool(len(probes))
+    try:
+        results = [(name, pool.apply_async(_run_probe, (name, probe))) for name, probe in probes]
+        info = {
+            'partitions': _run_probe('partitions', _get_partitions_info, '/proc/partitions'),
+            'fstab': _run_probe('fstab', _get_fstab_info, '/etc/fstab'),
+            'mount': _run_probe('mount', _get_mount_info, '/proc/mounts'),
+        }
+        for name, result in results:
+            info[name] = result.get()
+    finally:
+        pool.close()
+        pool.join()
+    return StorageInfo(**info)
@@ -1,11 +1,12 @@
 import functools
 import os
+import time
 
 import pyudev
 
 from leapp import reporting
 from leapp.libraries.actor import storagescanner
-from leapp.libraries.common.testutils import create_report_mocked, logger_mocked
+from leapp.libraries.common.testutils import create_report_mocked, CurrentActorMocked, logger_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import (
     FstabEntry,
@@ -498,3 +499,50 @@ def test_get_systemd_mount_info(monkeypatch):
             label='n/a',
             uuid='c3890bf3-9273-4877-ad1f-68144e1eb858')]
     assert expected == storagescanner._get_systemd_mount_info()
+
+
+FAKE_COMMANDS = {
+    'lsblk': (0, 'echo "/dev/vda 252:0 0 42949672960 0 disk "'),
+    'pvs': (1, 'echo "  /dev/vda2:rhel:lvm2:a--:<39.00g:4.00m"'),
+    'vgs': (1, 'echo "  rhel:1:2:0:wz--n-:<39.00g:4.00m"'),
+    'lvdisplay': (10, 'echo "  root:rhel:-wi-ao----:<35.00g:::::::::"'),
+}
+
+
+def _create_fake_commands(bin_dir):
+    for name, (delay, output) in FAKE_COMMANDS.items():
+        path = bin_dir.join(name)
+        if name == 'lsblk':
+            script = '#!/bin/sh\nif [ "$1" = "-nr" ]; then echo "vda vda 40G"; else {}; fi\n'.format(output)
+        else:
+            # exec, so the timeout kills the process writing the output
+            script = '#!/bin/sh\n{}\nexec sleep {}\n'.format(output, delay)
+        path.write(script)
+        path.chmod(0o755)
+
+
+def test_get_storage_info_slow_probes(monkeypatch, tmpdir):
+    """ Probes run concurrently with fake commands, the hanging lvdisplay is killed """
+    _create_fake_commands(tmpdir)
+    monkeypatch.setenv('PATH', '{}{}{}'.format(tmpdir, os.pathsep, os.environ['PATH']))
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_STORAGE_CMD_TIMEOUT': '2'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(storagescanner, '_get_partitions_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, '_get_fstab_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, '_get_mount_info', lambda path: [])
+    monkeypatch.setattr(storagescanner, '_get_systemd_mount_info', lambda: [])
+
+    start = time.time()
+    info = storagescanner.get_storage_info()
+    duration = time.time() - start
+
+    # pvs and vgs (1s each) run in parallel with lvdisplay that is killed after 2s
+    assert duration < 4
+    assert [entry.kname for entry in info.lsblk] == ['vda']
+    assert [entry.pv for entry in info.pvs] == ['/dev/vda2']
+    assert [entry.vg for entry in info.vgs] == ['rhel']
+    assert not info.lvdisplay
+    assert any('lvdisplay' in msg for msg in api.current_logger.warnmsg)
+    dbgmsg = api.current_logger.dbgmsg
+    probes = {dbgmsg[i + 1] for i, msg in enumerate(dbgmsg) if msg == 'Storage probe %s finished in %.2f seconds'}
+    assert probes == {'partitions', 'fstab', 'mount', 'lsblk', 'pvs', 'vgs', 'lvdisplay', 'systemdmount'}
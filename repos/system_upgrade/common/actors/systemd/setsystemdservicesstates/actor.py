@@ -7,6 +7,10 @@ from leapp.tags import FinalizationPhaseTag, IPUWorkflowTag
 class SetSystemdServicesState(Actor):
     """
     According to input messages sets systemd services states on the target system
+
+    Services are enabled and disabled in batches. When LEAPP_SYSTEMD_OFFLINE_UNITS=1
+    is set, the symlinks of the services are created and removed directly instead
+    of calling systemctl where possible.
     """
 
     name = 'set_systemd_services_state'
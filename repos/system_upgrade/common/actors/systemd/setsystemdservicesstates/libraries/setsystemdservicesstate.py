@@ -1,5 +1,6 @@
 from leapp.libraries.common import systemd
-from leapp.libraries.stdlib import api, CalledProcessError
+from leapp.libraries.common.config import get_env
+from leapp.libraries.stdlib import api
 from leapp.models import SystemdServicesTasks
 
 
@@ -15,16 +16,9 @@ def process():
         msg = 'Attempted to both enable and disable systemd service "{}", service will be disabled.'.format(service)
         api.current_logger().error(msg)
 
-    for service in services_to_enable:
-        try:
-            systemd.enable_unit(service)
-        except CalledProcessError:
-            # TODO(mmatuska) produce post-upgrade report
-            pass
+    # create the symlinks of units directly instead of calling systemctl
+    offline = get_env('LEAPP_SYSTEMD_OFFLINE_UNITS', '0') == '1'
 
-    for service in services_to_disable:
-        try:
-            systemd.disable_unit(service)
-        except CalledProcessError:
-            # TODO(mmatuska) produce post-upgrade report
-            pass
+    # TODO(mmatuska) produce post-upgrade report for units which failed to be enabled/disabled
+    systemd.enable_units(sorted(services_to_enable), offline=offline)
+    systemd.disable_units(sorted(services_to_disable), offline=offline)
@@ -11,10 +11,12 @@ from leapp.models import SystemdServicesTasks
 class MockedSystemdCmd(object):
     def __init__(self):
         self.units = []
+        self.offline = None
 
-    def __call__(self, unit, *args, **kwargs):
-        self.units.append(unit)
-        return {}
+    def __call__(self, units, offline=False):
+        self.units.extend(units)
+        self.offline = offline
+        return []
 
 
 @pytest.mark.parametrize(
@@ -45,10 +47,10 @@ class MockedSystemdCmd(object):
 )
 def test_process(monkeypatch, msgs, expect_enable_units, expect_disable_units):
     mocked_enable = MockedSystemdCmd()
-    monkeypatch.setattr(systemd, 'enable_unit', mocked_enable)
+    monkeypatch.setattr(systemd, 'enable_units', mocked_enable)
 
     mocked_disable = MockedSystemdCmd()
-    monkeypatch.setattr(systemd, 'disable_unit', mocked_disable)
+    monkeypatch.setattr(systemd, 'disable_units', mocked_disable)
 
     monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=msgs))
 
@@ -58,6 +60,26 @@ def test_process(monkeypatch, msgs, expect_enable_units, expect_disable_units):
     assert mocked_disable.units == expect_disable_units
 
 
+def test_process_batched_offline(monkeypatch):
+    msgs = [
+        SystemdServicesTasks(to_enable=['b.service', 'a.service'], to_disable=['c.service']),
+        SystemdServicesTasks(to_enable=['c.service', 'a.service']),
+    ]
+    mocked_enable = MockedSystemdCmd()
+    monkeypatch.setattr(systemd, 'enable_units', mocked_enable)
+    mocked_disable = MockedSystemdCmd()
+    monkeypatch.setattr(systemd, 'disable_units', mocked_disable)
+    envars = {'LEAPP_SYSTEMD_OFFLINE_UNITS': '1'}
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=msgs, envars=envars))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+
+    setsystemdservicesstate.process()
+
+    assert mocked_enable.units == ['a.service', 'b.service', 'c.service']
+    assert mocked_disable.units == ['c.service']
+    assert mocked_enable.offline and mocked_disable.offline
+
+
 def test_process_invalid(monkeypatch):
 
     def mocked_run(cmd, *args, **kwargs):
@@ -82,10 +104,10 @@ def test_enable_disable_conflict_logged(monkeypatch):
     msgs = [SystemdServicesTasks(to_enable=['hello.service'], to_disable=['hello.service'])]
 
     mocked_enable = MockedSystemdCmd()
-    monkeypatch.setattr(systemd, 'enable_unit', mocked_enable)
+    monkeypatch.setattr(systemd, 'enable_units', mocked_enable)
 
     mocked_disable = MockedSystemdCmd()
-    monkeypatch.setattr(systemd, 'disable_unit', mocked_disable)
+    monkeypatch.setattr(systemd, 'disable_units', mocked_disable)
 
     monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=msgs))
     monkeypatch.setattr(api, 'current_logger', logger_mocked())
@@ -1,10 +1,13 @@
+import binascii
 import errno
 import functools
 import grp
+import gzip
 import logging
 import os
 import pwd
 import re
+import struct
 
 import six
 
@@ -33,6 +36,28 @@ from leapp.models import (
     UsersFacts
 )
 
+try:
+    import lzma
+except ImportError:
+    # not available on Python 2
+    lzma = None
+
+PROC_MODULES = '/proc/modules'
+SYS_MODULE_DIR = '/sys/module'
+MODULES_DIR = '/lib/modules'
+
+# The signature appended to kernel module files, see scripts/sign-file.c in the kernel sources
+_MODULE_SIG_MAGIC = b'~Module signature appended~\n'
+# struct module_signature: algo, hash, id_type, signer_len, key_id_len, padding and sig_len
+_MODULE_SIG_INFO = struct.Struct('>BBBBB3xI')
+_MODULE_SIG_ID_PKCS7 = 2
+_DER_OCTET_STRING = 0x04
+_MODULE_READ_ERRORS = (IOError, OSError, EOFError, ValueError, IndexError, StopIteration, struct.error)
+if lzma:
+    _MODULE_READ_ERRORS += (lzma.LZMAError,)
+
+_module_signatures = {}
+
 
 def aslist(f):
     """ Decorator used to convert generator to list """
@@ -115,32 +140,141 @@ def get_system_groups_status():
     return GroupsFacts(groups=_get_system_groups())
 
 
+def _iter_der(data):
+    """ Iterate over tags and contents of DER encoded elements concatenated in `data` """
+    pos = 0
+    while pos < len(data):
+        tag = six.indexbytes(data, pos)
+        length = six.indexbytes(data, pos + 1)
+        pos += 2
+        if length & 0x80:
+            length_size = length & 0x7f
+            length = int(binascii.hexlify(data[pos:pos + length_size]), 16)
+            pos += length_size
+        if pos + length > len(data):
+            raise ValueError('Truncated DER element')
+        yield tag, data[pos:pos + length]
+        pos += length
+
+
+def _get_pkcs7_signature(data):
+    """
+    Get the signature of the first signer from a PKCS#7 SignedData message
+
+    Only the signature itself is returned, the same way as modinfo shows it.
+    """
+    content_info = next(_iter_der(data))[1]
+    signed_data = next(_iter_der(list(_iter_der(content_info))[1][1]))[1]
+    signer_infos = list(_iter_der(signed_data))[-1][1]
+    signer_info = next(_iter_der(signer_infos))[1]
+    for tag, value in _iter_der(signer_info):
+        if tag == _DER_OCTET_STRING:
+            # the encryptedDigest is the only OCTET STRING in the SignerInfo
+            return value
+    raise ValueError('No signature found in the PKCS#7 message')
+
+
+def _parse_module_signature(data):
+    """
+    Get the signature appended to the content of a kernel module file
+
+    The signature is returned formatted as `modinfo -F signature` formats it
+    (with whitespace removed), None is returned for unsigned modules.
+    """
+    if not data.endswith(_MODULE_SIG_MAGIC):
+        return None
+    info_offset = len(data) - len(_MODULE_SIG_MAGIC) - _MODULE_SIG_INFO.size
+    if info_offset < 0:
+        return None
+    id_type, signer_len, key_id_len, sig_len = _MODULE_SIG_INFO.unpack_from(data, info_offset)[2:]
+    if not sig_len or info_offset < sig_len + signer_len + key_id_len:
+        return None
+    signature = data[info_offset - sig_len:info_offset]
+    if id_type == _MODULE_SIG_ID_PKCS7:
+        signature = _get_pkcs7_signature(signature)
+    return ':'.join('{:02X}'.format(byte) for byte in bytearray(signature))
+
+
+def _read_module_file(path):
+    """ Read the (possibly compressed) kernel module file """
+    if path.endswith('.ko.xz'):
+        if not lzma:
+            raise ValueError('Cannot decompress {}: lzma is not available'.format(path))
+        opener = lzma.open
+    elif path.endswith('.ko.gz'):
+        opener = gzip.open
+    elif path.endswith('.ko'):
+        opener = open
+    else:
+        raise ValueError('Unsupported kernel module file: {}'.format(path))
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+def _get_modules_paths():
+    """ Map names of the kernel modules of the running kernel to their files using modules.dep """
+    modules_dir = os.path.join(MODULES_DIR, os.uname()[2])
+    modules_paths = {}
+    try:
+        with open(os.path.join(modules_dir, 'modules.dep'), 'r') as fp:
+            for line in fp:
+                path = line.split(':', 1)[0].strip()
+                if not path:
+                    continue
+                name = os.path.basename(path).split('.ko', 1)[0].replace('-', '_')
+                modules_paths.setdefault(name, os.path.join(modules_dir, path))
+    except IOError as exc:
+        api.current_logger().debug('Cannot read modules.dep of the running kernel: {}'.format(exc))
+    return modules_paths
+
+
+def _get_module_signature(name, path):
+    """
+    Get the signature of the kernel module
+
+    The signature is read from the module file when it is known and supported,
+    `modinfo` is used otherwise. Signatures read from files are cached by the
+    path and mtime of the file.
+    """
+    if path:
+        try:
+            key = (path, os.stat(path).st_mtime)
+            if key not in _module_signatures:
+                _module_signatures[key] = _parse_module_signature(_read_module_file(path))
+            return _module_signatures[key]
+        except _MODULE_READ_ERRORS as exc:
+            api.current_logger().debug(
+                'Cannot read signature of kernel module "{}" from {}: {}'.format(name, path, exc)
+            )
+
+    try:
+        signature = run(['modinfo', '-F', 'signature', name], split=False)['stdout']
+    except CalledProcessError:
+        signature = None
+
+    if signature:
+        # Remove whitespace from the signature string
+        return re.sub(r"\s+", "", signature, flags=re.UNICODE)
+    return None
+
+
 @aslist
 def _get_active_kernel_modules(logger):
-    lines = run(['lsmod'], split=True)['stdout']
-    for l in lines[1:]:
-        name = l.split(' ')[0]
+    with open(PROC_MODULES, 'r') as fp:
+        names = [line.split(' ', 1)[0] for line in fp if line.strip()]
+    modules_paths = _get_modules_paths()
 
+    for name in names:
         # Read parameters of the given module as exposed by the
         # `/sys` VFS, if there are no parameters exposed we just
         # take the name of the module
-        base_path = '/sys/module/{module}'.format(module=name)
-        parameters_path = os.path.join(base_path, 'parameters')
+        parameters_path = os.path.join(SYS_MODULE_DIR, name, 'parameters')
         if not os.path.exists(parameters_path):
             yield ActiveKernelModule(filename=name, parameters=[])
             continue
 
-        # Use `modinfo` to probe for signature information
         parameter_dict = {}
-        try:
-            signature = run(['modinfo', '-F', 'signature', name], split=False)['stdout']
-        except CalledProcessError:
-            signature = None
-
-        signature_string = None
-        if signature:
-            # Remove whitespace from the signature string
-            signature_string = re.sub(r"\s+", "", signature, flags=re.UNICODE)
+        signature_string = _get_module_signature(name, modules_paths.get(name))
 
         # Since we're using the `/sys` VFS we need to use `os.listdir()` to get
         # all the property names and then just read from all the listed paths
@@ -0,0 +1,111 @@
+import gzip
+import os
+import struct
+
+from leapp.libraries.actor import systemfacts
+from leapp.libraries.common.testutils import logger_mocked
+from leapp.libraries.stdlib import api, CalledProcessError
+
+SIGNATURE = bytes(bytearray(range(256)))
+SIGNATURE_STRING = ':'.join('{:02X}'.format(byte) for byte in range(256))
+
+
+def _der(tag, *contents):
+    content = b''.join(contents)
+    if len(content) < 0x80:
+        return struct.pack('>BB', tag, len(content)) + content
+    return struct.pack('>BBH', tag, 0x82, len(content)) + content
+
+
+def _pkcs7(signature):
+    oid = _der(0x06, b'\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02')
+    signer_info = _der(
+        0x30,
+        _der(0x02, b'\x01'),
+        _der(0x30, _der(0x30, b''), _der(0x02, b'\x42')),
+        _der(0x30, oid),
+        _der(0x30, oid),
+        _der(0x04, signature),
+    )
+    signed_data = _der(
+        0x30,
+        _der(0x02, b'\x01'),
+        _der(0x31, _der(0x30, oid)),
+        _der(0x30, oid),
+        _der(0x31, signer_info),
+    )
+    return _der(0x30, oid, _der(0xa0, signed_data))
+
+
+def _signed_module(signature, id_type=systemfacts._MODULE_SIG_ID_PKCS7):
+    sig_info = systemfacts._MODULE_SIG_INFO.pack(0, 0, id_type, 0, 0, len(signature))
+    return b'\x7fELF module content' + signature + sig_info + systemfacts._MODULE_SIG_MAGIC
+
+
+def test_parse_module_signature():
+    assert systemfacts._parse_module_signature(_signed_module(_pkcs7(SIGNATURE))) == SIGNATURE_STRING
+    assert systemfacts._parse_module_signature(_signed_module(b'\xab\x01', id_type=1)) == 'AB:01'
+    assert systemfacts._parse_module_signature(b'\x7fELF module content') is None
+
+
+class MockedRun(object):
+    def __init__(self):
+        self.modules = []
+
+    def __call__(self, cmd, split=False):
+        self.modules.append(cmd[-1])
+        if cmd[-1] == 'unknown':
+            raise CalledProcessError(message='modinfo failed', command=cmd, result={'exit_code': 1})
+        return {'stdout': '\t\tAB:CD:\n\t\tEF\n'}
+
+
+def test_get_active_kernel_modules(monkeypatch, tmpdir):
+    proc_modules = tmpdir.join('modules')
+    proc_modules.write(
+        'xfs 1921024 2 - Live 0x0000000000000000\n'
+        'zlib 16384 1 xfs, Live 0x0000000000000000\n'
+        'dm_mod 204800 9 - Live 0x0000000000000000\n'
+        'out_of_tree 16384 0 - Live 0x0000000000000000 (OE)\n'
+        'unknown 16384 0 - Live 0x0000000000000000\n'
+    )
+    sys_module = tmpdir.mkdir('sys_module')
+    for name in ('xfs', 'dm_mod', 'out_of_tree', 'unknown'):
+        sys_module.mkdir(name).mkdir('parameters').join('debug').write('0\n')
+    sys_module.mkdir('zlib')
+
+    modules_dir = tmpdir.mkdir('lib_modules')
+    kernel_dir = modules_dir.mkdir(os.uname()[2])
+    kernel_dir.join('modules.dep').write(
+        'kernel/fs/xfs/xfs.ko.gz: kernel/lib/zlib.ko\n'
+        'kernel/lib/zlib.ko:\n'
+        'kernel/drivers/md/dm-mod.ko:\n'
+    )
+    with gzip.open(str(kernel_dir.mkdir('kernel').mkdir('fs').mkdir('xfs').join('xfs.ko.gz')), 'wb') as f:
+        f.write(_signed_module(_pkcs7(SIGNATURE)))
+    kernel_dir.join('kernel').mkdir('drivers').mkdir('md').join('dm-mod.ko').write_binary(b'\x7fELF unsigned')
+
+    monkeypatch.setattr(systemfacts, 'PROC_MODULES', str(proc_modules))
+    monkeypatch.setattr(systemfacts, 'SYS_MODULE_DIR', str(sys_module))
+    monkeypatch.setattr(systemfacts, 'MODULES_DIR', str(modules_dir))
+    monkeypatch.setattr(systemfacts, '_module_signatures', {})
+    monkeypatch.setattr(systemfacts, 'run', MockedRun())
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+
+    modules = systemfacts._get_active_kernel_modules(api.current_logger())
+
+    assert [module.filename for module in modules] == ['xfs', 'zlib', 'dm_mod', 'out_of_tree', 'unknown']
+    assert [module.signature for module in modules] == [SIGNATURE_STRING, None, None, 'AB:CD:EF', None]
+    assert [len(module.parameters) for module in modules] == [1, 0, 1, 1, 1]
+    assert modules[0].parameters[0].name == 'debug'
+    assert modules[0].parameters[0].value == '0'
+    # modinfo is executed only for modules which files are not known
+    assert systemfacts.run.modules == ['out_of_tree', 'unknown']
+    assert len(systemfacts._module_signatures) == 2
+
+    # module files are not read again while they are not modified
+    def read_module_file_mocked(path):
+        assert False, 'Unexpected read of {}'.format(path)
+
+    monkeypatch.setattr(systemfacts, '_read_module_file', read_module_file_mocked)
+    modules = systemfacts._get_active_kernel_modules(api.current_logger())
+    assert [module.signature for module in modules] == [SIGNATURE_STRING, None, None, 'AB:CD:EF', None]
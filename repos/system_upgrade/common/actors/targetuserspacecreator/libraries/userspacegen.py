@@ -1,12 +1,16 @@
+import errno
+import hashlib
 import itertools
+import json
 import os
 import re
 import shutil
+import stat
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecution, StopActorExecutionError
 from leapp.libraries.actor import constants
-from leapp.libraries.common import dnfplugin, mounting, overlaygen, repofileutils, rhsm, utils
+from leapp.libraries.common import dnfplugin, mounting, overlaygen, repofileutils, rhsm, rpms, utils
 from leapp.libraries.common.config import get_env, get_product_type
 from leapp.libraries.common.config.version import get_target_major_version
 from leapp.libraries.common.gpg import get_path_to_gpg_certs, is_nogpgcheck_set
@@ -58,6 +62,37 @@ PROD_CERTS_FOLDER = 'prod-certs'
 PERSISTENT_PACKAGE_CACHE_DIR = '/var/lib/leapp/persistent_package_cache'
 DEDICATED_LEAPP_PART_URL = 'https://access.redhat.com/solutions/7011704'
 
+# The fingerprint of inputs the target userspace has been created from,
+# stored inside the target userspace. See _get_userspace_fingerprint()
+USERSPACE_FINGERPRINT_FILE = '.leapp-userspace-fingerprint.json'
+USERSPACE_FINGERPRINT_VERSION = 1
+
+# Files of the rpm database (bdb, sqlite, ndb) used to detect changes
+# of the target userspace done after its creation
+_RPMDB_FILES = ('Packages', 'rpmdb.sqlite', 'Packages.db')
+_RPMDB_DIRS = (os.path.join('usr', 'lib', 'sysimage', 'rpm'), os.path.join('var', 'lib', 'rpm'))
+
+# Actions for the existing target userspace
+_USERSPACE_REBUILD = 'rebuild'
+_USERSPACE_REFRESH = 'refresh'
+_USERSPACE_REUSE = 'reuse'
+
+# The maximal number of source files passed to one `cp` call when files
+# cannot be copied in-process
+EXTERNAL_COPY_BATCH_SIZE = 512
+
+try:
+    # Copying in-process requires reading and writing of extended attributes
+    # (SELinux labels, ACLs) and setting of timestamps of symlinks.
+    _NATIVE_COPY_SUPPORTED = bool(os.listxattr) and os.utime in os.supports_follow_symlinks
+except AttributeError:
+    # Python 2 - keep using cp for regular files, but in batches
+    _NATIVE_COPY_SUPPORTED = False
+
+# errnos for which we skip preserving of ownership and extended attributes
+# silently, the same way `cp -a` does
+_IGNORED_PRESERVE_ERRNOS = (errno.EPERM, errno.EACCES, errno.ENOTSUP)
+
 
 def _check_deprecated_rhsm_skip():
     # we do not plan to cover this case by tests as it is purely
@@ -212,19 +247,193 @@ def _handle_transaction_err_msg_size(err):
     raise StopActorExecutionError(message=message, details=details)
 
 
-def prepare_target_userspace(context, userspace_dir, enabled_repos, packages):
+def _is_userspace_reuse_enabled():
+    return get_env('LEAPP_REUSE_TARGET_USERSPACE', '0') == '1'
+
+
+def _get_file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _get_dir_digests(path, suffix=''):
+    """
+    Return a dict mapping names of regular files inside the path to their digests.
+    """
+    if not os.path.isdir(path):
+        return {}
+    digests = {}
+    for name in sorted(os.listdir(path)):
+        filepath = os.path.join(path, name)
+        if name.endswith(suffix) and os.path.isfile(filepath):
+            digests[name] = _get_file_digest(filepath)
+    return digests
+
+
+def _get_leapp_versions():
+    """
+    Get NVRs of installed leapp and leapp-repository packages.
+
+    The target userspace created by a different version of leapp must not be
+    reused as it could be created differently.
+    """
+    leapp_pkgs = rpms.get_leapp_packages(
+        component=[rpms.LeappComponents.FRAMEWORK, rpms.LeappComponents.REPOSITORY])
+    result = run(['rpm', '-q', '--queryformat', '%{NAME}-%{VERSION}-%{RELEASE}\n'] + leapp_pkgs,
+                 split=True, checked=False)
+    return sorted(result['stdout'])
+
+
+def _get_userspace_fingerprint(context, enabled_repos, packages, files):
+    """
+    Get the fingerprint of all inputs the target userspace is created from.
+
+    The fingerprint covers versions of installed leapp packages, the target
+    version, enabled repositories and their definitions (including the DNF
+    configuration) in the given context, the requested packages, trusted GPG
+    keys and the list of files copied into the target userspace. Content of copied files is not covered as files
+    are copied into the userspace again on reuse.
+
+    Note the content of remote repositories is not covered.
+
+    :param context: An instance of a mounting.IsolatedActions class the target userspace is installed from
+    :param enabled_repos: Repoids of enabled target repositories
+    :param packages: Names of packages installed into the target userspace
+    :param files: list of CopyFile copied into the target userspace
+    :rtype: dict
+    """
+    gpg_keys = None
+    if not is_nogpgcheck_set():
+        gpg_keys = _get_dir_digests(get_path_to_gpg_certs())
+    return {
+        'version': USERSPACE_FINGERPRINT_VERSION,
+        'leapp_versions': _get_leapp_versions(),
+        'target_version': api.current_actor().configuration.version.target,
+        'skip_rhsm': rhsm.skip_rhsm(),
+        'enabled_repos': sorted(enabled_repos),
+        'repofiles': _get_dir_digests(context.full_path('/etc/yum.repos.d'), suffix='.repo'),
+        'dnf_conf': _get_dir_digests(context.full_path('/etc/dnf'), suffix='.conf'),
+        'dnf_vars': _get_dir_digests(context.full_path('/etc/dnf/vars')),
+        'gpg_keys': gpg_keys,
+        'packages': sorted(packages),
+        'files': sorted([cfile.src, cfile.dst or cfile.src] for cfile in files),
+    }
+
+
+def _get_rpmdb_signature(userspace_dir):
+    """
+    Get the signature (size and mtime) of the rpm database in the target userspace.
+
+    Any installation or removal of packages in the target userspace changes
+    the signature.
+    """
+    signature = {}
+    for dbdir in _RPMDB_DIRS:
+        dbdir_path = os.path.join(userspace_dir, dbdir)
+        # /var/lib/rpm could be an absolute symlink pointing outside the userspace
+        if os.path.islink(dbdir_path) or not os.path.isdir(dbdir_path):
+            continue
+        for name in _RPMDB_FILES:
+            dbfile_path = os.path.join(dbdir_path, name)
+            if os.path.isfile(dbfile_path):
+                dbfile_stat = os.stat(dbfile_path)
+                signature[os.path.join(dbdir, name)] = [dbfile_stat.st_size, dbfile_stat.st_mtime]
+    return signature
+
+
+def _load_userspace_fingerprint(userspace_dir):
+    try:
+        with open(os.path.join(userspace_dir, USERSPACE_FINGERPRINT_FILE)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _store_userspace_fingerprint(userspace_dir, fingerprint):
+    data = {'inputs': fingerprint, 'rpmdb': _get_rpmdb_signature(userspace_dir)}
+    with open(os.path.join(userspace_dir, USERSPACE_FINGERPRINT_FILE), 'w') as f:
+        json.dump(data, f, sort_keys=True)
+
+
+def _remove_userspace_fingerprint(userspace_dir):
+    path = os.path.join(userspace_dir, USERSPACE_FINGERPRINT_FILE)
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def _get_userspace_action(userspace_dir, fingerprint):
+    """
+    Decide whether the existing target userspace can be reused.
+
+    The existing target userspace is:
+      * reused - when it has been created from the same inputs and it has
+        not been modified since then (the rpm database is unchanged)
+      * refreshed - when the only difference is that more packages are
+        requested now; just the missing packages are installed
+      * rebuilt - in all other cases
+
+    The decision is logged.
+
+    :param userspace_dir: Path to the target userspace
+    :param fingerprint: The fingerprint of current inputs; None if the reuse is not allowed
+    :return: One of _USERSPACE_REUSE, _USERSPACE_REFRESH, _USERSPACE_REBUILD
+    """
+    def _rebuild(reason):
+        api.current_logger().info('Creating the target userspace from scratch: {}'.format(reason))
+        return _USERSPACE_REBUILD
+
+    if fingerprint is None:
+        return _rebuild('the reuse of the target userspace is not enabled.')
+    stored = _load_userspace_fingerprint(userspace_dir)
+    if not stored:
+        return _rebuild('no valid target userspace from a previous execution has been found.')
+    if stored.get('rpmdb') != _get_rpmdb_signature(userspace_dir):
+        return _rebuild('the target userspace has been modified after its creation.')
+
+    stored_inputs = stored.get('inputs') or {}
+    changed = sorted(key for key in set(fingerprint) | set(stored_inputs)
+                     if fingerprint.get(key) != stored_inputs.get(key))
+    if not changed:
+        api.current_logger().info('Reusing the existing target userspace: inputs are unchanged.')
+        return _USERSPACE_REUSE
+    if changed == ['packages'] and set(stored_inputs['packages']).issubset(fingerprint['packages']):
+        api.current_logger().info(
+            'Refreshing the existing target userspace: installing additional packages: {}'
+            .format(', '.join(sorted(set(fingerprint['packages']) - set(stored_inputs['packages']))))
+        )
+        return _USERSPACE_REFRESH
+    return _rebuild('changed inputs: {}.'.format(', '.join(changed)))
+
+
+def prepare_target_userspace(context, userspace_dir, enabled_repos, packages, fingerprint=None):
     """
     Implement the creation of the target userspace.
+
+    If the fingerprint of inputs is given, the existing target userspace
+    is reused or refreshed when possible (see _get_userspace_action()).
+    Otherwise it is always created from scratch.
+
+    :return: The action done with the target userspace (reuse, refresh, rebuild)
     """
-    _backup_to_persistent_package_cache(userspace_dir)
+    action = _get_userspace_action(userspace_dir, fingerprint)
+    _remove_userspace_fingerprint(userspace_dir)
+    if action == _USERSPACE_REUSE:
+        return action
 
-    run(['rm', '-rf', userspace_dir])
-    _create_target_userspace_directories(userspace_dir)
+    if action == _USERSPACE_REBUILD:
+        _backup_to_persistent_package_cache(userspace_dir)
+
+        run(['rm', '-rf', userspace_dir])
+        _create_target_userspace_directories(userspace_dir)
 
     target_major_version = get_target_major_version()
     install_root_dir = '/el{}target'.format(target_major_version)
     with mounting.BindMount(source=userspace_dir, target=os.path.join(context.base_dir, install_root_dir.lstrip('/'))):
-        _restore_persistent_package_cache(userspace_dir)
+        if action == _USERSPACE_REBUILD:
+            _restore_persistent_package_cache(userspace_dir)
         if not is_nogpgcheck_set():
             _import_gpg_keys(context, install_root_dir, target_major_version)
 
@@ -281,6 +490,7 @@ def prepare_target_userspace(context, userspace_dir, enabled_repos, packages):
                         )
 
             raise StopActorExecutionError(message=message, details=details)
+    return action
 
 
 def _query_rpm_for_pkg_files(context, pkgs):
@@ -298,7 +508,7 @@ def _get_files_owned_by_rpms(context, dirpath, pkgs=None, recursive=False):
     in the yum.repos.d directory.
 
     In case the pkgs param is None or empty, do not filter any specific rpms.
-    Otherwise return filenames that are owned by any pkg in the given list.
+    Otherwise return filenames that are owned by any pkg (name) in the given list.
 
     If the recursive param is set to True, all files owned by a package in the
     directory tree starting at dirpath are returned. Otherwise, only the
@@ -317,13 +527,13 @@ def _get_files_owned_by_rpms(context, dirpath, pkgs=None, recursive=False):
     else:
         file_list = os.listdir(searchdir)
 
+    owners = rpms.get_files_owners([os.path.join(dirpath, fname) for fname in file_list], context=context)
     for fname in file_list:
-        try:
-            result = context.call(['rpm', '-qf', os.path.join(dirpath, fname)])
-        except CalledProcessError:
+        file_owners = owners.get(os.path.join(dirpath, fname))
+        if not file_owners:
             api.current_logger().debug('SKIP the {} file: not owned by any rpm'.format(fname))
             continue
-        if pkgs and not [pkg for pkg in pkgs if pkg in result['stdout']]:
+        if pkgs and not [pkg for pkg in pkgs if pkg in file_owners]:
             api.current_logger().debug('SKIP the {} file: not owned by any searched rpm:'.format(fname))
             continue
         api.current_logger().debug('Found the file owned by an rpm: {}.'.format(fname))
@@ -336,16 +546,150 @@ def _mkdir_with_copied_mode(path, mode_from):
     """
     Create directories with a file to copy the mode from.
 
+    Missing parent directories are created as well. The mode is copied only
+    to the last directory in the path (the same as `mkdir -p` + `chmod --reference`).
+
     :param path: The directory path to create.
     :param mode_from: A file or directory whose mode we will copy to the
         newly created directory.
-    :raises subprocess.CalledProcessError: mkdir or chmod fails. For instance,
-        the directory already exists, the file to get permissions from does
-        not exist, a parent directory does not exist.
+    :raises OSError: mkdir or chmod fails. For instance, the path exists
+        but it is not a directory or the file to get permissions from does
+        not exist.
+    """
+    mode = stat.S_IMODE(os.stat(mode_from).st_mode)
+    parent_dir = os.path.dirname(path)
+    if parent_dir and not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
+    if not os.path.isdir(path):
+        # Create with maximally restrictive permissions
+        os.mkdir(path, 0)
+    os.chmod(path, mode)
+
+
+class _ExternalCopyBatch(object):
+    """
+    Copy files that cannot be copied in-process using as few `cp -a` calls as possible.
+
+    Files which keep their basename in the target location are grouped by
+    the target directory and copied by one `cp -a --target-directory` call
+    per group (in chunks of EXTERNAL_COPY_BATCH_SIZE files). Other files
+    are copied one by one.
+    """
+
+    def __init__(self, batch_size=EXTERNAL_COPY_BATCH_SIZE):
+        self._batch_size = batch_size
+        self._sources_by_target_dir = {}
+        self._renamed = []
+
+    def __len__(self):
+        return sum(len(srcs) for srcs in self._sources_by_target_dir.values()) + len(self._renamed)
+
+    def add(self, src, dst):
+        if os.path.basename(src) == os.path.basename(dst):
+            self._sources_by_target_dir.setdefault(os.path.dirname(dst), []).append(src)
+        else:
+            self._renamed.append((src, dst))
+
+    def flush(self):
+        """
+        Copy all collected files.
+
+        :raises CalledProcessError: if any cp call fails
+        """
+        for target_dir in sorted(self._sources_by_target_dir):
+            sources = self._sources_by_target_dir[target_dir]
+            for i in range(0, len(sources), self._batch_size):
+                run(['cp', '-a', '--target-directory={}'.format(target_dir)] + sources[i:i + self._batch_size])
+        for src, dst in self._renamed:
+            run(['cp', '-a', src, dst])
+        self._sources_by_target_dir = {}
+        self._renamed = []
+
+
+def _copy_xattrs(src, dst):
+    try:
+        names = os.listxattr(src, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in _IGNORED_PRESERVE_ERRNOS:
+            raise
+        return
+    for name in names:
+        try:
+            value = os.getxattr(src, name, follow_symlinks=False)
+            os.setxattr(dst, name, value, follow_symlinks=False)
+        except OSError as e:
+            # e.g. the security.selinux label cannot be set without privileges
+            # or user.* attributes on symlinks
+            if e.errno not in _IGNORED_PRESERVE_ERRNOS:
+                raise
+
+
+def _copy_metadata(src, dst, src_stat):
+    """
+    Copy ownership, extended attributes, mode and timestamps of src to dst as `cp -a` does.
+    """
+    try:
+        os.lchown(dst, src_stat.st_uid, src_stat.st_gid)
+    except OSError as e:
+        if e.errno not in _IGNORED_PRESERVE_ERRNOS:
+            raise
+    _copy_xattrs(src, dst)
+    is_symlink = stat.S_ISLNK(src_stat.st_mode)
+    if not is_symlink:
+        # chmod after chown as chown drops the setuid/setgid bits
+        os.chmod(dst, stat.S_IMODE(src_stat.st_mode))
+    os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns), follow_symlinks=not is_symlink)
+
+
+def _copy_file_contents(src, dst):
+    # Create the file readable just for the owner until the right mode is set,
+    # so private keys are not leaked in the meanwhile
+    with open(src, 'rb') as src_file:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(dst_fd, 'wb') as dst_file:
+            shutil.copyfileobj(src_file, dst_file, 1024 * 1024)
+
+
+def _copy_preserving(src, dst, fallback):
+    """
+    Copy src to dst in-process with the same result as `cp -a src dst`.
+
+    Directories are copied recursively; symlinks are copied as symlinks.
+    Files that cannot be copied in-process (special files, or anything when
+    the python does not support the needed syscalls) are added to the
+    fallback batch instead.
+
+    :param src: The path to the source file or directory.
+    :param dst: The target path. It must not exist in case of directories.
+    :param fallback: The _ExternalCopyBatch for files that need to be copied by cp.
+    """
+    if not _NATIVE_COPY_SUPPORTED:
+        fallback.add(src, dst)
+        return
+
+    src_stat = os.lstat(src)
+    if stat.S_ISDIR(src_stat.st_mode):
+        os.mkdir(dst, 0o700)
+        for name in os.listdir(src):
+            _copy_preserving(os.path.join(src, name), os.path.join(dst, name), fallback)
+    elif stat.S_ISLNK(src_stat.st_mode):
+        os.symlink(os.readlink(src), dst)
+    elif stat.S_ISREG(src_stat.st_mode):
+        _copy_file_contents(src, dst)
+    else:
+        fallback.add(src, dst)
+        return
+    _copy_metadata(src, dst, src_stat)
+
+
+def _remove_path(path):
+    """
+    Remove the path whatever it is (like `rm -rf`).
     """
-    # Create with maximally restrictive permissions
-    run(['mkdir', '-m', '0', '-p', path])
-    run(['chmod', '--reference={}'.format(mode_from), path])
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
 
 
 def _choose_copy_or_link(symlink, srcdir):
@@ -454,7 +798,7 @@ def _choose_copy_or_link(symlink, srcdir):
     return ('copy', pointee_as_abspath)
 
 
-def _copy_symlinks(symlinks_to_process, srcdir):
+def _copy_symlinks(symlinks_to_process, srcdir, fallback=None):
     """
     Copy file contents or create a symlink depending on where the pointee resides.
 
@@ -462,8 +806,11 @@ def _copy_symlinks(symlinks_to_process, srcdir):
         should be an absolute path to the symlink.  target_path is the path to where we
         need to create either a link or a copy.
     :param srcdir: The root directory that every piece of content must be present in.
+    :param fallback: The _ExternalCopyBatch for files that need to be copied by cp.
+        If not set, such files are copied before the function returns.
     :raises ValueError: if the arguments are not correct
     """
+    batch = fallback if fallback is not None else _ExternalCopyBatch()
     for source_linkpath, target_linkpath in symlinks_to_process:
         try:
             action, source_path = _choose_copy_or_link(source_linkpath, srcdir)
@@ -473,15 +820,17 @@ def _copy_symlinks(symlinks_to_process, srcdir):
             continue
 
         if action == "copy":
-            # Note: source_path could be a directory, so '-a' or '-r' must be
-            # given to cp.
-            run(['cp', '-a', source_path, target_linkpath])
+            # Note: source_path could be a directory, so it is copied recursively
+            _copy_preserving(source_path, target_linkpath, batch)
         elif action == 'link':
-            run(["ln", "-s", source_path, target_linkpath])
+            os.symlink(source_path, target_linkpath)
         else:
             # This will not happen unless _copy_or_link() has a bug.
             raise RuntimeError("Programming error: _copy_or_link() returned an unknown action:{}".format(action))
 
+    if fallback is None:
+        batch.flush()
+
 
 def _copy_decouple(srcdir, dstdir):
     """
@@ -493,9 +842,14 @@ def _copy_decouple(srcdir, dstdir):
     symlinks. Any symlink (or symlink chains) within the directory will be
     preserved.
 
+    Everything is copied in-process, preserving the same metadata as `cp -a`.
+    Only files that cannot be copied in-process are copied by batched `cp`
+    calls at the end.
+
     .. warning::
         `dstdir` must already exist.
     """
+    fallback = _ExternalCopyBatch()
     for root, directories, files in os.walk(srcdir):
         # relative path from srcdir because srcdir is replaced with dstdir for
         # the copy.
@@ -519,7 +873,7 @@ def _copy_decouple(srcdir, dstdir):
 
         # Link or create all directories that were pointed to by symlinks and
         # then reset symlinks_to_process for use by files.
-        _copy_symlinks(symlinks_to_process, srcdir)
+        _copy_symlinks(symlinks_to_process, srcdir, fallback)
         symlinks_to_process = []
 
         for filename in files:
@@ -533,9 +887,11 @@ def _copy_decouple(srcdir, dstdir):
                 continue
 
             # Not a symlink so we can copy it now too
-            run(['cp', '-a', source_filepath, target_filepath])
+            _copy_preserving(source_filepath, target_filepath, fallback)
+
+        _copy_symlinks(symlinks_to_process, srcdir, fallback)
 
-        _copy_symlinks(symlinks_to_process, srcdir)
+    fallback.flush()
 
 
 def _copy_certificates(context, target_userspace):
@@ -572,6 +928,7 @@ def _copy_certificates(context, target_userspace):
     # So any broken symlinks created will be by the installed packages.
 
     # Recover installed packages as they always get precedence
+    fallback = _ExternalCopyBatch()
     for filepath in files_owned_by_rpms:
         src_path = os.path.join(backup_pki, filepath)
         dst_path = os.path.join(target_pki, filepath)
@@ -602,15 +959,17 @@ def _copy_certificates(context, target_userspace):
             continue
 
         # Cleanup conflicting files
-        run(['rm', '-rf', dst_path])
+        _remove_path(dst_path)
 
         # Ensure destination exists
         parent_dir = os.path.dirname(dst_path)
-        run(['mkdir', '-p', parent_dir])
+        if not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir)
 
         # Copy the new file
-        run(['cp', '-R', '--preserve=all', src_path, dst_path])
+        _copy_preserving(src_path, dst_path, fallback)
 
+    fallback.flush()
     run(['rm', '-rf', backup_pki])
 
 
@@ -1102,9 +1461,18 @@ def _get_target_userspace():
 
 
 def _create_target_userspace(context, indata, packages, files, target_repoids):
-    """Create the target userspace."""
+    """
+    Create the target userspace.
+
+    When LEAPP_REUSE_TARGET_USERSPACE=1 is set, the target userspace created
+    by a previous leapp execution is reused if it has been created from the
+    same inputs. See _get_userspace_fingerprint() for the list of inputs.
+    """
     target_path = _get_target_userspace()
-    prepare_target_userspace(context, target_path, target_repoids, list(packages))
+    fingerprint = None
+    if _is_userspace_reuse_enabled():
+        fingerprint = _get_userspace_fingerprint(context, target_repoids, packages, files)
+    prepare_target_userspace(context, target_path, target_repoids, list(packages), fingerprint)
     _prep_repository_access(context, target_path)
 
     with mounting.NspawnActions(base_dir=target_path) as target_context:
@@ -1133,6 +1501,9 @@ def _create_target_userspace(context, indata, packages, files, target_repoids):
     with mounting.NspawnActions(_get_target_userspace()) as target_context:
         rhsm.set_container_mode(target_context)
 
+    if fingerprint is not None:
+        _store_userspace_fingerprint(target_path, fingerprint)
+
 
 def _apply_rhui_access_preinstall_tasks(context, rhui_setup_info):
     if rhui_setup_info.preinstall_tasks:
@@ -859,6 +859,117 @@ def test_copy_decouple(monkeypatch, temp_directory_layout, initial_structure, ex
         raise
 
 
+class RunCounterMocked(object):
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, command):
+        self.commands.append(command)
+        subprocess.check_call(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def _set_user_xattr(path, value):
+    try:
+        os.setxattr(path, 'user.leapp', value)
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+@pytest.mark.skipif(not userspacegen._NATIVE_COPY_SUPPORTED, reason='in-process copy is not supported')
+def test_copy_decouple_preserves_metadata(monkeypatch, tmp_path):
+    run_mocked = RunCounterMocked()
+    monkeypatch.setattr(userspacegen, 'run', run_mocked)
+
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'linked_file').write_text(u'linked')
+    os.chmod(str(outside / 'linked_file'), 0o640)
+    (outside / 'linked_dir').mkdir()
+    (outside / 'linked_dir' / 'nested').write_text(u'nested')
+    os.chmod(str(outside / 'linked_dir'), 0o750)
+
+    srcdir = tmp_path / 'src'
+    (srcdir / 'private').mkdir(parents=True)
+    os.chmod(str(srcdir / 'private'), 0o700)
+    (srcdir / 'private' / 'key.pem').write_text(u'secret')
+    os.chmod(str(srcdir / 'private' / 'key.pem'), 0o600)
+    os.utime(str(srcdir / 'private' / 'key.pem'), (1000000000, 1000000000))
+    has_xattr = _set_user_xattr(str(srcdir / 'private' / 'key.pem'), b'label')
+    (srcdir / 'file_link').symlink_to(outside / 'linked_file')
+    (srcdir / 'dir_link').symlink_to(outside / 'linked_dir')
+    (srcdir / 'inner_link').symlink_to('private/key.pem')
+
+    dstdir = tmp_path / 'dst'
+    dstdir.mkdir()
+    userspacegen._copy_decouple(str(srcdir), str(dstdir))
+
+    assert not run_mocked.commands
+    key = str(dstdir / 'private' / 'key.pem')
+    assert (dstdir / 'private' / 'key.pem').read_text() == u'secret'
+    assert os.stat(str(dstdir / 'private')).st_mode & 0o777 == 0o700
+    assert os.stat(key).st_mode & 0o777 == 0o600
+    assert os.stat(key).st_mtime == 1000000000
+    if has_xattr:
+        assert os.getxattr(key, 'user.leapp') == b'label'
+
+    assert not os.path.islink(str(dstdir / 'file_link'))
+    assert os.stat(str(dstdir / 'file_link')).st_mode & 0o777 == 0o640
+    assert (dstdir / 'file_link').read_text() == u'linked'
+    assert not os.path.islink(str(dstdir / 'dir_link'))
+    assert os.stat(str(dstdir / 'dir_link')).st_mode & 0o777 == 0o750
+    assert (dstdir / 'dir_link' / 'nested').read_text() == u'nested'
+    assert os.readlink(str(dstdir / 'inner_link')) == 'private/key.pem'
+
+
+def test_external_copy_batch(monkeypatch, tmp_path):
+    run_mocked = RunCounterMocked()
+    monkeypatch.setattr(userspacegen, 'run', run_mocked)
+    srcdir = tmp_path / 'src'
+    srcdir.mkdir()
+    dstdir = tmp_path / 'dst'
+    dstdir.mkdir()
+    for i in range(5):
+        (srcdir / 'file{}'.format(i)).write_text(u'{}'.format(i))
+
+    batch = userspacegen._ExternalCopyBatch(batch_size=2)
+    for i in range(4):
+        batch.add(str(srcdir / 'file{}'.format(i)), str(dstdir / 'file{}'.format(i)))
+    batch.add(str(srcdir / 'file4'), str(dstdir / 'renamed'))
+    assert len(batch) == 5
+    batch.flush()
+
+    assert len(run_mocked.commands) == 3
+    assert not len(batch)
+    assert sorted(os.listdir(str(dstdir))) == ['file0', 'file1', 'file2', 'file3', 'renamed']
+    assert (dstdir / 'renamed').read_text() == u'4'
+
+
+def test_copy_decouple_benchmark(monkeypatch, tmp_path):
+    """
+    Copy a synthetic tree of 10k files and check it is done without spawning cp for every file.
+    """
+    run_mocked = RunCounterMocked()
+    monkeypatch.setattr(userspacegen, 'run', run_mocked)
+    srcdir = tmp_path / 'src'
+    files_count = 10000
+    for i in range(files_count):
+        dirpath = srcdir / 'dir{}'.format(i % 100)
+        if i < 100:
+            dirpath.mkdir(parents=True)
+        (dirpath / 'cert{}.pem'.format(i)).write_text(u'{}'.format(i))
+    dstdir = tmp_path / 'dst'
+    dstdir.mkdir()
+
+    userspacegen._copy_decouple(str(srcdir), str(dstdir))
+
+    copied = sum(len(files) for _, _, files in os.walk(str(dstdir)))
+    assert copied == files_count
+    # at most one cp call per directory (and batch) when files cannot be copied in-process
+    max_calls = 0 if userspacegen._NATIVE_COPY_SUPPORTED else 100
+    assert len(run_mocked.commands) <= max_calls
+
+
 @pytest.mark.parametrize('result,dst_ver,arch,prod_type', [
     (os.path.join(_CERTS_PATH, '8.1', '479.pem'), '8.1', architecture.ARCH_X86_64, 'ga'),
     (os.path.join(_CERTS_PATH, '8.1', '419.pem'), '8.1', architecture.ARCH_ARM64, 'ga'),
@@ -1224,3 +1335,74 @@ def test_perform_ok(monkeypatch):
     assert userspacegen.api.produce.model_instances[1] == msg_target_repos
     # this one is full of constants, so it's safe to check just the instance
     assert isinstance(userspacegen.api.produce.model_instances[2], models.TargetUserSpaceInfo)
+
+
+def _userspace_fingerprint(**kwargs):
+    fingerprint = {
+        'version': userspacegen.USERSPACE_FINGERPRINT_VERSION,
+        'leapp_versions': ['leapp-0.18.0-1.el8', 'leapp-upgrade-el8toel9-0.21.0-1.el8'],
+        'target_version': '9.4',
+        'skip_rhsm': False,
+        'enabled_repos': ['repoA', 'repoB'],
+        'repofiles': {'redhat.repo': 'abc'},
+        'dnf_conf': {'dnf.conf': 'def'},
+        'dnf_vars': {},
+        'gpg_keys': {'RPM-GPG-KEY-redhat-release': '012'},
+        'packages': ['dnf', 'pkgA'],
+        'files': [['/etc/foo', '/etc/foo']],
+    }
+    fingerprint.update(kwargs)
+    return fingerprint
+
+
+@pytest.fixture
+def stored_userspace(tmp_path):
+    rpmdb_dir = tmp_path / 'var' / 'lib' / 'rpm'
+    rpmdb_dir.mkdir(parents=True)
+    (rpmdb_dir / 'rpmdb.sqlite').write_text(u'packages')
+    userspacegen._store_userspace_fingerprint(str(tmp_path), _userspace_fingerprint())
+    return tmp_path
+
+
+@pytest.mark.parametrize('fingerprint,action', [
+    (_userspace_fingerprint(), userspacegen._USERSPACE_REUSE),
+    (_userspace_fingerprint(packages=['dnf', 'pkgA', 'pkgB']), userspacegen._USERSPACE_REFRESH),
+    (_userspace_fingerprint(packages=['dnf']), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(enabled_repos=['repoA']), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(repofiles={'redhat.repo': 'changed'}), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(gpg_keys=None), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(target_version='9.5', packages=['dnf', 'pkgA', 'pkgB']), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(files=[]), userspacegen._USERSPACE_REBUILD),
+    (_userspace_fingerprint(leapp_versions=['leapp-0.18.0-1.el8', 'leapp-upgrade-el8toel9-0.22.0-1.el8']),
+     userspacegen._USERSPACE_REBUILD),
+    (None, userspacegen._USERSPACE_REBUILD),
+])
+def test_get_userspace_action(monkeypatch, stored_userspace, fingerprint, action):
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+    assert userspacegen._get_userspace_action(str(stored_userspace), fingerprint) == action
+    assert userspacegen.api.current_logger.infomsg
+
+
+def test_get_userspace_action_modified_rpmdb(monkeypatch, stored_userspace):
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+    (stored_userspace / 'var' / 'lib' / 'rpm' / 'rpmdb.sqlite').write_text(u'more packages')
+    action = userspacegen._get_userspace_action(str(stored_userspace), _userspace_fingerprint())
+    assert action == userspacegen._USERSPACE_REBUILD
+    assert 'modified' in userspacegen.api.current_logger.infomsg[0]
+
+
+def test_get_userspace_action_no_fingerprint(monkeypatch, tmp_path):
+    monkeypatch.setattr(userspacegen.api, 'current_logger', logger_mocked())
+    action = userspacegen._get_userspace_action(str(tmp_path), _userspace_fingerprint())
+    assert action == userspacegen._USERSPACE_REBUILD
+
+
+def test_get_leapp_versions(monkeypatch):
+    def run_mocked(cmd, **kwargs):
+        assert cmd[:2] == ['rpm', '-q']
+        assert 'leapp' in cmd and 'snactor' not in cmd
+        return {'stdout': ['leapp-upgrade-el8toel9-0.21.0-1.el8', 'leapp-0.18.0-1.el8']}
+
+    monkeypatch.setattr(userspacegen.api, 'current_actor', CurrentActorMocked(src_ver='8.10', dst_ver='9.4'))
+    monkeypatch.setattr(userspacegen, 'run', run_mocked)
+    assert userspacegen._get_leapp_versions() == ['leapp-0.18.0-1.el8', 'leapp-upgrade-el8toel9-0.21.0-1.el8']
@@ -1,5 +1,5 @@
 from leapp.actors import Actor
-from leapp.libraries.stdlib import run
+from leapp.libraries.actor import udevadminfo
 from leapp.models import UdevAdmInfoData
 from leapp.tags import FactsPhaseTag, IPUWorkflowTag
 
@@ -7,6 +7,9 @@ from leapp.tags import FactsPhaseTag, IPUWorkflowTag
 class UdevAdmInfo(Actor):
     """
     Produces data exported by the "udevadm info" command.
+
+    The exported udev database is parsed into the list of devices. The raw
+    export is included only when leapp is executed in the debug mode.
     """
 
     name = 'udevadm_info'
@@ -15,5 +18,4 @@ class UdevAdmInfo(Actor):
     tags = (IPUWorkflowTag, FactsPhaseTag,)
 
     def process(self):
-        out = run(['udevadm', 'info', '-e'])['stdout']
-        self.produce(UdevAdmInfoData(db=out))
+        udevadminfo.process()
@@ -0,0 +1,76 @@
+from leapp.libraries.stdlib import api, config, run
+from leapp.models import UdevAdmInfoData, UdevDevice, UdevProperty
+
+# properties with the same values as other fields of the UdevDevice model
+_SKIPPED_PROPERTIES = ('DEVPATH', 'DEVNAME', 'SUBSYSTEM', 'DEVLINKS')
+
+
+def _create_device(records):
+    properties = []
+    subsystem = None
+    devname = None
+    for name, value in records['E']:
+        if name == 'SUBSYSTEM':
+            subsystem = value
+        elif name == 'DEVNAME':
+            devname = value
+        if name not in _SKIPPED_PROPERTIES:
+            properties.append(UdevProperty(name=name, value=value))
+    if devname is None and records['N']:
+        devname = '/dev/{}'.format(records['N'][0])
+    if subsystem is None and records['U']:
+        subsystem = records['U'][0]
+    return UdevDevice(
+        devpath=records['P'][0],
+        devname=devname,
+        subsystem=subsystem,
+        devlinks=['/dev/{}'.format(link) for link in records['S']],
+        properties=properties,
+    )
+
+
+def parse_udevadm_export(lines):
+    """
+    Parse the output of 'udevadm info -e' line by line
+
+    The export consists of blocks separated by empty lines, one per device.
+    Each line of a block is a record in the "<type>: <value>" format, e.g.:
+
+        P: /devices/virtual/block/dm-0
+        N: dm-0
+        S: disk/by-uuid/4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec
+        E: ID_FS_UUID=4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec
+
+    Only the records describing the device (P, N, U, S and E) are processed.
+
+    :param lines: Iterable of lines of the export
+    :return: Generator of UdevDevice
+    """
+    records = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line:
+            if records and records['P']:
+                yield _create_device(records)
+            records = None
+            continue
+        record_type, sep, value = line.partition(': ')
+        if not sep or record_type not in ('P', 'N', 'U', 'S', 'E'):
+            continue
+        if records is None:
+            records = {'P': [], 'N': [], 'U': [], 'S': [], 'E': []}
+        if record_type == 'E':
+            name, dummy_sep, value = value.partition('=')
+            records['E'].append((name, value))
+        else:
+            records[record_type].append(value)
+    if records and records['P']:
+        yield _create_device(records)
+
+
+def process():
+    out = run(['udevadm', 'info', '-e'])['stdout']
+    devices = list(parse_udevadm_export(out.splitlines()))
+    api.current_logger().debug('Parsed {} devices from the udev database.'.format(len(devices)))
+    # the raw export takes several MBs on systems with many devices
+    api.produce(UdevAdmInfoData(db=out if config.is_debug() else None, devices=devices))
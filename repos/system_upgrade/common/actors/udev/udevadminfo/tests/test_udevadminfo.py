@@ -0,0 +1,88 @@
+import pytest
+
+from leapp.libraries.actor import udevadminfo
+from leapp.libraries.common.testutils import logger_mocked, produce_mocked
+from leapp.libraries.stdlib import api
+from leapp.models import UdevProperty
+
+UDEVADM_EXPORT = '''P: /devices/pci0000:00/0000:00:04.0/virtio1/block/vda/vda1
+M: vda1
+U: block
+T: partition
+D: b 252:1
+N: vda1
+L: 0
+S: disk/by-path/pci-0000:00:04.0-part1
+S: disk/by-uuid/4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec
+Q: 7
+V: 1
+E: DEVPATH=/devices/pci0000:00/0000:00:04.0/virtio1/block/vda/vda1
+E: SUBSYSTEM=block
+E: DEVNAME=/dev/vda1
+E: DEVTYPE=partition
+E: MAJOR=252
+E: MINOR=1
+E: ID_PATH=pci-0000:00:04.0
+E: ID_FS_UUID=4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec
+E: ID_FS_TYPE=xfs
+E: DEVLINKS=/dev/disk/by-path/pci-0000:00:04.0-part1 /dev/disk/by-uuid/4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec
+E: TAGS=:systemd:
+
+P: /devices/virtual/net/lo
+E: DEVPATH=/devices/virtual/net/lo
+E: INTERFACE=lo
+E: IFINDEX=1
+E: SUBSYSTEM=net
+
+P: /devices/platform/serial8250
+M: serial8250
+U: platform
+E: DEVPATH=/devices/platform/serial8250
+E: DRIVER=serial8250
+E: MODALIAS=platform:serial8250
+'''
+
+
+def test_parse_udevadm_export():
+    devices = list(udevadminfo.parse_udevadm_export(UDEVADM_EXPORT.splitlines()))
+
+    assert [device.devpath for device in devices] == [
+        '/devices/pci0000:00/0000:00:04.0/virtio1/block/vda/vda1',
+        '/devices/virtual/net/lo',
+        '/devices/platform/serial8250',
+    ]
+    assert [device.subsystem for device in devices] == ['block', 'net', 'platform']
+    assert [device.devname for device in devices] == ['/dev/vda1', None, None]
+    assert devices[0].devlinks == [
+        '/dev/disk/by-path/pci-0000:00:04.0-part1',
+        '/dev/disk/by-uuid/4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec',
+    ]
+    assert not devices[1].devlinks
+    # properties duplicating other fields are not stored
+    assert [prop.name for prop in devices[0].properties] == [
+        'DEVTYPE', 'MAJOR', 'MINOR', 'ID_PATH', 'ID_FS_UUID', 'ID_FS_TYPE', 'TAGS'
+    ]
+    assert devices[2].properties == [
+        UdevProperty(name='DRIVER', value='serial8250'),
+        UdevProperty(name='MODALIAS', value='platform:serial8250'),
+    ]
+
+
+def test_parse_udevadm_export_empty():
+    assert not list(udevadminfo.parse_udevadm_export([]))
+    assert not list(udevadminfo.parse_udevadm_export(['', '']))
+
+
+@pytest.mark.parametrize('debug', [True, False])
+def test_process(monkeypatch, debug):
+    monkeypatch.setattr(udevadminfo, 'run', lambda cmd: {'stdout': UDEVADM_EXPORT})
+    monkeypatch.setattr(udevadminfo.config, 'is_debug', lambda: debug)
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    monkeypatch.setattr(api, 'produce', produce_mocked())
+
+    udevadminfo.process()
+
+    assert api.produce.called == 1
+    udevadm_info = api.produce.model_instances[0]
+    assert len(udevadm_info.devices) == 3
+    assert udevadm_info.db == (UDEVADM_EXPORT if debug else None)
@@ -1,4 +1,8 @@
+import errno
+import fcntl
 import os
+import platform
+import struct
 
 from leapp.libraries.stdlib import api, CalledProcessError, run
 from leapp.models import StorageInfo, XFSPresence
@@ -22,6 +26,107 @@ def scan_xfs_mount(data):
     return mountpoints
 
 
+# struct xfs_fsop_geom_v1 from xfs_fs.h; it is 112 bytes long and its 'flags' member is at offset 92
+_XFS_FSOP_GEOM_V1_SIZE = 112
+_XFS_FSOP_GEOM_FLAGS_OFFSET = 92
+_XFS_FSOP_GEOM_FLAGS_FTYPE = 0x10000
+
+# on-disk superblock (struct xfs_dsb), all values are big-endian
+_XFS_SB_MAGIC = b'XFSB'
+_XFS_SB_SIZE = 512
+_XFS_SB_VERSIONNUM_OFFSET = 100
+_XFS_SB_FEATURES2_OFFSET = 200
+_XFS_SB_VERSION_NUMBITS = 0x000f
+_XFS_SB_VERSION_MOREBITSBIT = 0x8000
+_XFS_SB_VERSION_5 = 5
+_XFS_SB_VERSION2_FTYPE = 0x0200
+
+
+def _ioc_read(ioc_type, nr, size):
+    """
+    Compute the request number of an _IOR() ioctl for the current architecture
+    """
+    # the direction bits are placed differently on powerpc
+    dir_shift = 29 if platform.machine().startswith('ppc') else 30
+    return (2 << dir_shift) | (size << 16) | (ord(ioc_type) << 8) | nr
+
+
+XFS_IOC_FSGEOMETRY_V1 = _ioc_read('X', 100, _XFS_FSOP_GEOM_V1_SIZE)
+
+
+def _get_ftype_from_geometry(mp):
+    """
+    Ask the kernel for the geometry of the XFS filesystem mounted on mp
+
+    Return True if the filesystem has ftype enabled, False if not, or None if
+    the geometry cannot be obtained (e.g. mp is not XFS).
+    """
+    try:
+        fd = os.open(mp, os.O_RDONLY)
+    except OSError as err:
+        api.current_logger().debug('Cannot open {}: {}'.format(mp, err))
+        return None
+    try:
+        geometry = bytearray(_XFS_FSOP_GEOM_V1_SIZE)
+        fcntl.ioctl(fd, XFS_IOC_FSGEOMETRY_V1, geometry, True)
+    except (IOError, OSError) as err:
+        if err.errno not in (errno.ENOTTY, errno.EINVAL, errno.EOPNOTSUPP):
+            api.current_logger().debug('XFS geometry ioctl failed on {}: {}'.format(mp, err))
+        return None
+    finally:
+        os.close(fd)
+
+    flags = struct.unpack_from('=I', bytes(geometry), _XFS_FSOP_GEOM_FLAGS_OFFSET)[0]
+    return bool(flags & _XFS_FSOP_GEOM_FLAGS_FTYPE)
+
+
+def _parse_superblock_ftype(sb):
+    """
+    Return whether the given XFS superblock has ftype enabled, None if it is not an XFS superblock
+    """
+    if len(sb) < _XFS_SB_SIZE or sb[:4] != _XFS_SB_MAGIC:
+        return None
+    versionnum = struct.unpack_from('>H', sb, _XFS_SB_VERSIONNUM_OFFSET)[0]
+    if versionnum & _XFS_SB_VERSION_NUMBITS >= _XFS_SB_VERSION_5:
+        # ftype is mandatory on v5 (crc enabled) filesystems
+        return True
+    if not versionnum & _XFS_SB_VERSION_MOREBITSBIT:
+        return False
+    features2 = struct.unpack_from('>I', sb, _XFS_SB_FEATURES2_OFFSET)[0]
+    return bool(features2 & _XFS_SB_VERSION2_FTYPE)
+
+
+def _get_ftype_from_superblock(mp):
+    """
+    Read the primary superblock of the device backing mp
+
+    Return True if the filesystem has ftype enabled, False if not, or None if
+    the superblock cannot be read.
+    """
+    try:
+        st_dev = os.stat(mp).st_dev
+        device = '/dev/block/{}:{}'.format(os.major(st_dev), os.minor(st_dev))
+        with open(device, 'rb') as f:
+            sb = f.read(_XFS_SB_SIZE)
+    except (IOError, OSError) as err:
+        api.current_logger().debug('Cannot read the XFS superblock for {}: {}'.format(mp, err))
+        return None
+    return _parse_superblock_ftype(sb)
+
+
+def _get_xfs_ftype(mp):
+    """
+    Find out in-process whether the XFS filesystem mounted on mp has ftype enabled
+
+    The geometry ioctl is used primarily, the on-disk superblock is read when
+    the ioctl is not available. None is returned when neither works.
+    """
+    ftype = _get_ftype_from_geometry(mp)
+    if ftype is None:
+        ftype = _get_ftype_from_superblock(mp)
+    return ftype
+
+
 def is_xfs_without_ftype(mp):
     if not os.path.ismount(mp):
         # Check if mp is actually a mountpoint
@@ -40,6 +145,27 @@ def is_xfs_without_ftype(mp):
     return False
 
 
+def get_xfs_without_ftype(mountpoints):
+    """
+    Return the mountpoints (from the given ones) with XFS using ftype = 0
+
+    The ftype is detected in-process for all mountpoints; xfs_info is executed
+    only for mountpoints where that is not possible.
+    """
+    result = []
+    for mp in mountpoints:
+        if not os.path.ismount(mp):
+            api.current_logger().warning('{} is not mounted'.format(mp))
+            continue
+        ftype = _get_xfs_ftype(mp)
+        if ftype is None:
+            if is_xfs_without_ftype(mp):
+                result.append(mp)
+        elif not ftype:
+            result.append(mp)
+    return result
+
+
 def scan_xfs():
     storage_info_msgs = api.consume(StorageInfo)
     storage_info = next(storage_info_msgs, None)
@@ -54,7 +180,7 @@ def scan_xfs():
         mount_data = scan_xfs_mount(storage_info.mount)
 
     mountpoints = fstab_data | mount_data
-    mountpoints_ftype0 = list(filter(is_xfs_without_ftype, mountpoints))
+    mountpoints_ftype0 = get_xfs_without_ftype(mountpoints)
 
     # By now, we only have XFS mountpoints and check whether or not it has ftype = 0
     api.produce(XFSPresence(
@@ -1,4 +1,5 @@
 import os
+import struct
 
 from leapp.libraries.actor import xfsinfoscanner
 from leapp.libraries.common.testutils import produce_mocked
@@ -111,8 +112,58 @@ def test_is_xfs_command_failed(monkeypatch):
     assert not xfsinfoscanner.is_xfs_without_ftype("/nosuchmountpoint")
 
 
+def _superblock(version, features2=0):
+    sb = bytearray(xfsinfoscanner._XFS_SB_SIZE)
+    sb[:4] = b'XFSB'
+    struct.pack_into('>H', sb, xfsinfoscanner._XFS_SB_VERSIONNUM_OFFSET, version)
+    struct.pack_into('>I', sb, xfsinfoscanner._XFS_SB_FEATURES2_OFFSET, features2)
+    return bytes(sb)
+
+
+def test_parse_superblock_ftype():
+    assert xfsinfoscanner._parse_superblock_ftype(_superblock(0xb4a5, 0x28a))
+    assert not xfsinfoscanner._parse_superblock_ftype(_superblock(0xb4a4, 0x8a))
+    assert not xfsinfoscanner._parse_superblock_ftype(_superblock(0x34a4, 0x28a))
+    assert xfsinfoscanner._parse_superblock_ftype(_superblock(0xb4a4, 0x28a))
+    assert xfsinfoscanner._parse_superblock_ftype(b'\0' * 512) is None
+    assert xfsinfoscanner._parse_superblock_ftype(b'XFSB') is None
+
+
+def test_get_ftype_from_geometry(monkeypatch):
+    def ioctl_mocked(flags):
+        def _ioctl(fd, request, buf, mutate):
+            assert request == xfsinfoscanner.XFS_IOC_FSGEOMETRY_V1
+            struct.pack_into('=I', buf, xfsinfoscanner._XFS_FSOP_GEOM_FLAGS_OFFSET, flags)
+            return 0
+        return _ioctl
+
+    monkeypatch.setattr(xfsinfoscanner.fcntl, 'ioctl', ioctl_mocked(0x1cf91))
+    assert xfsinfoscanner._get_ftype_from_geometry('/') is True
+    monkeypatch.setattr(xfsinfoscanner.fcntl, 'ioctl', ioctl_mocked(0xcf91))
+    assert xfsinfoscanner._get_ftype_from_geometry('/') is False
+
+    def ioctl_not_xfs(fd, request, buf, mutate):
+        raise IOError(25, 'Inappropriate ioctl for device')
+
+    monkeypatch.setattr(xfsinfoscanner.fcntl, 'ioctl', ioctl_not_xfs)
+    assert xfsinfoscanner._get_ftype_from_geometry('/') is None
+
+
+def test_get_xfs_without_ftype(monkeypatch):
+    ftypes = {'/': True, '/var': False, '/boot': None, '/srv': None}
+    monkeypatch.setattr(xfsinfoscanner, '_get_xfs_ftype', ftypes.get)
+    monkeypatch.setattr(xfsinfoscanner, 'run', run_mocked())
+    monkeypatch.setattr(os.path, 'ismount', lambda mp: mp != '/srv')
+
+    assert xfsinfoscanner.get_xfs_without_ftype(['/', '/var', '/boot', '/srv']) == ['/var']
+    # xfs_info is executed only for the mountpoint that could not be probed in-process
+    assert xfsinfoscanner.run.called == 1
+    assert xfsinfoscanner.run.args == ['/usr/sbin/xfs_info', '/boot']
+
+
 def test_scan_xfs(monkeypatch):
     monkeypatch.setattr(xfsinfoscanner, "run", run_mocked())
+    monkeypatch.setattr(xfsinfoscanner, "_get_xfs_ftype", lambda mp: None)
     monkeypatch.setattr(os.path, "ismount", lambda _: True)
 
     def consume_no_xfs_message_mocked(*models):
@@ -1,13 +1,27 @@
 # plugin inspired by "system_upgrade.py" from rpm-software-management
 from __future__ import print_function
 
+import hashlib
 import json
 import logging
+import os
 import sys
+import time
 
 import dnf
+import dnf.callback
 import dnf.cli
 import dnf.module.module_base
+import dnf.selector
+import dnf.util
+import hawkey
+
+try:
+    import libdnf.transaction
+    from dnf import transaction_sr
+except ImportError:
+    # the transaction store/replay is not available in this DNF version
+    transaction_sr = None
 
 CMDS = ['check', 'download', 'dry-run', 'upgrade']
 """
@@ -35,6 +49,135 @@ def _do_not_download_packages(packages, progress=None, total=None):
     raise DoNotDownload()
 
 
+class _DownloadManifest(object):
+    """
+    Record of packages downloaded and verified by previous download attempts
+
+    A package is considered downloaded only while its file in the cache is
+    not modified, so missing and modified packages are downloaded again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if not path:
+            return
+        try:
+            with open(path) as fo:
+                self.entries = json.load(fo)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def _key(pkg):
+        return '{}:{}'.format(pkg.reponame, pkg.location)
+
+    @staticmethod
+    def _entry(pkg):
+        try:
+            stat = os.stat(pkg.localPkg())
+        except OSError:
+            return None
+        return {'checksum': pkg.returnIdSum()[1], 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def add(self, pkg):
+        entry = self._entry(pkg)
+        if entry and entry['size'] == pkg.downloadsize:
+            self.entries[self._key(pkg)] = entry
+
+    def verify(self, pkg):
+        """
+        Return whether the package is downloaded
+
+        The file of a package modified since it has been recorded is removed,
+        so it is downloaded again instead of being resumed.
+        """
+        entry = self.entries.pop(self._key(pkg), None)
+        if entry is None:
+            return False
+        current = self._entry(pkg)
+        if entry != current:
+            if current is not None:
+                os.unlink(pkg.localPkg())
+            return False
+        self.entries[self._key(pkg)] = entry
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, 'w') as fo:
+            json.dump(self.entries, fo, sort_keys=True, indent=2)
+
+
+class _DownloadStats(dnf.callback.DownloadProgress):
+    """
+    Download progress collecting per repository statistics
+
+    All calls are passed to the original download progress. Successfully
+    downloaded packages are added to the download manifest.
+    """
+
+    def __init__(self, progress, manifest):
+        super(_DownloadStats, self).__init__()
+        self.orig_progress = progress or dnf.callback.NullDownloadProgress()
+        self.manifest = manifest
+        self.repos = {}
+        self._started = {}
+
+    def _repo_stats(self, repoid):
+        return self.repos.setdefault(repoid, {
+            'downloaded': 0, 'downloaded_bytes': 0, 'skipped': 0, 'skipped_bytes': 0,
+            'failed': 0, 'start': None, 'end': None,
+        })
+
+    def skip(self, pkg):
+        stats = self._repo_stats(pkg.reponame)
+        stats['skipped'] += 1
+        stats['skipped_bytes'] += pkg.downloadsize
+
+    def start(self, total_files, total_size, total_drpms=0):
+        self.orig_progress.start(total_files, total_size, total_drpms)
+
+    def progress(self, payload, done):
+        self._started.setdefault(payload, time.time())
+        self.orig_progress.progress(payload, done)
+
+    def end(self, payload, status, msg):
+        pkg = getattr(payload, 'pkg', None)
+        if pkg is not None:
+            now = time.time()
+            stats = self._repo_stats(pkg.reponame)
+            started = self._started.pop(payload, now)
+            stats['start'] = min(started, stats['start'] or started)
+            stats['end'] = max(now, stats['end'] or now)
+            if status is dnf.callback.STATUS_OK:
+                stats['downloaded'] += 1
+                stats['downloaded_bytes'] += pkg.downloadsize
+                self.manifest.add(pkg)
+            elif status == dnf.callback.STATUS_ALREADY_EXISTS:
+                self.skip(pkg)
+                self.manifest.add(pkg)
+            elif status == dnf.callback.STATUS_FAILED:
+                stats['failed'] += 1
+        self.orig_progress.end(payload, status, msg)
+
+    def get_summary(self):
+        summary = {}
+        for repoid, stats in self.repos.items():
+            seconds = stats['end'] - stats['start'] if stats['start'] is not None else 0.0
+            summary[repoid] = {
+                'downloaded': stats['downloaded'],
+                'downloaded_bytes': stats['downloaded_bytes'],
+                'skipped': stats['skipped'],
+                'skipped_bytes': stats['skipped_bytes'],
+                'failed': stats['failed'],
+                'seconds': round(seconds, 3),
+                'bytes_per_second': int(stats['downloaded_bytes'] / seconds) if seconds > 0 else None,
+            }
+        return summary
+
+
 class RhelUpgradeCommand(dnf.cli.Command):
     aliases = ('rhel-upgrade',)
     summary = 'Plugin for upgrading to the next RHEL major release'
@@ -42,6 +185,8 @@ class RhelUpgradeCommand(dnf.cli.Command):
     def __init__(self, cli):
         super(RhelUpgradeCommand, self).__init__(cli)
         self.plugin_data = {}
+        self.fingerprint = None
+        self.replay = None
 
     @staticmethod
     def set_argparser(parser):
@@ -49,13 +194,105 @@ class RhelUpgradeCommand(dnf.cli.Command):
                             metavar="[%s]" % "|".join(CMDS))
         parser.add_argument('filename')
 
-    def _process_entities(self, entities, op, entity_name):
+    def _resolve_names(self, specs):
+        """
+        Find packages for specs which are package names, using a single query
+
+        DNF resolves a spec as a package name only when it cannot be parsed as
+        NEVRA or NA of an existing package. Such specs, as well as globs and
+        specs not matching any package name, are skipped so they are resolved
+        by DNF itself.
+
+        :return: Dictionary mapping the specs to packages with such name
+        """
+        candidates = [spec for spec in specs if isinstance(spec, str) and not dnf.util.is_glob_pattern(spec)]
+        possibilities = {}
+        names = set(candidates)
+        for spec in candidates:
+            subject = hawkey.Subject(spec)
+            possibilities[spec] = list(subject.get_nevra_possibilities(forms=[hawkey.FORM_NEVRA, hawkey.FORM_NA]))
+            names.update(nevra.name for nevra in possibilities[spec])
+
+        packages = {}
+        for pkg in self.base.sack.query().filterm(name=list(names)):
+            packages.setdefault(pkg.name, []).append(pkg)
+
+        def _matches(nevra):
+            attrs = ('epoch', 'version', 'release', 'arch')
+            return any(
+                all(getattr(nevra, attr) in (None, getattr(pkg, attr)) for attr in attrs)
+                for pkg in packages.get(nevra.name, ())
+            )
+
+        return {
+            spec: packages[spec] for spec in candidates
+            if spec in packages and not any(_matches(nevra) for nevra in possibilities[spec])
+        }
+
+    def _install_bulk(self, specs):
+        """
+        Mark packages to install for specs which are package names
+
+        The same selectors as by base.install() are added to the goal, but the
+        packages are looked up by batched queries.
+
+        :return: Dictionary mapping processed specs to whether they were found
+        """
+        if self.base.conf.multilib_policy != 'best':
+            return {}
+        resolved = self._resolve_names(specs)
+        for spec, pkgs in list(resolved.items()):
+            resolved[spec] = [pkg for pkg in pkgs if pkg.arch != 'src']
+            if not resolved[spec]:
+                # leave reporting of source-only packages to DNF
+                del resolved[spec]
+
+        obsoleters = None
+        if self.base.conf.obsoletes and resolved:
+            all_pkgs = self.base.sack.query().filterm(pkg=[pkg for pkgs in resolved.values() for pkg in pkgs])
+            obsoleters = self.base.sack.query().filterm(obsoletes=all_pkgs)
+
+        for pkgs in resolved.values():
+            query = self.base.sack.query().filterm(pkg=pkgs)
+            if obsoleters:
+                query = query.union(obsoleters.filter(obsoletes=query))
+            # report 'Package ... is already installed.' like base.install() does
+            self.base._report_already_installed(query.installed())
+            selector = dnf.selector.Selector(self.base.sack)
+            selector.set(pkg=query)
+            self.base._goal.install(select=selector, optional=False)
+        return dict.fromkeys(resolved, True)
+
+    def _remove_bulk(self, specs):
+        """
+        Mark packages to remove for specs which are package names
+
+        :return: Dictionary mapping processed specs to whether they were found
+        """
+        clean_deps = self.base.conf.clean_requirements_on_remove
+        processed = {}
+        for spec, pkgs in self._resolve_names(specs).items():
+            installed = [pkg for pkg in pkgs if pkg.reponame == hawkey.SYSTEM_REPO_NAME]
+            for pkg in installed:
+                self.base._goal.erase(pkg, clean_deps=clean_deps)
+            processed[spec] = bool(installed)
+        return processed
+
+    def _process_entities(self, entities, op, entity_name, bulk_op=None):
         """
         Adds list of packages for given operation to the transaction
+
+        If bulk_op is given, it is used to process as many entities as possible
+        at once, the rest is processed one by one using op.
         """
         entities_notfound = []
+        processed = bulk_op(entities) if bulk_op else {}
 
         for spec in entities:
+            if isinstance(spec, str) and spec in processed:
+                if not processed[spec]:
+                    entities_notfound.append(spec)
+                continue
             try:
                 op(spec)
             except dnf.exceptions.MarkingError:
@@ -97,6 +334,168 @@ class RhelUpgradeCommand(dnf.cli.Command):
             raise dnf.exceptions.RepoError("RHUI repository %s does not have an url" % repo.name)
         return repo
 
+    def _get_transaction_path(self):
+        if transaction_sr is None:
+            return None
+        return self.plugin_data['dnf_conf'].get('transaction_path')
+
+    def _get_fingerprint(self):
+        """
+        Compute a fingerprint of all the inputs the transaction is resolved from
+
+        It covers the package and module tasks, metadata of enabled repositories
+        and installed packages. None is returned if the repository metadata
+        cannot be identified.
+        """
+        checksum = hashlib.sha256()
+        checksum.update(json.dumps(self.plugin_data['pkgs_info'], sort_keys=True).encode('utf-8'))
+        try:
+            for repo in sorted(self.base.repos.iter_enabled(), key=lambda r: r.id):
+                # the names of metadata files contain their checksums
+                repo_info = [repo.id, repo._repo.getRevision(), str(repo._repo.getMaxTimestamp()),
+                             os.path.basename(repo._repo.getMetadataPath('primary'))]
+                checksum.update('\n'.join(repo_info).encode('utf-8'))
+        except (AttributeError, RuntimeError) as e:
+            print('Cannot identify metadata of repositories: {}'.format(e), file=sys.stderr)
+            return None
+        for nevra in sorted(str(pkg) for pkg in self.base.sack.query().installed()):
+            checksum.update(nevra.encode('utf-8'))
+        return checksum.hexdigest()
+
+    def _store_transaction(self):
+        """
+        Store the resolved transaction in the format of the DNF transaction store/replay
+        """
+        rpms = []
+        for tsi in self.base.transaction:
+            rpms.append({
+                'action': libdnf.transaction.TransactionItemActionToString(tsi.action),
+                'nevra': str(tsi.pkg),
+                'reason': libdnf.transaction.TransactionItemReasonToString(tsi.reason),
+                'repo_id': tsi.pkg.reponame,
+            })
+        data = {
+            'fingerprint': self.fingerprint,
+            'transaction': {
+                'version': '{}.{}'.format(transaction_sr.VERSION_MAJOR, transaction_sr.VERSION_MINOR),
+                'rpms': rpms,
+                'groups': [],
+                'environments': [],
+            },
+        }
+        with open(self._get_transaction_path(), 'w') as fo:
+            json.dump(data, fo, sort_keys=True, indent=2)
+
+    def _load_transaction(self):
+        """
+        Load the transaction stored in the download stage if it is still valid
+
+        :return: The stored transaction or None if it cannot be replayed
+        """
+        try:
+            with open(self._get_transaction_path()) as fo:
+                data = json.load(fo)
+        except (IOError, OSError, ValueError):
+            return None
+        if not self.fingerprint or data.get('fingerprint') != self.fingerprint:
+            print('The stored transaction is outdated, the transaction is going to be resolved again.')
+            return None
+        return data['transaction']
+
+    def _replay_transaction(self):
+        """
+        Mark packages of the transaction stored in the download stage
+
+        :return: True if the stored transaction has been replayed
+        """
+        transaction = self._load_transaction()
+        if transaction is None:
+            return False
+        try:
+            self.replay = transaction_sr.TransactionReplay(self.base, data=transaction)
+            self.replay.run()
+        except dnf.exceptions.Error as e:
+            print('Cannot replay the stored transaction, the transaction is going to be resolved again: '
+                  '{}'.format(e), file=sys.stderr)
+            self.replay = None
+            self.base.reset(goal=True)
+            return False
+        print('Replaying the transaction resolved in the download stage.')
+        return True
+
+    def _configure_download(self):
+        """
+        Set up the parallelism and retries of the package download
+
+        Options which are not set in the plugin data keep the DNF defaults.
+        """
+        download_conf = self.plugin_data.get('download', {})
+        if download_conf.get('max_parallel_downloads'):
+            self.base.conf.max_parallel_downloads = download_conf['max_parallel_downloads']
+        if download_conf.get('retries') is not None:
+            self.base.conf.retries = download_conf['retries']
+        if download_conf.get('repo_max_parallel_downloads'):
+            for repo in self.base.repos.iter_enabled():
+                repo.max_parallel_downloads = download_conf['repo_max_parallel_downloads']
+        self.base.download_packages = self._download_packages
+
+    def _store_download_stats(self, stats, attempts):
+        path = self.plugin_data.get('download', {}).get('stats_path')
+        summary = stats.get_summary()
+        for repoid, repo_stats in sorted(summary.items()):
+            print('Repository {}: downloaded {} packages ({} B) in {} s, {} packages ({} B) already downloaded'.format(
+                repoid, repo_stats['downloaded'], repo_stats['downloaded_bytes'], repo_stats['seconds'],
+                repo_stats['skipped'], repo_stats['skipped_bytes']))
+        if not path:
+            return
+        with open(path, 'w') as fo:
+            json.dump({'attempts': attempts, 'repos': summary}, fo, sort_keys=True, indent=2)
+
+    def _download_packages(self, pkglist, progress=None, callback_total=None):
+        """
+        Download packages which have not been downloaded by a previous attempt
+
+        Packages recorded in the download manifest which files have not been
+        modified since are skipped, the rest is downloaded by DNF (which also
+        verifies packages already present in the cache). When the
+        download fails, it is attempted again for the packages that have not
+        been downloaded yet.
+        """
+        download_conf = self.plugin_data.get('download', {})
+        manifest = _DownloadManifest(download_conf.get('manifest_path'))
+        stats = _DownloadStats(progress, manifest)
+        remote_pkgs = []
+        for pkg in pkglist:
+            if pkg._is_local_pkg() or not manifest.verify(pkg):
+                remote_pkgs.append(pkg)
+            else:
+                stats.skip(pkg)
+        if len(remote_pkgs) < len(pkglist):
+            print('Skipping download of {} packages downloaded previously.'.format(len(pkglist) - len(remote_pkgs)))
+
+        attempts = max(download_conf.get('attempts', 1), 1)
+        attempt = 0
+        try:
+            while remote_pkgs:
+                attempt += 1
+                try:
+                    dnf.Base.download_packages(self.base, remote_pkgs, stats, callback_total)
+                except dnf.exceptions.DownloadError:
+                    if attempt >= attempts:
+                        raise
+                    remote_pkgs = [pkg for pkg in remote_pkgs if not manifest.verify(pkg)]
+                    print('Download of packages failed, attempting to download {} remaining packages again.'
+                          .format(len(remote_pkgs)), file=sys.stderr)
+                    continue
+                for pkg in remote_pkgs:
+                    # all the packages are downloaded and verified now
+                    if not pkg._is_local_pkg():
+                        manifest.add(pkg)
+                break
+        finally:
+            manifest.save()
+            self._store_download_stats(stats, attempt)
+
     def pre_configure(self):
         with open(self.opts.filename) as fo:
             self.plugin_data = json.load(fo)
@@ -156,12 +555,15 @@ class RhelUpgradeCommand(dnf.cli.Command):
         if aws_region and self.opts.tid[0] == 'download':
             self._save_aws_region(aws_region)
 
+        if self.opts.tid[0] == 'download':
+            self._configure_download()
+
     def run(self):
         # takes local rpms, creates Package objects from them, and then adds them to the sack as virtual repository
         local_rpm_objects = self.base.add_remote_rpms(self.plugin_data['pkgs_info']['local_rpms'])
 
-        for pkg in local_rpm_objects:
-            self.base.package_install(pkg)
+        if self._get_transaction_path() and self.opts.tid[0] in ['download', 'dry-run', 'upgrade']:
+            self.fingerprint = self._get_fingerprint()
 
         module_base = dnf.module.module_base.ModuleBase(self.base)
 
@@ -180,20 +582,29 @@ class RhelUpgradeCommand(dnf.cli.Command):
             msg = 'The following modules were requested to be enabled, but they are unavailable: %s'
             dnf_plugin_logger.warning(msg, ', '.join(unavailable_modules))
 
-        # Package tasks
-        to_install = self.plugin_data['pkgs_info']['to_install']
-        to_remove = self.plugin_data['pkgs_info']['to_remove']
-        to_upgrade = self.plugin_data['pkgs_info']['to_upgrade']
-
         # Modules to enable
         self._process_entities(entities=[available_modules_to_enable],
                                op=module_base.enable,
                                entity_name='Module stream')
 
+        if self.opts.tid[0] in ['dry-run', 'upgrade'] and self.fingerprint and self._replay_transaction():
+            # the stored transaction contains all the packages, including the local ones
+            return
+
+        for pkg in local_rpm_objects:
+            self.base.package_install(pkg)
+
+        # Package tasks
+        to_install = self.plugin_data['pkgs_info']['to_install']
+        to_remove = self.plugin_data['pkgs_info']['to_remove']
+        to_upgrade = self.plugin_data['pkgs_info']['to_upgrade']
+
         # Packages to be removed
-        self._process_entities(entities=to_remove, op=self.base.remove, entity_name='Package')
+        self._process_entities(entities=to_remove, op=self.base.remove, entity_name='Package',
+                               bulk_op=self._remove_bulk)
         # Packages to be installed
-        self._process_entities(entities=to_install, op=self.base.install, entity_name='Package')
+        self._process_entities(entities=to_install, op=self.base.install, entity_name='Package',
+                               bulk_op=self._install_bulk)
         # Packages to be upgraded
         self._process_entities(entities=to_upgrade, op=self.base.upgrade, entity_name='Package')
         self.base.distro_sync()
@@ -216,6 +627,14 @@ class RhelUpgradeCommand(dnf.cli.Command):
             except DoNotDownload:
                 print('Check completed.')
 
+    def run_resolved(self):
+        if self.opts.tid[0] == 'download' and self.fingerprint:
+            self._store_transaction()
+
+    def run_transaction(self):
+        if self.replay:
+            self.replay.post_transaction()
+
 
 class RhelUpgradePlugin(dnf.Plugin):
     name = 'rhel-upgrade'
@@ -1,4 +1,5 @@
 import contextlib
+import errno
 import itertools
 import json
 import os
@@ -52,6 +53,13 @@ DNF_PLUGIN_DATA_NAME = 'dnf-plugin-data.txt'
 DNF_PLUGIN_DATA_PATH = os.path.join('/var/lib/leapp', DNF_PLUGIN_DATA_NAME)
 DNF_PLUGIN_DATA_LOG_PATH = os.path.join('/var/log/leapp', DNF_PLUGIN_DATA_NAME)
 DNF_DEBUG_DATA_PATH = '/var/log/leapp/dnf-debugdata/'
+DNF_PLUGIN_TRANSACTION_NAME = 'dnf-plugin-transaction.json'
+DNF_PLUGIN_TRANSACTION_PATH = os.path.join('/var/lib/leapp', DNF_PLUGIN_TRANSACTION_NAME)
+DNF_PLUGIN_DOWNLOAD_MANIFEST_NAME = 'dnf-plugin-download-manifest.json'
+DNF_PLUGIN_DOWNLOAD_MANIFEST_PATH = os.path.join('/var/lib/leapp', DNF_PLUGIN_DOWNLOAD_MANIFEST_NAME)
+DNF_PLUGIN_DOWNLOAD_STATS_NAME = 'dnf-plugin-download-stats.json'
+DNF_PLUGIN_DOWNLOAD_STATS_PATH = os.path.join('/var/lib/leapp', DNF_PLUGIN_DOWNLOAD_STATS_NAME)
+_DEFAULT_DOWNLOAD_ATTEMPTS = 3
 
 
 def install(target_basedir):
@@ -78,9 +86,66 @@ def _rebuild_rpm_db(context, root=None):
     context.call(cmd)
 
 
+def _replay_transaction():
+    """
+    Whether the transaction resolved in the download stage should be replayed in later stages
+    """
+    return get_env('LEAPP_DNF_REPLAY_TRANSACTION', '0') == '1'
+
+
+def _get_int_env(name, minimum):
+    """
+    Return the integer value of the given envar or None when it is not set or invalid
+    """
+    env_value = get_env(name, None)
+    if env_value is None:
+        return None
+    try:
+        value = int(env_value)
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        api.current_logger().warning(
+            'Invalid "{}" environment variable "{}". Using the default.'.format(name, env_value)
+        )
+        return None
+    return value
+
+
+def _get_download_conf():
+    """
+    Return parameters of the package download performed by the plugin
+
+    The parameters can be set by envars:
+        LEAPP_DNF_MAX_PARALLEL_DOWNLOADS - max parallel downloads in total
+        LEAPP_DNF_REPO_MAX_PARALLEL_DOWNLOADS - max parallel downloads per repository
+        LEAPP_DNF_DOWNLOAD_RETRIES - number of retries of a failed package download
+        LEAPP_DNF_DOWNLOAD_ATTEMPTS - number of attempts to download all packages
+    The DNF defaults are used for parameters which are not set.
+    """
+    attempts = _get_int_env('LEAPP_DNF_DOWNLOAD_ATTEMPTS', 1)
+    return {
+        'max_parallel_downloads': _get_int_env('LEAPP_DNF_MAX_PARALLEL_DOWNLOADS', 1),
+        'repo_max_parallel_downloads': _get_int_env('LEAPP_DNF_REPO_MAX_PARALLEL_DOWNLOADS', 1),
+        'retries': _get_int_env('LEAPP_DNF_DOWNLOAD_RETRIES', 0),
+        'attempts': attempts or _DEFAULT_DOWNLOAD_ATTEMPTS,
+        'manifest_path': DNF_PLUGIN_DOWNLOAD_MANIFEST_PATH,
+        'stats_path': DNF_PLUGIN_DOWNLOAD_STATS_PATH,
+    }
+
+
 def build_plugin_data(target_repoids, debug, test, tasks, on_aws):
     """
     Generates a dictionary with the DNF plugin data.
+
+    When LEAPP_DNF_REPLAY_TRANSACTION=1 is set, the plugin is instructed to
+    store the transaction resolved in the download stage to
+    DNF_PLUGIN_TRANSACTION_PATH and to replay it in the dry-run and upgrade
+    stages instead of resolving it again.
+
+    Packages downloaded in the download stage are recorded in
+    DNF_PLUGIN_DOWNLOAD_MANIFEST_PATH, so a repeated download stage fetches
+    only packages that are missing or modified in the cache.
     """
     # get list of repo IDs of target repositories that should be used for upgrade
     data = {
@@ -101,8 +166,10 @@ def build_plugin_data(target_repoids, debug, test, tasks, on_aws):
             'platform_id': 'platform:el{}'.format(get_target_major_version()),
             'releasever': get_target_version(),
             'installroot': '/installroot',
-            'test_flag': test
+            'test_flag': test,
+            'transaction_path': DNF_PLUGIN_TRANSACTION_PATH if _replay_transaction() else None,
         },
+        'download': _get_download_conf(),
         'rhui': {
             'aws': {
               'on_aws': on_aws,
@@ -125,6 +192,68 @@ def create_config(context, target_repoids, debug, test, tasks, on_aws=False):
         json.dump(config_data, f, sort_keys=True, indent=2)
 
 
+def _remove_stored_transaction(context):
+    """
+    Removes the transaction stored by the plugin during a previous download stage.
+    """
+    try:
+        context.remove(DNF_PLUGIN_TRANSACTION_PATH)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _remove_download_stats(context):
+    """
+    Removes the download statistics stored by the plugin during a previous download stage.
+    """
+    try:
+        context.remove(DNF_PLUGIN_DOWNLOAD_STATS_PATH)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return '{:.1f} {}'.format(size, unit)
+        size /= 1024.0
+    return '{:.1f} GiB'.format(size)
+
+
+def _log_download_stats(context):
+    """
+    Logs per repository statistics of the package download stored by the plugin
+    """
+    try:
+        with context.open(DNF_PLUGIN_DOWNLOAD_STATS_PATH, 'r') as f:
+            stats = json.load(f)
+    except (IOError, OSError, ValueError):
+        api.current_logger().debug('Download statistics are not available.', exc_info=True)
+        return
+    for repoid, repo_stats in sorted(stats.get('repos', {}).items()):
+        throughput = 'n/a'
+        if repo_stats['bytes_per_second']:
+            throughput = '{}/s'.format(_format_size(repo_stats['bytes_per_second']))
+        api.current_logger().info(
+            'Repository {repoid}: downloaded {downloaded} packages ({downloaded_size}) in {seconds:.1f} s'
+            ' ({throughput}), {skipped} packages ({skipped_size}) downloaded previously, {failed} failed'
+            .format(
+                repoid=repoid,
+                downloaded=repo_stats['downloaded'],
+                downloaded_size=_format_size(repo_stats['downloaded_bytes']),
+                seconds=repo_stats['seconds'],
+                throughput=throughput,
+                skipped=repo_stats['skipped'],
+                skipped_size=_format_size(repo_stats['skipped_bytes']),
+                failed=repo_stats['failed'],
+            )
+        )
+    if stats.get('attempts', 0) > 1:
+        api.current_logger().info('Packages downloaded in {} attempts.'.format(stats['attempts']))
+
+
 def backup_config(context):
     """
     Backs up the configuration data used for the plugin.
@@ -251,6 +380,9 @@ def _transaction(context, stage, target_repoids, tasks, plugin_info, xfs_info,
             test=test, tasks=tasks,
             on_aws=on_aws
         )
+        # the transaction is stored again in the download stage
+        _remove_stored_transaction(context)
+        _remove_download_stats(context)
     backup_config(context=context)
 
     # FIXME: rhsm
@@ -314,6 +446,8 @@ def _transaction(context, stage, target_repoids, tasks, plugin_info, xfs_info,
         finally:
             if stage == 'check':
                 backup_debug_data(context=context)
+            elif stage == 'download':
+                _log_download_stats(context)
 
 
 @contextlib.contextmanager
@@ -546,14 +680,20 @@ def perform_dry_run(target_userspace_info,
                     on_aws=False):
     """
     Perform the dnf transaction test / dry-run using only cached data.
+
+    The dry-run is the last stage using the source overlay, so disk image
+    templates are removed afterwards.
     """
-    with _prepare_perform(used_repos=used_repos,
-                          target_userspace_info=target_userspace_info,
-                          xfs_info=xfs_info,
-                          storage_info=storage_info,
-                          target_iso=target_iso) as (context, overlay, target_repoids):
-        apply_workarounds(overlay.nspawn())
-        _transaction(
-            context=context, stage='dry-run', target_repoids=target_repoids, plugin_info=plugin_info, tasks=tasks,
-            test=True, on_aws=on_aws, xfs_info=xfs_info
-        )
+    try:
+        with _prepare_perform(used_repos=used_repos,
+                              target_userspace_info=target_userspace_info,
+                              xfs_info=xfs_info,
+                              storage_info=storage_info,
+                              target_iso=target_iso) as (context, overlay, target_repoids):
+            apply_workarounds(overlay.nspawn())
+            _transaction(
+                context=context, stage='dry-run', target_repoids=target_repoids, plugin_info=plugin_info,
+                tasks=tasks, test=True, on_aws=on_aws, xfs_info=xfs_info
+            )
+    finally:
+        overlaygen.cleanup_diskimage_templates(target_userspace_info.scratch)
@@ -1,6 +1,9 @@
+import hashlib
 import io  # Python2/Python3 compatible IO (open etc.)
 import json
+import marshal
 import os
+import sys
 
 import requests
 
@@ -14,6 +17,7 @@ SERVICE_HOST_DEFAULT = "https://cert.cloud.redhat.com"
 REQUEST_TIMEOUT = (5, 30)
 MAX_ATTEMPTS = 3
 ASSET_PROVIDED_DATA_STREAMS_FIELD = 'provided_data_streams'
+DATA_ASSET_CACHE_DIR = '/var/lib/leapp/data_asset_cache'
 
 
 def _get_hint(local_path):
@@ -194,14 +198,349 @@ def load_data_asset(actor_requesting_asset,
         msg = 'The {0} file (at {1}) is invalid - it does not contain a JSON object at the topmost level.'
         raise StopActorExecutionError(msg.format(asset_fulltext_name, asset_filename), details=error_hint)
 
+    api.produce(models.ConsumedDataAsset(filename=asset_filename,
+                                         fulltext_name=asset_fulltext_name,
+                                         docs_url=docs_url,
+                                         docs_title=docs_title,
+                                         provided_data_streams=_get_provided_data_streams(asset_contents)))
+
+    return asset_contents
+
+
+def _get_provided_data_streams(asset_contents):
     provided_data_streams = asset_contents.get(ASSET_PROVIDED_DATA_STREAMS_FIELD)
     if provided_data_streams and not isinstance(provided_data_streams, list):
         provided_data_streams = []  # The asset will be later reported as malformed
+    return provided_data_streams
+
+
+class _JSONStreamDecoder(object):
+    """
+    Incremental decoder of a JSON document read from a file object.
+
+    Only the data that are currently being decoded are kept in memory, so large documents
+    can be processed piece by piece.
+    """
+
+    _WHITESPACE = ' \t\n\r'
+    _DELIMITERS = _WHITESPACE + ',:]}'
+
+    def __init__(self, fileobj, chunk_size=65536):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_chunk(self):
+        if self._eof:
+            return False
+        chunk = self._fileobj.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # Drop the already decoded data
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or an empty string at the end of data."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._read_chunk():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def consume(self, expected_chars):
+        """Consume the next non-whitespace character and return it. It has to be one of expected_chars."""
+        char = self.peek()
+        if not char or char not in expected_chars:
+            raise ValueError('Expected one of {0!r} at position {1}'.format(expected_chars, self._pos))
+        self._pos += 1
+        return char
+
+    def decode_value(self):
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                # The value might be just incomplete
+                if not self._read_chunk():
+                    raise
+                continue
+            if (end == len(self._buffer) or self._buffer[end] not in self._DELIMITERS) and self._read_chunk():
+                # A value not followed by a delimiter (e.g. a number at the end of the buffer) might continue
+                # in the next chunk
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_streamed_json_object(fileobj, streamed_field, asset_contents):
+    """
+    Decode the top-level JSON object from fileobj, yielding items of its streamed_field list one by one.
+
+    All the other fields of the object are stored into the asset_contents dict. The streamed field
+    is stored there as well, however, it contains just the number of the items that have been yielded.
+
+    :raises ValueError: If the data are not a valid JSON.
+    :raises TypeError: If the top-level JSON value is not an object.
+    """
+    decoder = _JSONStreamDecoder(fileobj)
+    if decoder.peek() != '{':
+        decoder.decode_value()  # Raises ValueError if the data are not a JSON at all
+        raise TypeError('The top-level JSON value is not an object.')
+
+    decoder.consume('{')
+    if decoder.peek() == '}':
+        decoder.consume('}')
+    else:
+        while True:
+            key = decoder.decode_value()
+            decoder.consume(':')
+            if key == streamed_field and decoder.peek() == '[':
+                decoder.consume('[')
+                asset_contents[streamed_field] = 0
+                if decoder.peek() == ']':
+                    decoder.consume(']')
+                else:
+                    while True:
+                        item = decoder.decode_value()
+                        asset_contents[streamed_field] += 1
+                        yield item
+                        if decoder.consume(',]') == ']':
+                            break
+            else:
+                asset_contents[key] = decoder.decode_value()
+            if decoder.consume(',}') == '}':
+                break
+
+    if decoder.peek():
+        raise ValueError('Extra data found after the top-level JSON object.')
+
+
+def load_data_asset_streamed(actor_requesting_asset,
+                             asset_filename,
+                             asset_fulltext_name,
+                             docs_url,
+                             docs_title,
+                             streamed_field,
+                             item_handler,
+                             directory='/etc/leapp/files'):
+    """
+    Load the content of the data asset with given asset_filename incrementally.
+
+    The function behaves like :func:`load_data_asset`, however, the items of the top-level list field
+    streamed_field are decoded one by one and passed to the item_handler callable instead of being
+    loaded into memory all at once. This keeps the memory consumption low for large assets when the
+    caller drops majority of the items.
+
+    The :class:`leapp.model.ConsumedDataAsset` message is produced after the whole asset is processed.
+    Exceptions raised by item_handler are propagated to the caller immediately.
+
+    :param str streamed_field: Name of the top-level field containing the list of items to stream.
+    :param item_handler: A callable called with every item of the streamed_field list.
+    :param str directory: Directory that should contain the asset.
+    :returns: A dict with the asset contents except the streamed field, which contains just the number
+              of the processed items.
+    :raises StopActorExecutionError: In the same cases as :func:`load_data_asset`.
+    """
+    if models.ConsumedDataAsset not in actor_requesting_asset.produces:
+        raise StopActorExecutionError('The supplied `actor_requesting_asset` does not produce ConsumedDataAsset.')
+
+    if docs_url:
+        error_hint = {'hint': ('Read documentation at the following link for more information about how to retrieve '
+                               'the valid file: {0}'.format(docs_url))}
+    else:
+        error_hint = {'hint': _get_hint(os.path.join('/etc/leapp/files', asset_filename))}
+
+    api.current_logger().info(
+        'Attempting to load the asset {0} incrementally (data_stream={1})'
+        .format(asset_filename, get_consumed_data_stream_id())
+    )
+
+    local_path = os.path.join(directory, asset_filename)
+    if not os.path.exists(local_path):
+        _raise_error(local_path, "File {lp} does not exist.".format(lp=local_path))
+
+    asset_contents = {}
+    try:
+        with io.open(local_path, encoding='utf-8') as f:
+            if not os.fstat(f.fileno()).st_size:
+                _raise_error(local_path, "File {lp} exists but is empty".format(lp=local_path))
+            items = _iter_streamed_json_object(f, streamed_field, asset_contents)
+            while True:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                except ValueError:
+                    msg = 'The {0} file (at {1}) does not contain a valid JSON object.'
+                    raise StopActorExecutionError(msg.format(asset_fulltext_name, asset_filename),
+                                                  details=error_hint)
+                except TypeError:
+                    msg = 'The {0} file (at {1}) is invalid - it does not contain a JSON object at the topmost level.'
+                    raise StopActorExecutionError(msg.format(asset_fulltext_name, asset_filename),
+                                                  details=error_hint)
+                # Called outside of the exception handling above, so errors of the handler are not misreported
+                item_handler(item)
+    except EnvironmentError:
+        _raise_error(local_path, "File {lp} exists but couldn't be read".format(lp=local_path))
 
     api.produce(models.ConsumedDataAsset(filename=asset_filename,
                                          fulltext_name=asset_fulltext_name,
                                          docs_url=docs_url,
                                          docs_title=docs_title,
-                                         provided_data_streams=provided_data_streams))
+                                         provided_data_streams=_get_provided_data_streams(asset_contents)))
 
     return asset_contents
+
+
+class DataAssetCache(object):
+    """
+    Persistent cache of data compiled from a data asset.
+
+    Actors processing large data assets (e.g. PES events) can store the result of their processing
+    in the cache, so the following leapp executions do not need to parse the asset again. The cached
+    data are valid only for the asset with the same content (sha256 hash), the same consumed data stream,
+    the same cache version and the same python version. To avoid reading the whole asset when nothing has
+    changed, the stat signature of the asset file is checked first and the content hash is computed only when
+    the signature differs.
+
+    The cached data has to be composed of the basic python types supported by the marshal module.
+    Any problem with the cache is treated as a cache miss - it is expected that the caller continues
+    by loading the asset using :func:`load_data_asset` in such a case, so all the errors are reported
+    in the usual way.
+    """
+
+    _FORMAT_VERSION = 1
+
+    def __init__(self, asset_filename, cache_id, version, directory='/etc/leapp/files', cache_dir=None):
+        """
+        :param str asset_filename: The file name of the asset.
+        :param str cache_id: Identifier distinguishing different data compiled from the same asset (e.g. architecture).
+        :param int version: Version of the compiled data format. Has to be bumped whenever the processing changes.
+        :param str directory: Directory containing the asset.
+        :param str cache_dir: Directory to store the cache in. Defaults to DATA_ASSET_CACHE_DIR.
+        """
+        self.asset_filename = asset_filename
+        self.asset_path = os.path.join(directory, asset_filename)
+        self.cache_path = os.path.join(cache_dir or DATA_ASSET_CACHE_DIR,
+                                       '{0}.{1}.cache'.format(asset_filename, cache_id))
+        self._key = {
+            'format': self._FORMAT_VERSION,
+            'version': version,
+            'python': tuple(sys.version_info[:2]),
+            'data_stream': get_consumed_data_stream_id(),
+        }
+        self._asset_stat = None
+        self._asset_sha256 = None
+
+    def _get_asset_stat(self):
+        stat = os.stat(self.asset_path)
+        return (stat.st_size, stat.st_mtime, stat.st_ctime, stat.st_ino)
+
+    def _get_asset_sha256(self):
+        with open(self.asset_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _read_cache_entry(self):
+        with open(self.cache_path, 'rb') as f:
+            return marshal.load(f)
+
+    def _write_cache_entry(self, entry):
+        cache_dir = os.path.dirname(self.cache_path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Write the cache atomically so an interrupted write cannot leave a corrupted cache behind
+        tmp_path = '{0}.tmp'.format(self.cache_path)
+        with open(tmp_path, 'wb') as f:
+            marshal.dump(entry, f)
+        os.rename(tmp_path, self.cache_path)
+
+    def load(self, actor_requesting_asset, asset_fulltext_name, docs_url, docs_title):
+        """
+        Load the cached data compiled from the asset.
+
+        In case of a cache hit, the :class:`leapp.models.ConsumedDataAsset` message is produced in the same way
+        as :func:`load_data_asset` would do.
+
+        :returns: The cached data or None in case of a cache miss.
+        """
+        logger = api.current_logger()
+        if models.ConsumedDataAsset not in getattr(actor_requesting_asset, 'produces', ()):
+            return None
+
+        try:
+            self._asset_stat = self._get_asset_stat()
+            if not os.path.exists(self.cache_path):
+                logger.debug('No cached data for the asset {0} found.'.format(self.asset_filename))
+                return None
+
+            entry = self._read_cache_entry()
+            if entry.get('key') != self._key:
+                logger.debug('Cached data for the asset {0} are outdated.'.format(self.asset_filename))
+                return None
+
+            if entry.get('asset_stat') != self._asset_stat:
+                self._asset_sha256 = self._get_asset_sha256()
+                if entry.get('asset_sha256') != self._asset_sha256:
+                    logger.debug('The asset {0} has been changed since it has been cached.'
+                                 .format(self.asset_filename))
+                    return None
+                # Just the stat signature has changed (e.g. the asset has been copied again),
+                # update it so the asset is not hashed again next time
+                entry['asset_stat'] = self._asset_stat
+                try:
+                    self._write_cache_entry(entry)
+                except (EnvironmentError, ValueError) as err:
+                    logger.debug('Cannot update cached data for the asset {0}: {1}'
+                                 .format(self.asset_filename, err))
+        except (EnvironmentError, EOFError, ValueError, TypeError, AttributeError) as err:
+            logger.debug('Cannot use cached data for the asset {0}: {1}'.format(self.asset_filename, err))
+            return None
+
+        logger.info('Using cached data for the asset {0} (data_stream={1})'
+                    .format(self.asset_filename, self._key['data_stream']))
+
+        api.produce(models.ConsumedDataAsset(filename=self.asset_filename,
+                                             fulltext_name=asset_fulltext_name,
+                                             docs_url=docs_url,
+                                             docs_title=docs_title,
+                                             provided_data_streams=entry.get('provided_data_streams')))
+        return entry.get('data')
+
+    def store(self, asset_contents, data):
+        """
+        Store data compiled from the asset in the cache.
+
+        The data are not stored when the asset has been modified since :meth:`load` has been called.
+
+        :param dict asset_contents: Contents of the asset as returned by :func:`load_data_asset`.
+        :param data: Data compiled from the asset to cache.
+        """
+        logger = api.current_logger()
+        provided_data_streams = _get_provided_data_streams(asset_contents)
+
+        try:
+            asset_stat = self._get_asset_stat()
+            if self._asset_stat is not None and asset_stat != self._asset_stat:
+                logger.debug('The asset {0} has been modified while processed, not caching it.'
+                             .format(self.asset_filename))
+                return
+
+            entry = {
+                'key': self._key,
+                'asset_stat': asset_stat,
+                'asset_sha256': self._asset_sha256 or self._get_asset_sha256(),
+                'provided_data_streams': provided_data_streams,
+                'data': data,
+            }
+            self._write_cache_entry(entry)
+        except (EnvironmentError, ValueError) as err:
+            logger.warning('Cannot cache data of the asset {0}: {1}'.format(self.asset_filename, err))
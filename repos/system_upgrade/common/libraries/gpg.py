@@ -1,4 +1,11 @@
+import base64
+import hashlib
 import os
+import re
+import struct
+from multiprocessing.pool import ThreadPool
+
+from six.moves import http_client, urllib
 
 from leapp.libraries.common import config
 from leapp.libraries.common.config.version import get_source_major_version, get_target_major_version
@@ -6,6 +13,22 @@ from leapp.libraries.stdlib import api, run
 from leapp.models import GpgKey
 
 GPG_CERTS_FOLDER = 'rpm-gpg'
+KEY_FETCH_TIMEOUT = 30
+KEY_FETCH_WORKERS = 8
+
+_PUBLIC_KEY_TAG = 6
+_ARMORED_KEY_RE = re.compile(
+    br'-----BEGIN PGP PUBLIC KEY BLOCK-----\r?\n(.*?)-----END PGP PUBLIC KEY BLOCK-----', re.DOTALL
+)
+
+# maps sha256 of the key file content to fingerprints of keys in the file
+_fingerprints_cache = {}
+
+
+class OpenPGPError(ValueError):
+    """
+    The data does not contain valid OpenPGP public keys
+    """
 
 
 def get_pubkeys_from_rpms(installed_rpms):
@@ -85,10 +108,147 @@ def _parse_fp_from_gpg(output):
     return gpg_fps
 
 
+def _dearmor(data):
+    """
+    Return list of binary OpenPGP data blocks in the given (possibly ASCII armored) data
+    """
+    if data and bytearray(data[:1])[0] & 0x80:
+        # binary data always start with a packet header
+        return [data]
+    blocks = []
+    for armored in _ARMORED_KEY_RE.findall(data):
+        # armor headers are separated from the base64 data by an empty line
+        lines = armored.strip().splitlines()
+        if b'' in [line.strip() for line in lines]:
+            lines = lines[[line.strip() for line in lines].index(b'') + 1:]
+        # skip the checksum line
+        lines = [line.strip() for line in lines if not line.startswith(b'=')]
+        try:
+            blocks.append(base64.b64decode(b''.join(lines)))
+        except (TypeError, ValueError) as e:
+            raise OpenPGPError('Invalid ASCII armored data: {}'.format(e))
+    if not blocks:
+        raise OpenPGPError('No OpenPGP data found')
+    return blocks
+
+
+def _iter_packets(data):
+    """
+    Yield tuples (tag, body) of OpenPGP packets in the given binary data
+    """
+    data = bytearray(data)
+    pos = 0
+    while pos < len(data):
+        try:
+            tag, length, pos = _parse_packet_header(data, pos)
+        except (IndexError, struct.error):
+            raise OpenPGPError('Truncated packet header at offset {}'.format(pos))
+        if pos + length > len(data):
+            raise OpenPGPError('Truncated packet with tag {}'.format(tag))
+        yield tag, bytes(data[pos:pos + length])
+        pos += length
+
+
+def _parse_packet_header(data, pos):
+    """
+    Parse the OpenPGP packet header at the given position
+
+    :return: Tuple (tag, body length, position of the body)
+    """
+    header = data[pos]
+    if not header & 0x80:
+        raise OpenPGPError('Invalid packet header at offset {}'.format(pos))
+    if header & 0x40:
+        # new packet format
+        tag = header & 0x3f
+        first = data[pos + 1]
+        if first < 192:
+            return tag, first, pos + 2
+        if first < 224:
+            return tag, ((first - 192) << 8) + data[pos + 2] + 192, pos + 3
+        if first == 255:
+            return tag, struct.unpack('>I', bytes(data[pos + 2:pos + 6]))[0], pos + 6
+        raise OpenPGPError('Partial body length is not allowed in public keys')
+    # old packet format
+    tag = (header >> 2) & 0x0f
+    length_type = header & 0x03
+    if length_type == 3:
+        # indeterminate length, the packet extends to the end of the data
+        return tag, len(data) - pos - 1, pos + 1
+    size = 1 << length_type
+    length = struct.unpack(('>B', '>H', '>I')[length_type], bytes(data[pos + 1:pos + 1 + size]))[0]
+    return tag, length, pos + 1 + size
+
+
+def _get_key_id(body):
+    """
+    Return the key ID (hex string) of the public key packet with the given body
+
+    The key ID is computed from the fingerprint of the key as defined by
+    RFC 4880 (v4 keys) and RFC 9580 (v6 keys), or from the RSA modulus of
+    legacy v3 keys.
+    """
+    version = bytearray(body[:1])[0] if body else None
+    if version == 4:
+        return hashlib.sha1(b'\x99' + struct.pack('>H', len(body)) + body).hexdigest()[-16:]
+    if version in (5, 6):
+        prefix = b'\x9a' if version == 5 else b'\x9b'
+        return hashlib.sha256(prefix + struct.pack('>I', len(body)) + body).hexdigest()[:16]
+    if version in (2, 3) and len(body) > 10:
+        # the key ID is formed by the low 64 bits of the RSA public modulus
+        bits = struct.unpack('>H', body[8:10])[0]
+        modulus = body[10:10 + (bits + 7) // 8]
+        return base64.b16encode(modulus[-8:]).decode('ascii').lower()
+    raise OpenPGPError('Unsupported public key packet version: {}'.format(version))
+
+
+def get_gpg_fp_from_data(data):
+    """
+    Return the list of public key fingerprints from the given OpenPGP data
+
+    The data (binary or ASCII armored) are parsed in place, without the gpg
+    tool. Fingerprints are the short 8 characters fingerprints (the last
+    8 characters of the key ID in lowercase) as used for the gpg-pubkey
+    packages in RPM DB. Results are cached by the hash of the data.
+
+    :param data: Binary or ASCII armored OpenPGP data
+    :type data: bytes
+    :return: List of public key fingerprints
+    :rtype: list(str)
+    :raises OpenPGPError: If the data are not valid OpenPGP public keys
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if digest not in _fingerprints_cache:
+        fps = []
+        for block in _dearmor(data):
+            for tag, body in _iter_packets(block):
+                if tag == _PUBLIC_KEY_TAG:
+                    fps.append(_get_key_id(body)[8:])
+        if not fps:
+            raise OpenPGPError('No OpenPGP public keys found')
+        _fingerprints_cache[digest] = fps
+    return list(_fingerprints_cache[digest])
+
+
+def _parse_key_file(key_path):
+    """
+    Return the list of public key fingerprints from the given file or None if it cannot be parsed
+    """
+    try:
+        with open(key_path, 'rb') as f:
+            return get_gpg_fp_from_data(f.read())
+    except (IOError, OSError, OpenPGPError) as e:
+        api.current_logger().debug('Cannot parse OpenPGP keys from {}: {}'.format(key_path, e))
+    return None
+
+
 def get_gpg_fp_from_file(key_path):
     """
     Return the list of public key fingerprints from the given file
 
+    The file is parsed in place. Only when it cannot be parsed, the gpg tool
+    is used to read the keys.
+
     Log warning in case no OpenPGP data found in the given file or it is not
     readable for some reason.
 
@@ -97,6 +257,9 @@ def get_gpg_fp_from_file(key_path):
     :return: List of public key fingerprints from the given file
     :rtype: list(str)
     """
+    fp = _parse_key_file(key_path)
+    if fp:
+        return fp
     res = _gpg_show_keys(key_path)
     fp = _parse_fp_from_gpg(res)
     if not fp:
@@ -105,6 +268,70 @@ def get_gpg_fp_from_file(key_path):
     return fp
 
 
+def _fetch_key(url, timeout):
+    try:
+        response = urllib.request.urlopen(url, timeout=timeout)
+        try:
+            return url, response.read(), None
+        finally:
+            response.close()
+    except (urllib.error.URLError, http_client.HTTPException, IOError, OSError) as e:
+        # socket timeouts are raised as OSError (IOError on python 2), broken
+        # HTTP responses (e.g. IncompleteRead) as HTTPException
+        return url, None, e
+
+
+def fetch_keys(urls, timeout=KEY_FETCH_TIMEOUT, workers=KEY_FETCH_WORKERS):
+    """
+    Download the given GPG key files concurrently
+
+    Each download is limited by the given timeout (in seconds).
+
+    :param urls: URLs of the key files
+    :type urls: list(str)
+    :return: Dictionary mapping URLs to tuples (data, error), data is None on error
+    :rtype: dict
+    """
+    urls = list(dict.fromkeys(urls))
+    if len(urls) <= 1 or workers <= 1:
+        results = [_fetch_key(url, timeout) for url in urls]
+    else:
+        pool = ThreadPool(min(workers, len(urls)))
+        try:
+            results = pool.map(lambda url: _fetch_key(url, timeout), urls)
+        finally:
+            pool.close()
+            pool.join()
+    return {url: (data, error) for url, data, error in results}
+
+
+class Keyring(object):
+    """
+    Set of trusted GPG key fingerprints
+
+    The fingerprints are the short 8 characters fingerprints, as provided by
+    the GpgKey model.
+    """
+
+    def __init__(self, keys=()):
+        self._fingerprints = set(key.fingerprint for key in keys)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def add(self, fingerprint):
+        self._fingerprints.add(fingerprint)
+
+    def get_missing(self, fingerprints):
+        """
+        Return fingerprints which are not in the keyring, keeping their order
+        """
+        return [fp for fp in fingerprints if fp not in self._fingerprints]
+
+
 def get_path_to_gpg_certs():
     """
     Get path to the directory with trusted target gpg keys in the common leapp repository.
@@ -15,36 +15,74 @@ except ImportError:
     warnings.warn('Could not import the `hawkey` python module.', ImportWarning)
 
 
-def _create_or_get_dnf_base(base=None):
-    if not base:
-        # The DNF command reads /etc/yum/vars/releasever, but the DNF library does not. It parses redhat-release
-        # package to retrieve system's major version which it then uses as $releasever. However, some systems might
-        # have repositories only for the exact system version (including the minor number). In a case when
-        # /etc/yum/vars/releasever is present, read its contents so that we can access repositores on such systems.
-        conf = dnf.conf.Conf()
-
-        # preload releasever from what we know, this will be our fallback
-        conf.substitutions['releasever'] = get_source_major_version()
-
-        # dnf on EL7 doesn't load vars from /etc/yum, so we need to help it a bit
-        if get_source_major_version() == '7':
-            try:
-                with open('/etc/yum/vars/releasever') as releasever_file:
-                    conf.substitutions['releasever'] = releasever_file.read().strip()
-            except IOError:
-                pass
-
-        # load all substitutions from etc
-        conf.substitutions.update_from_etc('/')
-
-        base = dnf.Base(conf=conf)
+# DNF bases shared by all callers within the current process, indexed by the load_available_repos value
+_dnf_bases = {}
+
+
+def _create_dnf_base(load_available_repos=True):
+    # The DNF command reads /etc/yum/vars/releasever, but the DNF library does not. It parses redhat-release
+    # package to retrieve system's major version which it then uses as $releasever. However, some systems might
+    # have repositories only for the exact system version (including the minor number). In a case when
+    # /etc/yum/vars/releasever is present, read its contents so that we can access repositores on such systems.
+    conf = dnf.conf.Conf()
+
+    # preload releasever from what we know, this will be our fallback
+    conf.substitutions['releasever'] = get_source_major_version()
+
+    # dnf on EL7 doesn't load vars from /etc/yum, so we need to help it a bit
+    if get_source_major_version() == '7':
+        try:
+            with open('/etc/yum/vars/releasever') as releasever_file:
+                conf.substitutions['releasever'] = releasever_file.read().strip()
+        except IOError:
+            pass
+
+    # load all substitutions from etc
+    conf.substitutions.update_from_etc('/')
+
+    base = dnf.Base(conf=conf)
+    if load_available_repos:
         base.init_plugins()
         base.read_all_repos()
         # configure plugins after the repositories are loaded
         # e.g. the amazon-id plugin requires loaded repositories
         # for the proper configuration.
         base.configure_plugins()
-        base.fill_sack()
+    base.fill_sack(load_system_repo=True, load_available_repos=load_available_repos)
+    return base
+
+
+def get_dnf_base(load_available_repos=True):
+    """
+    Return a DNF base with the filled sack, shared by all callers within the current process.
+
+    The base is created on the first call and reused by the following ones, so the repository metadata
+    are loaded just once. The returned base must not be modified by the caller (e.g. by enabling
+    repositories or module streams) - call :func:`invalidate_dnf_base` afterwards if it is necessary.
+
+    :param bool load_available_repos: Load the available repositories (and DNF plugins) as well. When False,
+                                      the sack contains just the installed packages (the system repository),
+                                      so no repository metadata are downloaded.
+    :returns: dnf.Base instance
+    """
+    key = bool(load_available_repos)
+    if key not in _dnf_bases:
+        _dnf_bases[key] = _create_dnf_base(load_available_repos=key)
+    return _dnf_bases[key]
+
+
+def invalidate_dnf_base():
+    """
+    Drop all DNF bases cached by :func:`get_dnf_base`, so the next call creates a new one.
+    """
+    for base in _dnf_bases.values():
+        base.close()
+    _dnf_bases.clear()
+
+
+def _create_or_get_dnf_base(base=None):
+    if not base:
+        base = get_dnf_base()
     return base
 
 
@@ -1,7 +1,9 @@
 import contextlib
 import os
 import shutil
+import threading
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
 from leapp.exceptions import StopActorExecutionError
 from leapp.libraries.common import mounting, utils
@@ -68,6 +70,24 @@ this constant.
 """
 
 
+_DEFAULT_DISK_IMAGE_WORKERS = 4
+"""
+The default number of disk images created (and formatted) in parallel.
+
+Can be changed by the LEAPP_OVL_IMG_WORKERS envar.
+"""
+
+_DISKIMAGE_TEMPLATES_DIRNAME = 'diskimages_templates'
+"""
+Name of the directory (inside the scratch directory) with formatted disk images to reuse.
+
+See `_get_diskimage_templates_dir` for more details.
+"""
+
+_diskimage_template_locks = {}
+_diskimage_template_locks_lock = threading.Lock()
+
+
 MountPoints = namedtuple('MountPoints', ['fs_file', 'fs_vfstype'])
 
 
@@ -280,20 +300,84 @@ def _prepare_required_mounts(scratch_dir, mounts_dir, storage_info, scratch_rese
     # but we want to reserve some space in advance.
     scratch_disk_size = _get_fspace(scratch_dir, convert_to_mibs=True) - scratch_reserve
 
-    result = {}
+    disk_sizes = {}
     for mountpoint in mount_points:
         # keep the info about the free space rather 5% lower than the real value
         disk_size = _get_fspace(mountpoint, convert_to_mibs=True, coefficient=0.95)
         if mountpoint == scratch_mp:
             disk_size = scratch_disk_size
-        image = _create_mount_disk_image(disk_images_directory, mountpoint, disk_size)
+        disk_sizes[mountpoint] = disk_size
+
+    templates_dir = _get_diskimage_templates_dir(scratch_dir)
+    images = _create_mount_disk_images(disk_images_directory, disk_sizes, templates_dir)
+
+    result = {}
+    for mountpoint in mount_points:
         result[mountpoint] = mounting.LoopMount(
-            source=image,
+            source=images[mountpoint],
             target=_mount_dir(mounts_dir, mountpoint)
         )
     return result
 
 
+def _get_disk_image_workers():
+    """
+    Return the number of disk images that can be created in parallel.
+
+    The value can be set by the LEAPP_OVL_IMG_WORKERS envar. The default is
+    `_DEFAULT_DISK_IMAGE_WORKERS`.
+    """
+    env_value = get_env('LEAPP_OVL_IMG_WORKERS', None)
+    if env_value is None:
+        return _DEFAULT_DISK_IMAGE_WORKERS
+    try:
+        workers = int(env_value)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        api.current_logger().warning(
+            'Invalid "LEAPP_OVL_IMG_WORKERS" environment variable "{}". Using the default: {}'
+            .format(env_value, _DEFAULT_DISK_IMAGE_WORKERS)
+        )
+        return _DEFAULT_DISK_IMAGE_WORKERS
+    return workers
+
+
+def _create_mount_disk_images(disk_images_directory, disk_sizes, templates_dir=None):
+    """
+    Create disk images for all mountpoints using a bounded pool of workers.
+
+    Creation and mainly formatting of disk images is done by external tools,
+    so running them in threads is enough to process more images in parallel.
+
+    :param disk_images_directory: Path to the directory where disk images should be stored.
+    :type disk_images_directory: str
+    :param disk_sizes: Mapping of mountpoints to apparent sizes of their disk images in MiBs.
+    :type disk_sizes: dict
+    :param templates_dir: See `_create_mount_disk_image`
+    :type templates_dir: Optional[str]
+    :return: Mapping of mountpoints to paths of created disk images
+    :rtype: dict
+    """
+    def _create(item):
+        mountpoint, disk_size = item
+        return mountpoint, _create_mount_disk_image(disk_images_directory, mountpoint, disk_size, templates_dir)
+
+    items = sorted(disk_sizes.items())
+    workers = min(_get_disk_image_workers(), len(items))
+    if workers <= 1:
+        return dict(_create(item) for item in items)
+
+    api.current_logger().debug('Creating {} disk images using {} workers'.format(len(items), workers))
+    pool = ThreadPool(workers)
+    try:
+        # the first raised exception is re-raised here
+        return dict(pool.map(_create, items))
+    finally:
+        pool.close()
+        pool.join()
+
+
 @contextlib.contextmanager
 def _build_overlay_mount(root_mount, mounts):
     if not root_mount:
@@ -339,11 +423,108 @@ def cleanup_scratch(scratch_dir, mounts_dir):
     if get_env('LEAPP_DEVEL_KEEP_DISK_IMGS', None) == '1':
         # NOTE(pstodulk): From time to time, it helps me with some experiments
         return
+    templates_dir = os.path.join(scratch_dir, _DISKIMAGE_TEMPLATES_DIRNAME)
+    if _is_diskimage_reuse_enabled() and os.path.isdir(templates_dir):
+        # keep the formatted disk images for next phases of the same leapp execution
+        api.current_logger().debug('Removing scratch directory %s except disk image templates.', scratch_dir)
+        for name in os.listdir(scratch_dir):
+            path = os.path.join(scratch_dir, name)
+            if path == templates_dir:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, onerror=utils.report_and_ignore_shutil_rmtree_error)
+            else:
+                os.unlink(path)
+        return
     api.current_logger().debug('Recursively removing scratch directory %s.', scratch_dir)
     shutil.rmtree(scratch_dir, onerror=utils.report_and_ignore_shutil_rmtree_error)
     api.current_logger().debug('Recursively removed scratch directory %s.', scratch_dir)
 
 
+def _is_diskimage_reuse_enabled():
+    return get_env('LEAPP_OVL_IMG_REUSE', '1') == '1' and bool(get_env('LEAPP_EXECUTION_ID', None))
+
+
+def _get_diskimage_templates_dir(scratch_dir):
+    """
+    Return the path to the directory with formatted disk images that can be reused.
+
+    The leapp execution runs several actors (e.g. target userspace creation,
+    the DNF transaction check, download, ...) which create the same disk
+    images again. Freshly formatted images are stored (as sparse files) in
+    the templates directory, so next time an image for the same mountpoint,
+    with the same FS type and the same size is just copied instead of being
+    created and formatted again.
+
+    Templates are never shared between different mountpoints: all the disk
+    images are mounted at the same time and copies of one formatted image
+    would have the same file system UUID, which XFS refuses to mount twice.
+
+    Templates are bound to the current leapp execution (LEAPP_EXECUTION_ID);
+    templates created by any other execution are removed. They are removed
+    also after the DNF dry-run, which is the last stage using disk images
+    (see `cleanup_diskimage_templates`). The reuse can be disabled by setting
+    LEAPP_OVL_IMG_REUSE=0.
+
+    :param scratch_dir: Path to the scratch directory.
+    :type scratch_dir: str
+    :return: Path to the templates directory or None if the reuse is disabled
+    :rtype: Optional[str]
+    """
+    templates_dir = os.path.join(scratch_dir, _DISKIMAGE_TEMPLATES_DIRNAME)
+    if not _is_diskimage_reuse_enabled():
+        if os.path.exists(templates_dir):
+            shutil.rmtree(templates_dir, onerror=utils.report_and_ignore_shutil_rmtree_error)
+        return None
+
+    execution_id = get_env('LEAPP_EXECUTION_ID', None)
+    execution_id_path = os.path.join(templates_dir, 'execution_id')
+    try:
+        with open(execution_id_path) as f:
+            if f.read().strip() == execution_id:
+                return templates_dir
+    except (IOError, OSError):
+        pass
+
+    try:
+        if os.path.exists(templates_dir):
+            shutil.rmtree(templates_dir)
+        utils.makedirs(templates_dir)
+        with open(execution_id_path, 'w') as f:
+            f.write(execution_id)
+    except (IOError, OSError) as e:
+        api.current_logger().warning(
+            'Cannot prepare the directory for disk image templates {}: {}. Disk images will not be reused.'
+            .format(templates_dir, str(e))
+        )
+        return None
+    return templates_dir
+
+
+def cleanup_diskimage_templates(scratch_dir):
+    """
+    Remove disk image templates stored in the scratch directory.
+
+    Call it when no more disk images are going to be created during
+    the current leapp execution.
+
+    :param scratch_dir: Path to the scratch directory.
+    :type scratch_dir: str
+    """
+    templates_dir = os.path.join(scratch_dir, _DISKIMAGE_TEMPLATES_DIRNAME)
+    if os.path.exists(templates_dir):
+        api.current_logger().debug('Removing disk image templates %s.', templates_dir)
+        shutil.rmtree(templates_dir, onerror=utils.report_and_ignore_shutil_rmtree_error)
+
+
+def _get_diskimage_template_lock(template_path):
+    """
+    Return the lock serializing the creation and the reuse of the template.
+    """
+    with _diskimage_template_locks_lock:
+        return _diskimage_template_locks.setdefault(template_path, threading.Lock())
+
+
 def _format_disk_image_ext4(diskimage_path):
     """
     Format the specified disk image with Ext4 filesystem.
@@ -398,7 +579,7 @@ def _format_disk_image_xfs(diskimage_path):
         )
 
 
-def _create_mount_disk_image(disk_images_directory, path, disk_size):
+def _create_mount_disk_image(disk_images_directory, path, disk_size, templates_dir=None):
     """
     Creates the mount disk image and return path to it.
 
@@ -416,12 +597,19 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
 
     The disk image is formatted with Ext4 if (envar) `LEAPP_OVL_IMG_FS_EXT4=1`.
 
+    If the templates_dir is set and it contains an already formatted disk
+    image for the same mountpoint with the same FS and size, the disk image
+    is just copied from it.
+    Otherwise the new formatted disk image is stored there for next time.
+
     :param disk_images_directory: Path to the directory where disk images should be stored.
     :type disk_images_directory: str
     :param path: Path to the mountpoint of the original (host/source) partition/volume
     :type path: str
     :param disk_size: Apparent size of the disk img in MiBs
     :type disk_size: int
+    :param templates_dir: Path to the directory with disk image templates or None
+    :type templates_dir: Optional[str]
     :return: Path to the created disk image
     :rtype: str
     """
@@ -449,6 +637,26 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
         )
         disk_size = 130
     diskimage_path = os.path.join(disk_images_directory, _mount_name(path))
+    use_ext4 = get_env('LEAPP_OVL_IMG_FS_EXT4', '0') == '1'
+    if not templates_dir:
+        _make_disk_image(disk_images_directory, diskimage_path, disk_size, use_ext4)
+        return diskimage_path
+
+    template_name = '{}-{}-{}'.format(_mount_name(path), 'ext4' if use_ext4 else 'xfs', disk_size)
+    template_path = os.path.join(templates_dir, template_name)
+    # disk images are created in parallel, the template must be stored
+    # completely before anyone else tries to use it
+    with _get_diskimage_template_lock(template_path):
+        if not _copy_disk_image_template(template_path, diskimage_path):
+            _make_disk_image(disk_images_directory, diskimage_path, disk_size, use_ext4)
+            _store_disk_image_template(diskimage_path, template_path)
+    return diskimage_path
+
+
+def _make_disk_image(disk_images_directory, diskimage_path, disk_size, use_ext4):
+    """
+    Create the sparse file of the disk image and format it.
+    """
     cmd = [
         '/bin/dd',
         'if=/dev/zero', 'of={}'.format(diskimage_path),
@@ -463,7 +671,7 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
     api.current_logger().debug('Attempting to create disk image at %s', diskimage_path)
     utils.call_with_failure_hint(cmd=cmd, hint=hint)
 
-    if get_env('LEAPP_OVL_IMG_FS_EXT4', '0') == '1':
+    if use_ext4:
         # This is alternative to XFS in case we find some issues, to be able
         # to switch simply to Ext4, so we will be able to simple investigate
         # possible issues between overlay <-> XFS if any happens.
@@ -471,7 +679,45 @@ def _create_mount_disk_image(disk_images_directory, path, disk_size):
     else:
         _format_disk_image_xfs(diskimage_path)
 
-    return diskimage_path
+
+def _copy_disk_image_template(template_path, diskimage_path):
+    """
+    Copy the formatted disk image template if it exists.
+
+    Return True on success, False otherwise.
+    """
+    if not os.path.exists(template_path):
+        return False
+    api.current_logger().debug('Reusing the disk image template %s for %s', template_path, diskimage_path)
+    try:
+        run(['/bin/cp', '--sparse=always', template_path, diskimage_path])
+    except (OSError, CalledProcessError) as e:
+        api.current_logger().warning(
+            'Cannot copy the disk image template {}: {}. Creating a new disk image.'.format(template_path, str(e))
+        )
+        if os.path.exists(diskimage_path):
+            os.unlink(diskimage_path)
+        return False
+    return True
+
+
+def _store_disk_image_template(diskimage_path, template_path):
+    """
+    Store the freshly formatted disk image as a template for next disk images.
+
+    The template is copied under a temporary name first and renamed then,
+    so a partially written template is never used.
+    """
+    tmp_path = '{}.{}.tmp'.format(template_path, os.path.basename(diskimage_path))
+    try:
+        run(['/bin/cp', '--sparse=always', diskimage_path, tmp_path])
+        os.rename(tmp_path, template_path)
+    except (OSError, CalledProcessError) as e:
+        api.current_logger().warning(
+            'Cannot store the disk image template {}: {}'.format(template_path, str(e))
+        )
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
 
 def _create_diskimages_dir(scratch_dir, diskimages_dir):
@@ -37,10 +37,9 @@ class RepoMapDataHandler(object):
         :param prio_channel: Prefer repositories with this channel when looking for target equivalents.
         :type prio_channel: str
         """
-        # NOTE: currently I am keeping this default data structure that is not
-        # ideal for work, but there is not any significant impact..
         self.repositories = repo_map.repositories
         self.mapping = repo_map.mapping
+        self._build_indexes()
         # FIXME(pstodulk): what about default_channel -> fallback_channel
         # hardcoded always as ga? instead of list of channels..
         # it'd be possibly confusing naming now...
@@ -59,6 +58,32 @@ class RepoMapDataHandler(object):
                 self.cloud_provider = provider
                 break
 
+    def _build_indexes(self):
+        """
+        Precompute indexes of repositories and mapping for constant-time lookups.
+
+        All indexed lists keep the order of the original data, so lookups
+        return the same results as linear scans would.
+        """
+        # {(repoid, major_version): [PESIDRepositoryEntry]}
+        self._repos_by_repoid = {}
+        # {(pesid, major_version): [PESIDRepositoryEntry]}
+        self._repos_by_pesid = {}
+        # {(pesid, major_version, arch, rhui): {channel: first rpm PESIDRepositoryEntry}}
+        self._rpm_repos_by_channel = {}
+        for pesid_repo in self.repositories:
+            self._repos_by_repoid.setdefault((pesid_repo.repoid, pesid_repo.major_version), []).append(pesid_repo)
+            self._repos_by_pesid.setdefault((pesid_repo.pesid, pesid_repo.major_version), []).append(pesid_repo)
+            if pesid_repo.repo_type == 'rpm':
+                key = (pesid_repo.pesid, pesid_repo.major_version, pesid_repo.arch, pesid_repo.rhui)
+                self._rpm_repos_by_channel.setdefault(key, {}).setdefault(pesid_repo.channel, pesid_repo)
+
+        # {source_pesid: sorted list of target pesids}
+        target_pesids = {}
+        for repomap in self.mapping:
+            target_pesids.setdefault(repomap.source, set()).update(repomap.target)
+        self._target_pesids = {source: sorted(targets) for source, targets in target_pesids.items()}
+
     def set_default_channels(self, default_channels):
         """
         Set the default channels that are used as a fallback when searching
@@ -100,10 +125,7 @@ class RepoMapDataHandler(object):
                  entry could be found.
         :rtype: Optional[PESIDRepositoryEntry]
         """
-        matching_pesid_repos = []
-        for pesid_repo in self.repositories:
-            if pesid_repo.repoid == repoid and pesid_repo.major_version == major_version:
-                matching_pesid_repos.append(pesid_repo)
+        matching_pesid_repos = self._repos_by_repoid.get((repoid, major_version), [])
 
         if len(matching_pesid_repos) == 1:
             # Perform no heuristics if only a single pesid repository with matching repoid found
@@ -129,11 +151,7 @@ class RepoMapDataHandler(object):
         :return: The list of target PES IDs the provided source_pesid is mapped to.
         :rtype: List[PESIDRepositoryEntry]
         """
-        pesids = set()
-        for repomap in self.mapping:
-            if repomap.source == source_pesid:
-                pesids.update(repomap.target)
-        return sorted(pesids)
+        return list(self._target_pesids.get(source_pesid, []))
 
     def get_pesid_repos(self, pesid, major_version):
         """
@@ -146,11 +164,7 @@ class RepoMapDataHandler(object):
         :return: A list of PESIDRepositoryEntries that match the provided PES ID and OS major version.
         :rtype: List[PESIDRepositoryEntry]
         """
-        pesid_repos = []
-        for pesid_repo in self.repositories:
-            if pesid_repo.pesid == pesid and pesid_repo.major_version == major_version:
-                pesid_repos.append(pesid_repo)
-        return pesid_repos
+        return list(self._repos_by_pesid.get((pesid, major_version), []))
 
     def get_source_pesid_repos(self, pesid):
         """
@@ -191,27 +205,24 @@ class RepoMapDataHandler(object):
         :rtype: Optional[PESIDRepositoryEntry]
         """
 
-        candidates = []
-        for candidate in self.get_target_pesid_repos(target_pesid):
-            matches_rhui = candidate.rhui == src_pesidrepo.rhui
-            matches_repo_type = candidate.repo_type == 'rpm'
-            matches_arch = candidate.arch == api.current_actor().configuration.architecture
+        key = (target_pesid, get_target_major_version(), api.current_actor().configuration.architecture,
+               src_pesidrepo.rhui)
+        # {channel: the first candidate with the channel} of rpm repositories
+        # matching the arch and rhui of the source repository
+        candidates = self._rpm_repos_by_channel.get(key, {})
 
-            if matches_rhui and matches_arch and matches_repo_type:
-                # user can specify in future the specific channel should be
-                # prioritized always (e.g. want to go to EUS...).
-                channel = self.prio_channel or src_pesidrepo.channel
-                if candidate.channel == channel:
-                    return candidate
-                candidates.append(candidate)
+        # user can specify in future the specific channel should be
+        # prioritized always (e.g. want to go to EUS...).
+        channel = self.prio_channel or src_pesidrepo.channel
+        if channel in candidates:
+            return candidates[channel]
 
         # Fallback...
         # Could not find exact-match, so go through candidates if we find an
         # alternative in one of default channels (usually just 'ga')
         for channel in self.default_channels:
-            for candidate in candidates:
-                if channel == candidate.channel:
-                    return candidate
+            if channel in candidates:
+                return candidates[channel]
 
         # This is a case, that must be handled by the caller
         return None
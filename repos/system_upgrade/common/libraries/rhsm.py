@@ -2,7 +2,10 @@ import contextlib
 import functools
 import os
 import re
+import threading
 import time
+import weakref
+from multiprocessing.pool import ThreadPool
 
 from leapp import reporting
 from leapp.exceptions import StopActorExecutionError
@@ -17,9 +20,15 @@ _RE_SKU_CONSUMED = re.compile(r'SKU:\s*([^\s]+)')
 _ATTEMPTS = 5
 _RETRY_SLEEP = 5
 _DEFAULT_RHSM_REPOFILE = '/etc/yum.repos.d/redhat.repo'
+_RHSM_SCAN_WORKERS = 4
 
 SCA_TEXT = "Content Access Mode is set to Simple Content Access"
 
+# Outputs of read-only subscription-manager commands per context:
+#   {context: {cmd: stdout}}
+_rhsm_outputs = weakref.WeakKeyDictionary()
+_rhsm_outputs_lock = threading.Lock()
+
 
 def _rhsm_retry(max_attempts, sleep=None):
     """
@@ -105,6 +114,31 @@ def with_rhsm(f):
     return wrapper
 
 
+def _call_rhsm(context, cmd):
+    """
+    Execute a read-only subscription-manager command and return its stdout.
+
+    The output is cached per context for the rest of the actor execution,
+    so the same information is not requested repeatedly. Functions changing
+    the subscription-manager configuration invalidate the cache of the context.
+    """
+    key = tuple(cmd)
+    with _rhsm_outputs_lock:
+        stdout = _rhsm_outputs.get(context, {}).get(key)
+    if stdout is not None:
+        return stdout
+    with _handle_rhsm_exceptions():
+        stdout = context.call(cmd, split=False)['stdout']
+    with _rhsm_outputs_lock:
+        _rhsm_outputs.setdefault(context, {})[key] = stdout
+    return stdout
+
+
+def _invalidate_rhsm_outputs(context):
+    with _rhsm_outputs_lock:
+        _rhsm_outputs.pop(context, None)
+
+
 @with_rhsm
 def get_attached_skus(context):
     """
@@ -115,9 +149,8 @@ def get_attached_skus(context):
     :return: SKUs the current system is attached to.
     :rtype: List(string)
     """
-    with _handle_rhsm_exceptions():
-        result = context.call(['subscription-manager', 'list', '--consumed'], split=False)
-        return _RE_SKU_CONSUMED.findall(result['stdout'])
+    stdout = _call_rhsm(context, ['subscription-manager', 'list', '--consumed'])
+    return _RE_SKU_CONSUMED.findall(stdout)
 
 
 @with_rhsm
@@ -130,9 +163,7 @@ def get_rhsm_status(context):
     :return: "subscription manager status" output
     :rtype: String
     """
-    with _handle_rhsm_exceptions():
-        result = context.call(['subscription-manager', 'status'])
-        return result['stdout']
+    return _call_rhsm(context, ['subscription-manager', 'status'])
 
 
 def is_manifest_sca(context):
@@ -232,9 +263,8 @@ def get_enabled_repo_ids(context):
     :return: Repositories that are enabled on the current system through the subscription-manager.
     :rtype: List(string)
     """
-    with _handle_rhsm_exceptions():
-        result = context.call(['subscription-manager', 'repos', '--list-enabled'], split=False)
-        return _RE_REPO_UID.findall(result['stdout'])
+    stdout = _call_rhsm(context, ['subscription-manager', 'repos', '--list-enabled'])
+    return _RE_REPO_UID.findall(stdout)
 
 
 @with_rhsm
@@ -246,6 +276,7 @@ def unset_release(context):
     :param context: An instance of a mounting.IsolatedActions class
     :type context: mounting.IsolatedActions class
     """
+    _invalidate_rhsm_outputs(context)
     with _handle_rhsm_exceptions():
         context.call(['subscription-manager', 'release', '--unset'], split=False)
 
@@ -261,6 +292,7 @@ def set_release(context, release):
     :param release: Release to set the subscription-manager to.
     :type release: str
     """
+    _invalidate_rhsm_outputs(context)
     with _handle_rhsm_exceptions():
         context.call(['subscription-manager', 'release', '--set', release], split=False)
 
@@ -275,10 +307,8 @@ def get_release(context):
     :return: Release the subscription-manager is set to.
     :rtype: string
     """
-    with _handle_rhsm_exceptions():
-        result = context.call(['subscription-manager', 'release'], split=False)
-        result = _RE_RELEASE.findall(result['stdout'])
-        return result[0] if result else ''
+    result = _RE_RELEASE.findall(_call_rhsm(context, ['subscription-manager', 'release']))
+    return result[0] if result else ''
 
 
 @with_rhsm
@@ -290,6 +320,7 @@ def refresh(context):
     :param context: An instance of a mounting.IsolatedActions class
     :type context: mounting.IsolatedActions class
     """
+    _invalidate_rhsm_outputs(context)
     with _handle_rhsm_exceptions():
         context.call(['subscription-manager', 'refresh'], split=False)
 
@@ -349,8 +380,12 @@ def set_container_mode(context):
         return
 
     try:
-        context.call(['ln', '-s', '/etc/rhsm', '/etc/rhsm-host'])
-        context.call(['ln', '-s', '/etc/pki/entitlement', '/etc/pki/entitlement-host'])
+        for target, link in (('/etc/rhsm', '/etc/rhsm-host'), ('/etc/pki/entitlement', '/etc/pki/entitlement-host')):
+            link_path = context.full_path(link)
+            if os.path.islink(link_path) and os.readlink(link_path) == target:
+                # already in the container mode, e.g. the reused target userspace
+                continue
+            context.call(['ln', '-s', target, link])
     except CalledProcessError:
         raise StopActorExecutionError(
                 message='Cannot set the container mode for the subscription-manager.')
@@ -389,16 +424,30 @@ def scan_rhsm_info(context):
 
     It's not intended for gathering RHSM info about the target system within a container.
 
+    The subscription-manager commands are executed concurrently, each of them
+    takes seconds and some of them contact the entitlement server.
+
     :param context: An instance of a mounting.IsolatedActions class
     :type context: mounting.IsolatedActions class
     :return: An instance of an RHSMInfo model.
     :rtype: RHSMInfo model
     """
     info = RHSMInfo()
-    info.attached_skus = get_attached_skus(context)
-    info.available_repos = get_available_repo_ids(context)
-    info.enabled_repos = get_enabled_repo_ids(context)
-    info.release = get_release(context)
-    info.existing_product_certificates.extend(get_existing_product_certificates(context))
-    info.sca_detected = is_manifest_sca(context)
+    pool = ThreadPool(_RHSM_SCAN_WORKERS)
+    try:
+        attached_skus = pool.apply_async(get_attached_skus, (context,))
+        enabled_repos = pool.apply_async(get_enabled_repo_ids, (context,))
+        release = pool.apply_async(get_release, (context,))
+        sca_detected = pool.apply_async(is_manifest_sca, (context,))
+        # yum could regenerate the repofile and the duplicate repositories
+        # can be reported, so keep it in the main thread
+        info.available_repos = get_available_repo_ids(context)
+        info.existing_product_certificates.extend(get_existing_product_certificates(context))
+        info.attached_skus = attached_skus.get()
+        info.enabled_repos = enabled_repos.get()
+        info.release = release.get()
+        info.sca_detected = sca_detected.get()
+    finally:
+        pool.close()
+        pool.join()
     return info
@@ -1,3 +1,6 @@
+import re
+from collections import namedtuple
+
 from leapp.libraries import stdlib
 from leapp.libraries.common.config.version import get_source_major_version
 from leapp.models import InstalledRPM
@@ -42,13 +45,19 @@ GET_LEAPP_PACKAGES_DEFAULT_COMPONENTS = frozenset((LeappComponents.FRAMEWORK,
                                                    LeappComponents.TOOLS))
 
 
+# The format of lines describing installed packages returned by get_installed_rpms
+INSTALLED_RPMS_QUERYFORMAT = (
+    r'%{NAME}|%{VERSION}|%{RELEASE}|%|EPOCH?{%{EPOCH}}:{0}||%|PACKAGER?{%{PACKAGER}}:{(none)}||%|'
+    r'ARCH?{%{ARCH}}:{}||%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|}|\n'
+)
+
+
 def get_installed_rpms():
     rpm_cmd = [
         '/bin/rpm',
         '-qa',
         '--queryformat',
-        r'%{NAME}|%{VERSION}|%{RELEASE}|%|EPOCH?{%{EPOCH}}:{0}||%|PACKAGER?{%{PACKAGER}}:{(none)}||%|'
-        r'ARCH?{%{ARCH}}:{}||%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|}|\n'
+        INSTALLED_RPMS_QUERYFORMAT
     ]
     try:
         return stdlib.run(rpm_cmd, split=True)['stdout']
@@ -63,11 +72,17 @@ def create_lookup(model, field, keys, context=stdlib.api):
     """
     Create a lookup set from one of the model fields.
 
+    Lookups over the items of InstalledRPM based models are served from
+    the package index (see get_package_index), so the consumed message is not
+    processed again on each call.
+
     :param model: model class
     :param field: model field, its value will be taken for lookup data
     :param key: property of the field's data that will be used to build a resulting set
     :param context: context of the execution
     """
+    if field == 'items' and _is_package_model(model):
+        return set(get_package_index(model, context=context).lookup(keys))
     data = getattr(next((m for m in context.consume(model)), model()), field)
     try:
         return {tuple(getattr(obj, key) for key in keys) for obj in data} if data else set()
@@ -79,6 +94,108 @@ def create_lookup(model, field, keys, context=stdlib.api):
         return set()
 
 
+class PackageIndex(object):
+    """
+    Index of packages from a message based on the InstalledRPM model.
+
+    Packages are indexed by name, so checks for presence of a package
+    (optionally with the given arch, version, release or epoch) cost the same
+    regardless of the number of installed packages. Lookup sets over
+    arbitrary package attributes are built lazily and kept for later calls.
+    """
+
+    def __init__(self, packages):
+        self.packages = list(packages)
+        self._by_name = {}
+        for pkg in self.packages:
+            self._by_name.setdefault(pkg.name, []).append(pkg)
+        self._lookups = {}
+
+    def __len__(self):
+        return len(self.packages)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def lookup(self, keys):
+        """
+        Return a set of tuples of values of the given package attributes.
+
+        The returned set is shared by all callers and must not be modified.
+        """
+        keys = tuple(keys)
+        if keys not in self._lookups:
+            self._lookups[keys] = {tuple(getattr(pkg, key) for key in keys) for pkg in self.packages}
+        return self._lookups[keys]
+
+    def get(self, name, arch=None, version=None, release=None, epoch=None):
+        """
+        Return packages of the given name matching all the specified attributes.
+
+        None means any value of the attribute.
+        """
+        attributes = (('arch', arch), ('version', version), ('release', release), ('epoch', epoch))
+        return [
+            pkg for pkg in self._by_name.get(name, [])
+            if all(value is None or getattr(pkg, key) == value for key, value in attributes)
+        ]
+
+    def has(self, name, arch=None, version=None, release=None, epoch=None):
+        return bool(self.get(name, arch=arch, version=version, release=release, epoch=epoch))
+
+    def has_nevra(self, name, epoch, version, release, arch):
+        return self.has(name, arch=arch, version=version, release=release, epoch=epoch)
+
+    def has_any(self, names):
+        """
+        Return True if any of the given packages is present.
+        """
+        return any(name in self._by_name for name in names)
+
+    def present(self, names):
+        """
+        Return the set of the given package names that are present.
+        """
+        return {name for name in names if name in self._by_name}
+
+
+# Package indexes of already consumed messages, per model:
+#   {model: (message, PackageIndex)}
+_package_indexes = {}
+
+
+def _is_package_model(model):
+    return isinstance(model, type) and issubclass(model, InstalledRPM)
+
+
+def get_package_index(model, context=stdlib.api):
+    """
+    Return the PackageIndex of packages from the message of the given model.
+
+    The index is kept for the consumed message (compared by identity), so
+    following calls for the same message return the same index and a different
+    message (e.g. of another actor) always gets its own index.
+
+    :param model: model class based on InstalledRPM, e.g. DistributionSignedRPM
+    :param context: context of the execution
+    """
+    message = next((m for m in context.consume(model)), None)
+    cached = _package_indexes.get(model)
+    if message is not None and cached and cached[0] is message:
+        return cached[1]
+
+    items = getattr(message if message is not None else model(), 'items')
+    try:
+        index = PackageIndex(items or [])
+    except TypeError:
+        stdlib.api.current_logger().error(
+                "{model}.items is not iterable, can't build package index".format(model=model))
+        index = PackageIndex([])
+    if message is not None:
+        _package_indexes[model] = (message, index)
+    return index
+
+
 def has_package(model, package_name, arch=None, version=None, release=None, context=stdlib.api):
     """
     Expects a model DistributionSignedRPM or InstalledUnsignedRPM.
@@ -91,7 +208,7 @@ def has_package(model, package_name, arch=None, version=None, release=None, cont
     :param version: filter by version. None means all versions.
     :param release: filter by release. None means all releases.
     """
-    if not (isinstance(model, type) and issubclass(model, InstalledRPM)):
+    if not _is_package_model(model):
         return False
     keys = ['name']
     if arch:
@@ -103,10 +220,229 @@ def has_package(model, package_name, arch=None, version=None, release=None, cont
 
     attributes = [package_name]
     attributes += [attr for attr in (arch, version, release) if attr is not None]
-    rpm_lookup = create_lookup(model, field='items', keys=keys, context=context)
+    rpm_lookup = get_package_index(model, context=context).lookup(keys)
     return tuple(attributes) in rpm_lookup
 
 
+def has_any_package(model, package_names, context=stdlib.api):
+    """
+    Return True if any of the given packages is present in the message of the given model.
+
+    :param model: model class based on InstalledRPM
+    :param package_names: iterable of package names
+    :param context: context of the execution
+    """
+    if not _is_package_model(model):
+        return False
+    return get_package_index(model, context=context).has_any(package_names)
+
+
+# The maximal number of paths queried by one rpm call
+FILE_OWNERS_BATCH_SIZE = 256
+
+
+def _query_file_owners(paths, runner):
+    """
+    Query owners of the given paths by one rpm call.
+
+    rpm prints one line per owner of each path (in the order of paths) or
+    a 'file ... is not owned by any package' message. Nothing is printed
+    on stdout for missing files, just an error on stderr. So when the number
+    of lines differs from the number of paths or an error is reported,
+    the mapping is ambiguous and the paths are split into halves and
+    queried again.
+    """
+    if not paths:
+        return {}
+    cmd = ['rpm', '-qf', '--queryformat', r'%{NAME}\n'] + list(paths)
+    result = runner(cmd, split=True, checked=False)
+    lines = [line for line in result['stdout'] if line]
+    if len(paths) == 1:
+        # package names cannot contain spaces, unlike the 'not owned' message
+        owners = [line for line in lines if ' ' not in line]
+        return {paths[0]: owners} if owners else {}
+    has_errors = any(line.startswith('error:') for line in result['stderr'].splitlines())
+    if len(lines) == len(paths) and not has_errors:
+        return {path: [line] for path, line in zip(paths, lines) if ' ' not in line}
+    half = len(paths) // 2
+    result = _query_file_owners(paths[:half], runner)
+    result.update(_query_file_owners(paths[half:], runner))
+    return result
+
+
+def get_files_owners(paths, context=None, batch_size=FILE_OWNERS_BATCH_SIZE):
+    """
+    Get names of packages owning the given files using as few rpm calls as possible.
+
+    Paths are queried in batches of `batch_size` by a single `rpm -qf` call
+    instead of one call per file. Results for the host system are remembered
+    for the rest of the actor execution, so only paths not queried before
+    are passed to rpm.
+
+    :param paths: absolute paths of files (as seen inside the context)
+    :param context: an isolated actions context (see the mounting library)
+        in which rpm is called. The host system is queried if not set.
+    :param batch_size: the maximal number of paths passed to one rpm call
+    :returns: a dict mapping paths to the list of names of packages owning
+        them. Paths not owned by any package are not included.
+    """
+    paths = list(paths)
+    if context is not None:
+        return _get_files_owners(paths, context.call, batch_size)
+
+    cache = _RpmFilesCache.get()
+    unknown = [path for path in dict.fromkeys(paths) if path not in cache.owners]
+    if unknown:
+        owners = _get_files_owners(unknown, stdlib.run, batch_size)
+        for path in unknown:
+            cache.owners[path] = owners.get(path, [])
+    return {path: cache.owners[path] for path in paths if cache.owners[path]}
+
+
+def _get_files_owners(paths, runner, batch_size):
+    owners = {}
+    for i in range(0, len(paths), batch_size):
+        owners.update(_query_file_owners(paths[i:i + batch_size], runner))
+    return owners
+
+
+# A file reported by `rpm -V` as changed:
+#   flags - the verification flags (e.g. 'S.5....T.') or 'missing'
+#   attribute - the file attribute marker (e.g. 'c' for configuration files) or ''
+#   path - the path of the file
+#   line - the original line printed by rpm
+VerifiedFile = namedtuple('VerifiedFile', ['flags', 'attribute', 'path', 'line'])
+
+_VERIFY_FLAGS_RE = re.compile(r'^(?:[SM5DLUGTP.?]{9}|missing)$')
+
+
+def _parse_verify_line(line):
+    """
+    Parse a line of the `rpm -V` output.
+
+    Lines have the 'flags [attribute] path' format. None is returned for
+    other lines, like messages about packages that are not installed.
+    """
+    parts = line.split(None, 1)
+    if len(parts) != 2 or not _VERIFY_FLAGS_RE.match(parts[0]):
+        return None
+    flags, rest = parts
+    attribute = ''
+    if rest[1:2] == ' ':
+        attribute, rest = rest[0], rest[2:].lstrip()
+    return VerifiedFile(flags=flags, attribute=attribute, path=rest, line=line)
+
+
+class _RpmFilesCache(object):
+    """
+    Results of rpm queries about files on the host system.
+
+    The rpm database does not change while an actor is executed, so results
+    of queries are kept and shared by all callers. The cache is bound to
+    the current actor and to the function used to execute commands, so it is
+    not reused by another actor or when the function is replaced (e.g. in tests).
+    """
+
+    _instance = None
+
+    def __init__(self, owner):
+        self.owner = owner
+        # path -> names of owning packages
+        self.owners = {}
+        # package name -> paths of its files, None for packages not installed
+        self.package_files = {}
+        self.verified_packages = set()
+        # path -> VerifiedFile
+        self.verified_files = {}
+
+    @classmethod
+    def get(cls):
+        owner = (stdlib.api.current_actor(), stdlib.run)
+        cache = cls._instance
+        if cache is None or any(cached is not current for cached, current in zip(cache.owner, owner)):
+            cache = cls._instance = cls(owner)
+        return cache
+
+
+def get_packages_files(packages):
+    """
+    Get paths of files of the given installed packages by one rpm call.
+
+    :param packages: names of packages
+    :returns: a dict mapping names of packages to the list of their files.
+        Packages that are not installed are not included.
+    """
+    cache = _RpmFilesCache.get()
+    unknown = [pkg for pkg in dict.fromkeys(packages) if pkg not in cache.package_files]
+    if unknown:
+        cmd = ['rpm', '-q', '--queryformat', r'[%{=NAME}\t%{FILENAMES}\n]'] + unknown
+        result = stdlib.run(cmd, split=True, checked=False)
+        files = {}
+        for line in result['stdout']:
+            if line.startswith('package ') and line.endswith(' is not installed'):
+                files[line[len('package '):-len(' is not installed')]] = None
+            elif '\t' in line:
+                name, path = line.split('\t', 1)
+                files.setdefault(name, []).append(path)
+        for pkg in unknown:
+            cache.package_files[pkg] = files.get(pkg, [])
+    return {pkg: cache.package_files[pkg] for pkg in packages if cache.package_files[pkg] is not None}
+
+
+def _verify_packages(cache, packages):
+    unverified = sorted(pkg for pkg in set(packages) if pkg not in cache.verified_packages)
+    if not unverified:
+        return
+    cmd = ['rpm', '-V', '--nomtime', '--nodeps'] + unverified
+    # the exit code is non-zero when any change is found
+    result = stdlib.run(cmd, split=True, checked=False)
+    for line in result['stdout']:
+        verified = _parse_verify_line(line)
+        if verified:
+            cache.verified_files.setdefault(verified.path, verified)
+    cache.verified_packages.update(unverified)
+
+
+def verify_packages(packages):
+    """
+    Verify files of the given installed packages by one `rpm -V` call.
+
+    Packages verified before during the actor execution are not verified
+    again. Changes of file modification times are ignored.
+
+    :param packages: names of packages
+    :returns: a dict mapping names of installed packages to the list
+        of VerifiedFile for their changed files
+    """
+    cache = _RpmFilesCache.get()
+    packages_files = get_packages_files(packages)
+    _verify_packages(cache, packages_files)
+    return {
+        pkg: [cache.verified_files[path] for path in files if path in cache.verified_files]
+        for pkg, files in packages_files.items()
+    }
+
+
+def verify_files(paths):
+    """
+    Verify the given files against the rpm database.
+
+    Owners of all the paths are resolved and verified together, so just
+    a few rpm calls are needed regardless of the number of paths.
+    Results are remembered for the rest of the actor execution.
+
+    :param paths: absolute paths of files
+    :returns: a dict mapping paths of changed (or missing) files owned
+        by packages to VerifiedFile. Paths of unchanged files and files
+        not owned by any package are not included.
+    """
+    paths = list(paths)
+    owners = get_files_owners(paths)
+    cache = _RpmFilesCache.get()
+    _verify_packages(cache, [pkg for pkgs in owners.values() for pkg in pkgs])
+    return {path: cache.verified_files[path] for path in owners if path in cache.verified_files}
+
+
 def _read_rpm_modifications(config):
     """
     Ask RPM database whether the configuration file was modified.
@@ -114,11 +450,12 @@ def _read_rpm_modifications(config):
     :param config: a config file to check
     """
     try:
-        return stdlib.run(['rpm', '-Vf', config], split=True, checked=False)['stdout']
+        verified = verify_files([config]).get(config)
     except OSError as err:
         error = 'Failed to check the modification status of the file {}: {}'.format(config, str(err))
         stdlib.api.current_logger().error(error)
         return []
+    return [verified.line] if verified else []
 
 
 def _parse_config_modification(data, config):
@@ -1,5 +1,6 @@
 import fnmatch
 import os
+import re
 
 from leapp.libraries.stdlib import api, CalledProcessError, run
 from leapp.models import SystemdServiceFile, SystemdServicePreset
@@ -9,6 +10,8 @@ SYSTEMD_SYMLINKS_DIR = '/etc/systemd/system/'
 _SYSTEMCTL_CMD_OPTIONS = ['--type=service', '--all', '--plain', '--no-legend']
 _USR_PRESETS_PATH = '/usr/lib/systemd/system-preset/'
 _ETC_PRESETS_PATH = '/etc/systemd/system-preset/'
+_SYSTEMCTL_BATCH_SIZE = 100
+_INSTALL_DEPENDENCY_DIRS = (('WantedBy', '.wants'), ('RequiredBy', '.requires'))
 
 SYSTEMD_SYSTEM_LOAD_PATH = [
     '/etc/systemd/system',
@@ -82,6 +85,238 @@ def reenable_unit(unit):
     _try_call_unit_command('reenable', unit)
 
 
+def _call_units_command(command, units):
+    """
+    Call the systemctl command on the units in batches
+
+    When a batch fails, the command is called on each unit of the batch
+    separately, so the failure is attributed to the right units.
+
+    :return: Units on which the command failed
+    :rtype: list[str]
+    """
+    failed = []
+    for i in range(0, len(units), _SYSTEMCTL_BATCH_SIZE):
+        batch = units[i:i + _SYSTEMCTL_BATCH_SIZE]
+        if len(batch) > 1:
+            try:
+                run(['systemctl', command] + batch)
+                continue
+            except CalledProcessError as err:
+                api.current_logger().debug(
+                    'Failed to {} systemd units in a batch, retrying one by one: {}'.format(command, str(err))
+                )
+        for unit in batch:
+            try:
+                _try_call_unit_command(command, unit)
+            except CalledProcessError:
+                failed.append(unit)
+    return failed
+
+
+class _OfflineUnitError(Exception):
+    """
+    The unit state cannot be changed by editing the symlinks directly
+    """
+
+
+def _split_unit_name(unit):
+    """
+    Split the unit name into the name of its unit file and the instance name
+
+    The instance name is None for units which are not instances of templates.
+    """
+    if '@' not in unit:
+        return unit, None
+    prefix, rest = unit.split('@', 1)
+    instance, _, suffix = rest.rpartition('.')
+    return '{}@.{}'.format(prefix, suffix), instance or None
+
+
+def _find_unit_file(name):
+    for path in SYSTEMD_SYSTEM_LOAD_PATH:
+        unit_file = os.path.join(path, name)
+        if os.path.islink(unit_file):
+            # masked, linked or aliased unit, leave these to systemctl
+            raise _OfflineUnitError('{} is a symlink'.format(unit_file))
+        if os.path.isfile(unit_file):
+            return unit_file
+    raise _OfflineUnitError('unit file {} not found'.format(name))
+
+
+def _read_install_section(unit_file):
+    """
+    Read options of the [Install] section of the unit file
+
+    :return: Dictionary mapping option names to lists of their values
+    :rtype: dict[str, list[str]]
+    """
+    install = {}
+    section = None
+    with open(unit_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in ('#', ';'):
+                continue
+            if line.startswith('['):
+                section = line
+            elif section == '[Install]' and '=' in line:
+                if line.endswith('\\'):
+                    raise _OfflineUnitError('line continuation in {} is not supported'.format(unit_file))
+                key, value = [part.strip() for part in line.split('=', 1)]
+                if '%' in value:
+                    raise _OfflineUnitError('specifiers in {} are not supported'.format(unit_file))
+                if value:
+                    install.setdefault(key, []).extend(value.split())
+                else:
+                    # an empty assignment resets the list
+                    install[key] = []
+    return install
+
+
+def _get_install_info(unit, seen):
+    """
+    Get unit files, instances and [Install] sections of the unit and of units listed in its Also= option
+
+    :return: List of tuples (unit, unit file path, instance, install options)
+    """
+    if unit in seen:
+        return []
+    seen.add(unit)
+    name, instance = _split_unit_name(unit)
+    unit_file = _find_unit_file(name)
+    install = _read_install_section(unit_file)
+    info = [(unit, unit_file, instance, install)]
+    for also in install.get('Also', []):
+        info.extend(_get_install_info(also, seen))
+    return info
+
+
+def _enable_unit_offline(unit):
+    links = {}
+    for unit_name, unit_file, instance, install in _get_install_info(unit, set()):
+        if '@' in unit_name:
+            default_instance = install.get('DefaultInstance')
+            instance = instance or (default_instance[-1] if default_instance else None)
+            if not instance:
+                # nothing to enable for a template without an instance
+                continue
+            if install.get('Alias'):
+                raise _OfflineUnitError('aliases of template {} are not supported'.format(unit_name))
+            link_name = os.path.basename(unit_file).replace('@.', '@{}.'.format(instance), 1)
+        else:
+            link_name = unit_name
+        for option, suffix in _INSTALL_DEPENDENCY_DIRS:
+            for target in install.get(option, []):
+                links[os.path.join(SYSTEMD_SYMLINKS_DIR, target + suffix, link_name)] = unit_file
+        for alias in install.get('Alias', []):
+            links[os.path.join(SYSTEMD_SYMLINKS_DIR, alias)] = unit_file
+
+    for link, unit_file in links.items():
+        if os.path.lexists(link) and (not os.path.islink(link) or os.readlink(link) != unit_file):
+            raise _OfflineUnitError('{} already exists'.format(link))
+
+    for link, unit_file in links.items():
+        if os.path.lexists(link):
+            continue
+        if not os.path.isdir(os.path.dirname(link)):
+            os.makedirs(os.path.dirname(link))
+        os.symlink(unit_file, link)
+
+
+def _disable_unit_offline(unit):
+    names = set()
+    templates = set()
+    aliases = {}
+    for unit_name, unit_file, instance, install in _get_install_info(unit, set()):
+        if '@' in unit_name and not instance:
+            # disabling a template disables all its instances
+            templates.add(os.path.basename(unit_file))
+        else:
+            names.add(unit_name)
+        for alias in install.get('Alias', []):
+            aliases[alias] = unit_file
+
+    symlinks_dir = os.path.normpath(SYSTEMD_SYMLINKS_DIR)
+    for dirpath, _, filenames in os.walk(symlinks_dir):
+        in_dependency_dir = dirpath.endswith(tuple(suffix for _, suffix in _INSTALL_DEPENDENCY_DIRS))
+        for filename in filenames:
+            link = os.path.join(dirpath, filename)
+            if not os.path.islink(link):
+                continue
+            target = os.readlink(link)
+            if in_dependency_dir and (filename in names or os.path.basename(target) in templates):
+                os.unlink(link)
+            elif dirpath == symlinks_dir and aliases.get(filename) == target:
+                os.unlink(link)
+
+
+_OFFLINE_UNIT_COMMANDS = {
+    'enable': _enable_unit_offline,
+    'disable': _disable_unit_offline,
+}
+
+
+def _set_units_state(command, units, offline):
+    units = list(units)
+    if offline:
+        remaining = []
+        for unit in units:
+            try:
+                _OFFLINE_UNIT_COMMANDS[command](unit)
+            except (_OfflineUnitError, EnvironmentError) as err:
+                api.current_logger().debug(
+                    'Cannot {} systemd unit "{}" offline, using systemctl: {}'.format(command, unit, str(err))
+                )
+                remaining.append(unit)
+        units = remaining
+    return _call_units_command(command, units)
+
+
+def enable_units(units, offline=False):
+    """
+    Enable multiple systemd units
+
+    Units are enabled with a single systemctl call per batch of units. If a
+    batch fails, its units are enabled one by one and failures are logged
+    for each unit separately.
+
+    In the offline mode, the symlinks defined by the [Install] section of unit
+    files are created directly, without systemctl. The systemd daemon is not
+    reloaded in this case. Units which cannot be handled this way (e.g.
+    masked units or unit files using specifiers) are enabled by systemctl.
+
+    It is strongly recommended to produce SystemdServicesTasks message instead,
+    unless it is absolutely necessary to handle failure yourself.
+
+    :param units: The systemd units to enable
+    :type units: list[str]
+    :param offline: Whether to create the symlinks directly instead of calling systemctl
+    :type offline: bool
+    :return: Units which failed to be enabled
+    :rtype: list[str]
+    """
+    return _set_units_state('enable', units, offline)
+
+
+def disable_units(units, offline=False):
+    """
+    Disable multiple systemd units
+
+    The same as enable_units() but disables the units. In the offline mode,
+    symlinks to the units are removed from the wants/ and requires/
+    directories in /etc/systemd/system/, together with their aliases.
+
+    :param units: The systemd units to disable
+    :type units: list[str]
+    :param offline: Whether to remove the symlinks directly instead of calling systemctl
+    :type offline: bool
+    :return: Units which failed to be disabled
+    :rtype: list[str]
+    """
+    return _set_units_state('disable', units, offline)
+
+
 def get_service_files():
     """
     Get list of unit files of systemd services on the system
@@ -167,14 +402,45 @@ def _get_system_preset_files():
     return preset_files
 
 
-def _recursive_glob(pattern, root_dir):
-    for _, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            if fnmatch.fnmatch(filename, pattern):
-                yield filename
+class _UnitFilesIndex(object):
+    """
+    Index of names of files found in systemd unit load paths
 
+    The load paths are walked only once. Patterns without wildcards are looked
+    up directly, glob patterns are compiled once and their matches are cached.
+    """
 
-def _parse_preset_entry(entry, presets, load_path):
+    _GLOB_CHARS_RE = re.compile(r'[*?[]')
+
+    def __init__(self, load_path):
+        self._names = []
+        seen = set()
+        for path in load_path:
+            for _, _, filenames in os.walk(path):
+                for filename in filenames:
+                    if filename not in seen:
+                        seen.add(filename)
+                        self._names.append(filename)
+        self._names_set = seen
+        self._matches = {}
+
+    def match(self, pattern):
+        """
+        Get names of unit files matching the given pattern
+
+        :param pattern: Unit name or a glob pattern in the fnmatch format
+        :return: List of matching unit file names
+        :rtype: list[str]
+        """
+        if not self._GLOB_CHARS_RE.search(pattern):
+            return [pattern] if pattern in self._names_set else []
+        if pattern not in self._matches:
+            regex = re.compile(fnmatch.translate(pattern))
+            self._matches[pattern] = [name for name in self._names if regex.match(name)]
+        return self._matches[pattern]
+
+
+def _parse_preset_entry(entry, presets, unit_files_index):
     """
     Parse a single entry (line) in a preset file
 
@@ -182,31 +448,29 @@ def _parse_preset_entry(entry, presets, load_path):
 
     :param entry: The entry to parse
     :param presets: Dictionary to store the presets into
-    :param load_path: List of paths to look systemd unit files up in
+    :param unit_files_index: Index of unit files to look systemd units up in
+    :type unit_files_index: _UnitFilesIndex
     """
 
     columns = entry.split()
     if len(columns) < 2 or columns[0] not in ('enable', 'disable'):
         raise ValueError('Invalid preset file entry: "{}"'.format(entry))
 
-    for path in load_path:
-        # TODO(mmatuska): This currently also globs non unit files,
-        # so the results need to be filtered with something like endswith('.<unit_type>')
-        unit_files = _recursive_glob(columns[1], root_dir=path)
-
-        for unit_file in unit_files:
-            if '@' in columns[1] and len(columns) > 2:
-                # unit is a template,
-                # if the entry contains instance names after template unit name
-                # the entry only applies to the specified instances, not to the
-                # template itself
-                for instance in columns[2:]:
-                    service_name = unit_file[:unit_file.index('@') + 1] + instance + '.service'
-                    if service_name not in presets:  # first occurrence has priority
-                        presets[service_name] = columns[0]
+    # TODO(mmatuska): This currently also globs non unit files,
+    # so the results need to be filtered with something like endswith('.<unit_type>')
+    for unit_file in unit_files_index.match(columns[1]):
+        if '@' in columns[1] and len(columns) > 2:
+            # unit is a template,
+            # if the entry contains instance names after template unit name
+            # the entry only applies to the specified instances, not to the
+            # template itself
+            for instance in columns[2:]:
+                service_name = unit_file[:unit_file.index('@') + 1] + instance + '.service'
+                if service_name not in presets:  # first occurrence has priority
+                    presets[service_name] = columns[0]
 
-            elif unit_file not in presets:  # first occurrence has priority
-                presets[unit_file] = columns[0]
+        elif unit_file not in presets:  # first occurrence has priority
+            presets[unit_file] = columns[0]
 
 
 def _parse_preset_files(preset_files, load_path, ignore_invalid_entries):
@@ -220,6 +484,7 @@ def _parse_preset_files(preset_files, load_path, ignore_invalid_entries):
     :raises: ValueError: when a preset file has invalid content
     """
     presets = {}
+    unit_files_index = _UnitFilesIndex(load_path)
 
     for preset in preset_files:
         with open(preset, 'r') as preset_file:
@@ -227,7 +492,7 @@ def _parse_preset_files(preset_files, load_path, ignore_invalid_entries):
                 stripped = line.strip()
                 if stripped and stripped[0] not in ('#', ';'):  # ignore comments
                     try:
-                        _parse_preset_entry(stripped, presets, load_path)
+                        _parse_preset_entry(stripped, presets, unit_files_index)
                     except ValueError as err:
                         new_msg = 'Invalid preset file {pfile}: {error}'.format(pfile=preset, error=str(err))
                         if ignore_invalid_entries:
@@ -254,10 +519,14 @@ def get_system_service_preset_files(service_files, ignore_invalid_entries=False)
     preset_files = _get_system_preset_files()
     presets = _parse_preset_files(preset_files, SYSTEMD_SYSTEM_LOAD_PATH, ignore_invalid_entries)
 
+    service_files_by_name = {}
+    for service_file in service_files:
+        service_files_by_name.setdefault(service_file.name, service_file)
+
     preset_models = []
     for unit, state in presets.items():
         if unit.endswith('.service'):
-            service_file = next(iter([s for s in service_files if s.name == unit]), None)
+            service_file = service_files_by_name.get(unit)
             # presets can also be set on instances of template services which don't have a unit file
             if service_file and service_file.state in ('static', 'transient'):
                 continue
@@ -1,11 +1,12 @@
+import json
 from collections import namedtuple
 
 import pytest
 
 import leapp.models
-from leapp.libraries.common import dnfplugin
+from leapp.libraries.common import dnfplugin, mounting
 from leapp.libraries.common.config.version import get_major_version
-from leapp.libraries.common.testutils import CurrentActorMocked
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
 from leapp.libraries.stdlib import api
 from leapp.models.fields import Boolean
 from leapp.topics import Topic
@@ -68,6 +69,17 @@ class DATADnfPluginDataDnfConf(leapp.models.Model):
     releasever = fields.String()
     installroot = fields.StringEnum(choices=['/installroot'])
     test_flag = fields.Boolean()
+    transaction_path = fields.Nullable(fields.StringEnum(choices=[dnfplugin.DNF_PLUGIN_TRANSACTION_PATH]))
+
+
+class DATADnfPluginDataDownload(leapp.models.Model):
+    topic = DATADnfPluginDataTopic
+    max_parallel_downloads = fields.Nullable(fields.Integer())
+    repo_max_parallel_downloads = fields.Nullable(fields.Integer())
+    retries = fields.Nullable(fields.Integer())
+    attempts = fields.Integer()
+    manifest_path = fields.StringEnum(choices=[dnfplugin.DNF_PLUGIN_DOWNLOAD_MANIFEST_PATH])
+    stats_path = fields.StringEnum(choices=[dnfplugin.DNF_PLUGIN_DOWNLOAD_STATS_PATH])
 
 
 class DATADnfPluginDataRHUIAWS(leapp.models.Model):
@@ -85,12 +97,14 @@ class DATADnfPluginData(leapp.models.Model):
     topic = DATADnfPluginDataTopic
     pkgs_info = fields.Model(DATADnfPluginDataPkgsInfo)
     dnf_conf = fields.Model(DATADnfPluginDataDnfConf)
+    download = fields.Model(DATADnfPluginDataDownload)
     rhui = fields.Model(DATADnfPluginDataRHUI)
 
 
 # Delete those models from leapp.models to 'unpolute' the module
 del leapp.models.DATADnfPluginDataPkgsInfo
 del leapp.models.DATADnfPluginDataDnfConf
+del leapp.models.DATADnfPluginDataDownload
 del leapp.models.DATADnfPluginDataRHUI
 del leapp.models.DATADnfPluginDataRHUIAWS
 del leapp.models.DATADnfPluginData
@@ -169,6 +183,9 @@ def test_build_plugin_data(monkeypatch):
     )
     assert created.dnf_conf.debugsolver is True
     assert created.dnf_conf.test_flag is True
+    assert created.dnf_conf.transaction_path is None
+    assert created.download.max_parallel_downloads is None
+    assert created.download.attempts == dnfplugin._DEFAULT_DOWNLOAD_ATTEMPTS
     assert created.rhui.aws.on_aws is False
 
     with pytest.raises(fields.ModelViolationError):
@@ -191,3 +208,86 @@ def test_build_plugin_data(monkeypatch):
                 )
             )
         )
+
+
+@pytest.mark.parametrize('envars,expected', [
+    ({}, None),
+    ({'LEAPP_DNF_REPLAY_TRANSACTION': '1'}, dnfplugin.DNF_PLUGIN_TRANSACTION_PATH),
+])
+def test_build_plugin_data_transaction_path(monkeypatch, envars, expected):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(dst_ver='8.4', envars=envars))
+    created = DATADnfPluginData.create(
+        dnfplugin.build_plugin_data(
+            target_repoids=['BASEOS'],
+            debug=False,
+            test=False,
+            on_aws=False,
+            tasks=leapp.models.FilteredRpmTransactionTasks()
+        )
+    )
+    assert created.dnf_conf.transaction_path == expected
+
+
+def test_remove_stored_transaction(tmpdir):
+    context = mounting.NotIsolatedActions(base_dir=str(tmpdir))
+    transaction_path = tmpdir.join(dnfplugin.DNF_PLUGIN_TRANSACTION_PATH)
+    transaction_path.ensure()
+
+    dnfplugin._remove_stored_transaction(context)
+    assert not transaction_path.check()
+    # nothing to remove
+    dnfplugin._remove_stored_transaction(context)
+
+
+@pytest.mark.parametrize('envars,expected,warned', [
+    ({}, (None, None, None, dnfplugin._DEFAULT_DOWNLOAD_ATTEMPTS), False),
+    ({'LEAPP_DNF_MAX_PARALLEL_DOWNLOADS': '10', 'LEAPP_DNF_REPO_MAX_PARALLEL_DOWNLOADS': '4',
+      'LEAPP_DNF_DOWNLOAD_RETRIES': '0', 'LEAPP_DNF_DOWNLOAD_ATTEMPTS': '1'}, (10, 4, 0, 1), False),
+    ({'LEAPP_DNF_MAX_PARALLEL_DOWNLOADS': '0', 'LEAPP_DNF_DOWNLOAD_ATTEMPTS': 'many'},
+     (None, None, None, dnfplugin._DEFAULT_DOWNLOAD_ATTEMPTS), True),
+])
+def test_build_plugin_data_download(monkeypatch, envars, expected, warned):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(dst_ver='8.4', envars=envars))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    created = DATADnfPluginData.create(
+        dnfplugin.build_plugin_data(
+            target_repoids=['BASEOS'],
+            debug=False,
+            test=False,
+            on_aws=False,
+            tasks=leapp.models.FilteredRpmTransactionTasks()
+        )
+    )
+    download = created.download
+    assert (download.max_parallel_downloads, download.repo_max_parallel_downloads,
+            download.retries, download.attempts) == expected
+    assert bool(api.current_logger.warnmsg) == warned
+
+
+def test_log_download_stats(monkeypatch, tmpdir):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    context = mounting.NotIsolatedActions(base_dir=str(tmpdir))
+    stats = {
+        'attempts': 2,
+        'repos': {
+            'BASEOS': {'downloaded': 2, 'downloaded_bytes': 3 * 1024 * 1024, 'skipped': 1, 'skipped_bytes': 512,
+                       'failed': 0, 'seconds': 2.0, 'bytes_per_second': 1536 * 1024},
+            'APPSTREAM': {'downloaded': 0, 'downloaded_bytes': 0, 'skipped': 3, 'skipped_bytes': 2048,
+                          'failed': 1, 'seconds': 0.0, 'bytes_per_second': None},
+        },
+    }
+    tmpdir.join(dnfplugin.DNF_PLUGIN_DOWNLOAD_STATS_PATH).write(json.dumps(stats), ensure=True)
+
+    dnfplugin._log_download_stats(context)
+    assert api.current_logger.infomsg == [
+        'Repository APPSTREAM: downloaded 0 packages (0.0 B) in 0.0 s (n/a),'
+        ' 3 packages (2.0 KiB) downloaded previously, 1 failed',
+        'Repository BASEOS: downloaded 2 packages (3.0 MiB) in 2.0 s (1.5 MiB/s),'
+        ' 1 packages (512.0 B) downloaded previously, 0 failed',
+        'Packages downloaded in 2 attempts.',
+    ]
+
+    # stats of a previous download stage are removed
+    dnfplugin._remove_download_stats(context)
+    dnfplugin._log_download_stats(context)
+    assert len(api.current_logger.infomsg) == 3
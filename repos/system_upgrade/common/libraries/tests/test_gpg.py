@@ -1,12 +1,14 @@
+import hashlib
 import os
 import shutil
+import struct
 import tempfile
 
 import distro
 import pytest
 
 from leapp.libraries.common import gpg
-from leapp.libraries.common.testutils import CurrentActorMocked
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
 from leapp.libraries.stdlib import api
 from leapp.models import GpgKey, InstalledRPM, RPM
 
@@ -145,3 +147,127 @@ def test_pubkeys_from_rpms():
         ],
     )
     assert gpg.get_pubkeys_from_rpms(installed_rpms) == [GpgKey(fingerprint='9570ff31', rpmdb=True)]
+
+
+def _get_key_path(certs_dir):
+    cur_dir = os.path.dirname(os.path.abspath(__file__))
+    key_name = 'RPM-GPG-KEY-redhat-beta' if certs_dir.endswith('beta') else 'RPM-GPG-KEY-redhat-release'
+    return os.path.join(cur_dir, '..', '..', 'files', 'rpm-gpg', certs_dir, key_name)
+
+
+@pytest.mark.parametrize('certs_dir, exp', [
+    ('8', ['fd431d51', 'd4082792']),
+    ('8beta', ['f21541eb']),
+    ('9', ['fd431d51', '5a6340b3']),
+    ('9beta', ['f21541eb']),
+])
+def test_get_gpg_fp_from_data(monkeypatch, certs_dir, exp):
+    monkeypatch.setattr(gpg, '_fingerprints_cache', {})
+    with open(_get_key_path(certs_dir), 'rb') as f:
+        data = f.read()
+
+    assert gpg.get_gpg_fp_from_data(data) == exp
+    # the same keys in the binary form
+    assert gpg.get_gpg_fp_from_data(b''.join(gpg._dearmor(data))) == exp
+    assert len(gpg._fingerprints_cache) == 2
+
+
+def test_get_gpg_fp_from_data_packet_formats():
+    body = b'\x04' + struct.pack('>I', 1256212795) + b'\x01' + b'\x00\x08\xff' + b'\x00\x02\x03'
+    fp = hashlib.sha1(b'\x99' + struct.pack('>H', len(body)) + body).hexdigest()[-8:]
+    user_id = b'Test <test@example.com>'
+
+    new_format = b'\xc6' + struct.pack('>B', len(body)) + body + b'\xcd' + struct.pack('>B', len(user_id)) + user_id
+    old_format = b'\x99' + struct.pack('>H', len(body)) + body + b'\xb4' + struct.pack('>B', len(user_id)) + user_id
+    assert gpg.get_gpg_fp_from_data(new_format) == [fp]
+    assert gpg.get_gpg_fp_from_data(old_format) == [fp]
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'test',
+    b'-----BEGIN PGP PUBLIC KEY BLOCK-----\n\n-----END PGP PUBLIC KEY BLOCK-----\n',
+    # truncated packet
+    b'\x99\x01\x0d\x04',
+    # user ID packet only
+    b'\xb4\x04test',
+])
+def test_get_gpg_fp_from_data_invalid(data):
+    with pytest.raises(gpg.OpenPGPError):
+        gpg.get_gpg_fp_from_data(data)
+
+
+def test_get_gpg_fp_from_file(monkeypatch, tmpdir):
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+
+    def _gpg_show_keys_mocked(key_path):
+        assert key_path == str(tmpdir.join('no_key'))
+        return {'exit_code': 2, 'stdout': [], 'stderr': 'gpg: no valid OpenPGP data found.\n'}
+
+    monkeypatch.setattr(gpg, '_gpg_show_keys', _gpg_show_keys_mocked)
+
+    # gpg is not used for valid keys
+    assert gpg.get_gpg_fp_from_file(_get_key_path('9')) == ['fd431d51', '5a6340b3']
+
+    tmpdir.join('no_key').write('test')
+    assert gpg.get_gpg_fp_from_file(str(tmpdir.join('no_key'))) == []
+    assert api.current_logger.warnmsg
+
+
+class _ResponseMocked(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        if isinstance(self.data, Exception):
+            raise self.data
+        return self.data
+
+    def close(self):
+        pass
+
+
+def test_fetch_keys(monkeypatch):
+    timeouts = []
+
+    def _urlopen_mocked(url, timeout=None):
+        timeouts.append(timeout)
+        if url.endswith('missing'):
+            raise gpg.urllib.error.URLError('Not Found')
+        return _ResponseMocked(url.encode('utf-8'))
+
+    monkeypatch.setattr(gpg.urllib.request, 'urlopen', _urlopen_mocked)
+    urls = ['https://example.com/key{}'.format(i) for i in range(10)] + ['https://example.com/missing']
+
+    keys = gpg.fetch_keys(urls + urls[:2], timeout=5)
+    assert sorted(keys) == sorted(urls)
+    assert keys['https://example.com/key1'] == (b'https://example.com/key1', None)
+    assert keys['https://example.com/missing'][0] is None
+    assert isinstance(keys['https://example.com/missing'][1], gpg.urllib.error.URLError)
+    assert timeouts == [5] * len(urls)
+
+
+def test_fetch_keys_broken_response(monkeypatch):
+    def _urlopen_mocked(url, timeout=None):
+        if url.endswith('incomplete'):
+            return _ResponseMocked(gpg.http_client.IncompleteRead(b'partial'))
+        raise gpg.http_client.BadStatusLine('garbage')
+
+    monkeypatch.setattr(gpg.urllib.request, 'urlopen', _urlopen_mocked)
+    urls = ['https://example.com/incomplete', 'https://example.com/badstatus']
+
+    keys = gpg.fetch_keys(urls, timeout=5)
+    assert keys['https://example.com/incomplete'][0] is None
+    assert isinstance(keys['https://example.com/incomplete'][1], gpg.http_client.IncompleteRead)
+    assert keys['https://example.com/badstatus'][0] is None
+    assert isinstance(keys['https://example.com/badstatus'][1], gpg.http_client.BadStatusLine)
+
+
+def test_keyring():
+    keyring = gpg.Keyring([GpgKey(fingerprint='fd431d51', rpmdb=True)])
+    assert 'fd431d51' in keyring
+    assert '5a6340b3' not in keyring
+    assert keyring.get_missing(['5a6340b3', 'fd431d51', 'f21541eb']) == ['5a6340b3', 'f21541eb']
+    keyring.add('5a6340b3')
+    assert len(keyring) == 2
+    assert not keyring.get_missing(['5a6340b3', 'fd431d51'])
@@ -0,0 +1,106 @@
+from leapp.libraries.common import module
+from leapp.libraries.common.testutils import CurrentActorMocked
+from leapp.libraries.stdlib import api
+
+
+class SubstitutionsMocked(dict):
+    def update_from_etc(self, installroot):
+        pass
+
+
+class ConfMocked(object):
+    def __init__(self):
+        self.substitutions = SubstitutionsMocked()
+
+
+class BaseMocked(object):
+    def __init__(self, conf):
+        self.conf = conf
+        self.plugins_initialized = False
+        self.repos_read = False
+        self.sack_args = None
+        self.closed = False
+
+    def init_plugins(self):
+        self.plugins_initialized = True
+
+    def read_all_repos(self):
+        self.repos_read = True
+
+    def configure_plugins(self):
+        pass
+
+    def fill_sack(self, load_system_repo=True, load_available_repos=True):
+        self.sack_args = (load_system_repo, load_available_repos)
+
+    def close(self):
+        self.closed = True
+
+
+class DnfMocked(object):
+    def __init__(self):
+        self.bases = []
+
+        class _Conf(object):
+            Conf = ConfMocked
+
+        self.conf = _Conf
+
+    def Base(self, conf):
+        base = BaseMocked(conf)
+        self.bases.append(base)
+        return base
+
+
+def test_dnf_base_is_shared(monkeypatch):
+    dnf_mocked = DnfMocked()
+    monkeypatch.setattr(module, 'dnf', dnf_mocked)
+    monkeypatch.setattr(module, '_dnf_bases', {})
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='8.8', dst_ver='9.2'))
+
+    base = module.get_dnf_base()
+    assert module.get_dnf_base() is base
+    assert module._create_or_get_dnf_base() is base
+    assert len(dnf_mocked.bases) == 1
+    assert base.plugins_initialized and base.repos_read
+    assert base.sack_args == (True, True)
+    assert base.conf.substitutions['releasever'] == '8'
+
+
+def test_dnf_base_without_available_repos(monkeypatch):
+    dnf_mocked = DnfMocked()
+    monkeypatch.setattr(module, 'dnf', dnf_mocked)
+    monkeypatch.setattr(module, '_dnf_bases', {})
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='8.8', dst_ver='9.2'))
+
+    system_base = module.get_dnf_base(load_available_repos=False)
+    assert not system_base.plugins_initialized and not system_base.repos_read
+    assert system_base.sack_args == (True, False)
+
+    # Bases with and without available repositories are cached separately
+    full_base = module.get_dnf_base()
+    assert full_base is not system_base
+    assert module.get_dnf_base(load_available_repos=False) is system_base
+    assert len(dnf_mocked.bases) == 2
+
+
+def test_invalidate_dnf_base(monkeypatch):
+    dnf_mocked = DnfMocked()
+    monkeypatch.setattr(module, 'dnf', dnf_mocked)
+    monkeypatch.setattr(module, '_dnf_bases', {})
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(src_ver='8.8', dst_ver='9.2'))
+
+    base = module.get_dnf_base()
+    module.invalidate_dnf_base()
+    assert base.closed
+
+    new_base = module.get_dnf_base()
+    assert new_base is not base
+    assert len(dnf_mocked.bases) == 2
+
+
+def test_passed_dnf_base_is_used(monkeypatch):
+    monkeypatch.setattr(module, '_dnf_bases', {})
+    base = object()
+    assert module._create_or_get_dnf_base(base) is base
+    assert not module._dnf_bases
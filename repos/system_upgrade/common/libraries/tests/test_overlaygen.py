@@ -0,0 +1,155 @@
+import os
+import shutil
+import threading
+import time
+
+from leapp.libraries.common import overlaygen, utils
+from leapp.libraries.common.testutils import CurrentActorMocked, logger_mocked
+from leapp.libraries.stdlib import api
+
+
+class RunMocked(object):
+    """
+    Simulate commands used to create disk images by operations on regular files.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        if cmd[0] == '/bin/dd':
+            with open(cmd[2][len('of='):], 'w'):
+                pass
+        elif cmd[0].startswith('/sbin/mkfs'):
+            with open(cmd[-1], 'w') as f:
+                f.write(cmd[0])
+        elif cmd[0] == '/bin/cp':
+            shutil.copy(cmd[-2], cmd[-1])
+        return {'stdout': '', 'stderr': '', 'exit_code': 0}
+
+    def count(self, executable):
+        return len([cmd for cmd in self.commands if cmd[0] == executable])
+
+
+def test_create_mount_disk_images_parallel(monkeypatch):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_OVL_IMG_WORKERS': '3'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    threads = set()
+
+    def create_mount_disk_image_mocked(disk_images_directory, path, disk_size, templates_dir=None):
+        threads.add(threading.current_thread().name)
+        return os.path.join(disk_images_directory, '{}-{}'.format(path, disk_size))
+
+    monkeypatch.setattr(overlaygen, '_create_mount_disk_image', create_mount_disk_image_mocked)
+    disk_sizes = {'/mp{}'.format(i): i * 100 for i in range(10)}
+
+    images = overlaygen._create_mount_disk_images('/images', disk_sizes)
+
+    assert images == {mp: os.path.join('/images', '{}-{}'.format(mp, size)) for mp, size in disk_sizes.items()}
+    assert threading.current_thread().name not in threads
+
+
+def test_get_disk_image_workers_invalid(monkeypatch):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_OVL_IMG_WORKERS': 'many'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    assert overlaygen._get_disk_image_workers() == overlaygen._DEFAULT_DISK_IMAGE_WORKERS
+    assert api.current_logger.warnmsg
+
+
+def test_disk_image_template_reuse(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_EXECUTION_ID': 'run1'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    run_mocked = RunMocked()
+    monkeypatch.setattr(overlaygen, 'run', run_mocked)
+    monkeypatch.setattr(utils, 'run', run_mocked)
+    scratch_dir = str(tmp_path)
+    images_dir = os.path.join(scratch_dir, 'diskimages')
+    os.mkdir(images_dir)
+
+    templates_dir = overlaygen._get_diskimage_templates_dir(scratch_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/', 1000, templates_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/var', 1000, templates_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/home', 2000, templates_dir)
+
+    # images of different mountpoints are never copied from each other, as they
+    # would share the FS UUID and could not be mounted at the same time
+    assert run_mocked.count('/sbin/mkfs.xfs') == 3
+    assert run_mocked.count('/bin/cp') == 3
+
+    # templates survive the cleanup of the scratch directory
+    overlaygen.cleanup_scratch(scratch_dir, os.path.join(scratch_dir, 'mounts'))
+    assert not os.path.exists(images_dir)
+    assert overlaygen._get_diskimage_templates_dir(scratch_dir) == templates_dir
+    os.mkdir(images_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/', 1000, templates_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/var', 1000, templates_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/home', 2000, templates_dir)
+    assert run_mocked.count('/sbin/mkfs.xfs') == 3
+    with open(os.path.join(images_dir, 'root_var')) as f:
+        assert f.read() == '/sbin/mkfs.xfs'
+
+    # the template of a mountpoint is not used when the size differs
+    overlaygen._create_mount_disk_image(images_dir, '/var', 2000, templates_dir)
+    assert run_mocked.count('/sbin/mkfs.xfs') == 4
+
+    # templates of a different leapp execution are not used
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_EXECUTION_ID': 'run2'}))
+    templates_dir = overlaygen._get_diskimage_templates_dir(scratch_dir)
+    overlaygen._create_mount_disk_image(images_dir, '/', 1000, templates_dir)
+    assert run_mocked.count('/sbin/mkfs.xfs') == 5
+
+
+def test_disk_image_template_reuse_disabled(monkeypatch, tmp_path):
+    envars = {'LEAPP_EXECUTION_ID': 'run1', 'LEAPP_OVL_IMG_REUSE': '0'}
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars=envars))
+    os.mkdir(os.path.join(str(tmp_path), overlaygen._DISKIMAGE_TEMPLATES_DIRNAME))
+
+    assert overlaygen._get_diskimage_templates_dir(str(tmp_path)) is None
+    assert not os.listdir(str(tmp_path))
+
+
+def test_disk_image_template_created_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_EXECUTION_ID': 'run1'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    run_mocked = RunMocked()
+    formatting = threading.Event()
+
+    def slow_run_mocked(cmd, *args, **kwargs):
+        if cmd[0].startswith('/sbin/mkfs'):
+            formatting.set()
+            time.sleep(0.2)
+        return run_mocked(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(overlaygen, 'run', slow_run_mocked)
+    monkeypatch.setattr(utils, 'run', slow_run_mocked)
+    scratch_dir = str(tmp_path)
+    templates_dir = overlaygen._get_diskimage_templates_dir(scratch_dir)
+    images_dirs = [os.path.join(scratch_dir, 'diskimages{}'.format(i)) for i in range(2)]
+    for images_dir in images_dirs:
+        os.mkdir(images_dir)
+
+    # the second image waits until the template is stored by the first one
+    first = threading.Thread(target=overlaygen._create_mount_disk_image,
+                             args=(images_dirs[0], '/', 1000, templates_dir))
+    first.start()
+    formatting.wait(5)
+    overlaygen._create_mount_disk_image(images_dirs[1], '/', 1000, templates_dir)
+    first.join()
+
+    assert run_mocked.count('/sbin/mkfs.xfs') == 1
+    with open(os.path.join(images_dirs[1], 'root_')) as f:
+        assert f.read() == '/sbin/mkfs.xfs'
+
+
+def test_cleanup_diskimage_templates(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(envars={'LEAPP_EXECUTION_ID': 'run1'}))
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    scratch_dir = str(tmp_path)
+    templates_dir = overlaygen._get_diskimage_templates_dir(scratch_dir)
+    assert os.path.isdir(templates_dir)
+
+    overlaygen.cleanup_diskimage_templates(scratch_dir)
+    assert not os.path.exists(templates_dir)
+    # nothing to remove
+    overlaygen.cleanup_diskimage_templates(scratch_dir)
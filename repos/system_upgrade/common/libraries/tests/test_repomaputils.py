@@ -1,14 +1,19 @@
 import functools
+import json
 import logging
+import os
 
 import pytest
 
-from leapp.libraries.actor import setuptargetrepos_repomap
-from leapp.libraries.actor.setuptargetrepos_repomap import get_default_repository_channels, RepoMapDataHandler
-from leapp.libraries.common.testutils import CurrentActorMocked, produce_mocked
+from leapp.libraries.common import repomaputils
+from leapp.libraries.common.repomaputils import get_default_repository_channels, RepoMapDataHandler
+from leapp.libraries.common.testutils import CurrentActorMocked
 from leapp.libraries.stdlib import api
 from leapp.models import PESIDRepositoryEntry, RepoMapEntry, RepositoriesMapping
 
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+SHIPPED_REPOMAP_PATH = os.path.join(CUR_DIR, '../../../../../etc/leapp/files/repomap.json')
+
 
 def make_pesid_repo(pesid, major_version, repoid, arch='x86_64', repo_type='rpm', channel='ga', rhui=''):
     """
@@ -154,7 +159,7 @@ def test_get_source_pesid_repos(monkeypatch, repomap_data_for_pesid_repo_retriev
     fail_description = (
         'The get_source_pesid_repos method does not take into account the source system version correctly.'
     )
-    monkeypatch.setattr(setuptargetrepos_repomap, 'get_source_major_version', lambda: '10')
+    monkeypatch.setattr(repomaputils, 'get_source_major_version', lambda: '10')
 
     # Repeat the same test as above to make sure it respects the source OS major version
     assert [] == handler.get_source_pesid_repos('pesid1'), fail_description
@@ -682,3 +687,40 @@ def test_multiple_repoids_in_repomapping(monkeypatch, rhui):
 
     assert 'rhel8-rhui' in target_repoids
     assert target_repoids['rhel8-rhui'].repoid == 'repoid8-rhui{0}'.format(expected_suffixes[rhui])
+
+
+def _load_shipped_repomap(source_major_version, target_major_version):
+    with open(SHIPPED_REPOMAP_PATH) as f:
+        data = json.load(f)
+    mapping = []
+    for mapping_entry in data['mapping']:
+        if (mapping_entry['source_major_version'], mapping_entry['target_major_version']) == (
+                source_major_version, target_major_version):
+            mapping.extend(RepoMapEntry(source=entry['source'], target=entry['target'])
+                           for entry in mapping_entry['entries'])
+    repositories = []
+    for repo_family in data['repositories']:
+        for entry in repo_family['entries']:
+            repositories.append(make_pesid_repo(repo_family['pesid'], entry['major_version'], entry['repoid'],
+                                                arch=entry['arch'], repo_type=entry['repo_type'],
+                                                channel=entry['channel'], rhui=entry.get('rhui', '')))
+    return RepositoriesMapping(mapping=mapping, repositories=repositories)
+
+
+@pytest.mark.skipif(not os.path.exists(SHIPPED_REPOMAP_PATH), reason='the shipped repomap.json is not available')
+def test_indexed_lookups_shipped_repomap(monkeypatch):
+    """
+    Compare lookups of the handler with linear scans of the shipped repomap data.
+    """
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(arch='x86_64', src_ver='8.10', dst_ver='9.4'))
+    repomap = _load_shipped_repomap('8', '9')
+    handler = RepoMapDataHandler(repomap)
+    src_repoids = sorted({repo.repoid for repo in repomap.repositories if repo.major_version == '8'})
+
+    for repo in repomap.repositories:
+        expected = [r for r in repomap.repositories if r.pesid == repo.pesid and r.major_version == repo.major_version]
+        assert handler.get_pesid_repos(repo.pesid, repo.major_version) == expected
+        # None is expected for repoids shared by multiple RHUI providers only
+        pesid_repo = handler.get_pesid_repo_entry(repo.repoid, repo.major_version)
+        assert (pesid_repo.repoid == repo.repoid) if pesid_repo else repo.rhui
+    assert handler.get_expected_target_pesid_repos(src_repoids)
@@ -0,0 +1,381 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+dnf = pytest.importorskip('dnf')
+hawkey = pytest.importorskip('hawkey')
+importlib_util = pytest.importorskip('importlib.util')
+
+PLUGIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'files', 'rhel_upgrade.py')
+
+PRIMARY_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm"'
+    ' packages="{count}">\n{packages}</metadata>\n'
+)
+
+PACKAGE_TEMPLATE = (
+    '<package type="rpm"><name>{name}</name><arch>noarch</arch>'
+    '<version epoch="0" ver="1.0" rel="1"/>'
+    '<checksum type="sha256" pkgid="YES">{checksum}</checksum>'
+    '<summary>{name}</summary><description>{name}</description><packager/><url/>'
+    '<time file="1" build="1"/><size package="{size}" installed="1" archive="1"/>'
+    '<location href="Packages/{name}-1.0-1.noarch.rpm"/>'
+    '<format><rpm:license>MIT</rpm:license>'
+    '<rpm:provides><rpm:entry name="{name}" flags="EQ" epoch="0" ver="1.0" rel="1"/></rpm:provides>'
+    '{obsoletes}</format></package>\n'
+)
+
+REPOMD_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">'
+    '<revision>{revision}</revision><data type="primary">'
+    '<checksum type="sha256">{checksum}</checksum><open-checksum type="sha256">{open_checksum}</open-checksum>'
+    '<location href="repodata/primary.xml.gz"/><timestamp>1</timestamp>'
+    '<size>{size}</size><open-size>{open_size}</open-size></data></repomd>\n'
+)
+
+REPO_PACKAGES = ['pkg{}'.format(i) for i in range(2000)] + ['python3.11', 'pkg-1.0', 'oldpkg', 'newpkg']
+REPO_OBSOLETES = {'newpkg': 'oldpkg'}
+
+
+def _create_fake_repo(repo_dir, names, obsoletes=None, contents=None, revision=1):
+    """
+    Create a repository with metadata of the given (noarch) packages
+
+    Package files are created only for packages with contents given, the
+    contents do not need to be a valid RPM to be downloaded.
+    """
+    obsoletes = obsoletes or {}
+    contents = contents or {}
+    packages = []
+    if contents:
+        repo_dir.mkdir('Packages')
+    for name in names:
+        obsoletes_xml = ''
+        if name in obsoletes:
+            obsoletes_xml = '<rpm:obsoletes><rpm:entry name="{}"/></rpm:obsoletes>'.format(obsoletes[name])
+        content = contents.get(name, name.encode('utf-8'))
+        if name in contents:
+            repo_dir.join('Packages', '{}-1.0-1.noarch.rpm'.format(name)).write_binary(content)
+        packages.append(PACKAGE_TEMPLATE.format(
+            name=name, checksum=hashlib.sha256(content).hexdigest(), size=len(content), obsoletes=obsoletes_xml
+        ))
+    primary = PRIMARY_TEMPLATE.format(count=len(packages), packages=''.join(packages)).encode('utf-8')
+    repodata = repo_dir.mkdir('repodata')
+    primary_gz = repodata.join('primary.xml.gz')
+    with gzip.open(str(primary_gz), 'wb') as f:
+        f.write(primary)
+    primary_gz_data = primary_gz.read_binary()
+    repodata.join('repomd.xml').write(REPOMD_TEMPLATE.format(
+        revision=revision,
+        checksum=hashlib.sha256(primary_gz_data).hexdigest(),
+        open_checksum=hashlib.sha256(primary).hexdigest(),
+        size=len(primary_gz_data),
+        open_size=len(primary),
+    ))
+
+
+class CliMocked(object):
+    def __init__(self, base):
+        self.base = base
+
+
+@pytest.fixture
+def plugin_command(tmpdir):
+    spec = importlib_util.spec_from_file_location('rhel_upgrade', PLUGIN_PATH)
+    plugin = importlib_util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+
+    repo_dir = tmpdir.mkdir('repo')
+    _create_fake_repo(repo_dir, REPO_PACKAGES, obsoletes=REPO_OBSOLETES)
+
+    base = dnf.Base()
+    base.conf.cachedir = str(tmpdir.mkdir('cache'))
+    base.conf.installroot = str(tmpdir.mkdir('installroot'))
+    base.repos.add_new_repo('fake', base.conf, baseurl=['file://{}'.format(repo_dir)])
+    base.fill_sack(load_system_repo=False)
+    yield plugin.RhelUpgradeCommand(CliMocked(base))
+    base.close()
+
+
+def test_install_bulk(plugin_command, capsys):
+    """
+    Compare the bulk marking of packages to install with marking them one by one
+    """
+    base = plugin_command.base
+    specs = ['pkg{}'.format(i) for i in range(0, 2000, 2)]
+    specs += ['missing{}'.format(i) for i in range(10)] + ['pkg19*', 'python3.11', 'pkg-1.0', 'oldpkg']
+
+    def process(bulk):
+        base.reset(goal=True)
+        bulk_op = plugin_command._install_bulk if bulk else None
+        plugin_command._process_entities(entities=specs, op=base.install, entity_name='Package', bulk_op=bulk_op)
+
+    def resolve(bulk):
+        process(bulk)
+        base.resolve()
+        return sorted(str(pkg) for pkg in base.transaction.install_set)
+
+    expected = resolve(bulk=False)
+    expected_warning = capsys.readouterr().err
+    assert resolve(bulk=True) == expected
+    assert capsys.readouterr().err == expected_warning
+    assert 'missing0 missing1' in expected_warning
+
+
+def test_install_bulk_reports_installed(plugin_command, monkeypatch):
+    base = plugin_command.base
+    reported = []
+    monkeypatch.setattr(base, '_report_already_installed', lambda pkgs: reported.append(list(pkgs)))
+
+    processed = plugin_command._install_bulk(['pkg1', 'newpkg', 'missing'])
+
+    assert processed == {'pkg1': True, 'newpkg': True}
+    # nothing is installed in the fake installroot
+    assert reported == [[], []]
+
+
+class GoalMocked(object):
+    def __init__(self):
+        self.erased = []
+
+    def erase(self, pkg, clean_deps=False):
+        self.erased.append(str(pkg))
+
+
+def test_remove_bulk(plugin_command, monkeypatch, capsys):
+    base = plugin_command.base
+    specs = ['pkg1', 'pkg2', 'missing', 'pkg3*']
+
+    # nothing is installed, so the packages are reported as not found like by base.remove()
+    plugin_command._process_entities(entities=specs, op=base.remove, entity_name='Package')
+    expected_warning = capsys.readouterr().err
+    plugin_command._process_entities(entities=specs, op=base.remove, entity_name='Package',
+                                     bulk_op=plugin_command._remove_bulk)
+    assert capsys.readouterr().err == expected_warning
+    assert 'pkg1 pkg2 missing' in expected_warning
+
+    # pretend packages of the fake repository are installed
+    monkeypatch.setattr(hawkey, 'SYSTEM_REPO_NAME', 'fake')
+    goal = GoalMocked()
+    monkeypatch.setattr(base, '_goal', goal)
+    assert plugin_command._remove_bulk(specs) == {'pkg1': True, 'pkg2': True}
+    assert sorted(goal.erased) == ['pkg1-1.0-1.noarch', 'pkg2-1.0-1.noarch']
+
+
+class HTTPRepo(object):
+    """
+    Local HTTP server serving a repository and recording the requested packages
+    """
+
+    def __init__(self, repo_dir):
+        http_server = pytest.importorskip('http.server')
+        requested = self.requested = []
+
+        class Handler(http_server.SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super(Handler, self).__init__(*args, directory=str(repo_dir), **kwargs)
+
+            def do_GET(self):
+                if self.path.endswith('.rpm'):
+                    requested.append(os.path.basename(self.path))
+                super(Handler, self).do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http_server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_download_packages_resume(tmpdir):
+    spec = importlib_util.spec_from_file_location('rhel_upgrade', PLUGIN_PATH)
+    plugin = importlib_util.module_from_spec(spec)
+    spec.loader.exec_module(plugin)
+
+    contents = {'pkg{}'.format(i): os.urandom(64 * 1024) for i in range(10)}
+    repo_dir = tmpdir.mkdir('repo')
+    _create_fake_repo(repo_dir, sorted(contents), contents=contents)
+    http_repo = HTTPRepo(repo_dir)
+
+    base = dnf.Base()
+    try:
+        base.conf.cachedir = str(tmpdir.mkdir('cache'))
+        base.conf.installroot = str(tmpdir.mkdir('installroot'))
+        base.repos.add_new_repo('fake', base.conf, baseurl=[http_repo.url])
+        base.fill_sack(load_system_repo=False)
+        command = plugin.RhelUpgradeCommand(CliMocked(base))
+        command.plugin_data = {'download': {
+            'max_parallel_downloads': 4,
+            'repo_max_parallel_downloads': 2,
+            'retries': 0,
+            'attempts': 2,
+            'manifest_path': str(tmpdir.join('manifest.json')),
+            'stats_path': str(tmpdir.join('stats.json')),
+        }}
+        command._configure_download()
+        assert base.conf.max_parallel_downloads == 4
+        pkgs = sorted(base.sack.query().available(), key=str)
+
+        base.download_packages(pkgs)
+        assert sorted(http_repo.requested) == sorted('{}-1.0-1.noarch.rpm'.format(name) for name in contents)
+        stats = json.loads(tmpdir.join('stats.json').read())
+        assert stats['repos']['fake']['downloaded'] == 10
+        assert stats['repos']['fake']['downloaded_bytes'] == 10 * 64 * 1024
+        assert len(json.loads(tmpdir.join('manifest.json').read())) == 10
+
+        # only missing and corrupted packages are downloaded again
+        del http_repo.requested[:]
+        os.unlink(pkgs[0].localPkg())
+        with open(pkgs[1].localPkg(), 'r+b') as f:
+            f.write(b'corrupted')
+        base.download_packages(pkgs)
+        assert sorted(http_repo.requested) == ['pkg0-1.0-1.noarch.rpm', 'pkg1-1.0-1.noarch.rpm']
+        stats = json.loads(tmpdir.join('stats.json').read())
+        assert stats['repos']['fake']['skipped'] == 8
+        with open(pkgs[1].localPkg(), 'rb') as f:
+            assert f.read() == contents['pkg1']
+    finally:
+        base.close()
+        http_repo.close()
+
+
+def _set_stage(command, stage, tmpdir, to_install=('pkg1', 'pkg2', 'newpkg')):
+    command.opts = argparse.Namespace(tid=[stage])
+    command.plugin_data = {
+        'pkgs_info': {
+            'local_rpms': [],
+            'to_install': list(to_install),
+            'to_remove': [],
+            'to_upgrade': [],
+            'modules_to_enable': [],
+        },
+        'dnf_conf': {'transaction_path': str(tmpdir.join('transaction.json'))},
+    }
+
+
+def _resolve(base):
+    base.resolve()
+    return sorted(str(pkg) for pkg in base.transaction.install_set)
+
+
+def _run_download(command, tmpdir):
+    _set_stage(command, 'download', tmpdir)
+    command.run()
+    install_set = _resolve(command.base)
+    command.run_resolved()
+    command.base.reset(goal=True)
+    return install_set
+
+
+def test_store_and_replay_transaction(plugin_command, tmpdir, capsys):
+    base = plugin_command.base
+    expected = _run_download(plugin_command, tmpdir)
+    assert expected == ['newpkg-1.0-1.noarch', 'pkg1-1.0-1.noarch', 'pkg2-1.0-1.noarch']
+    stored = json.loads(tmpdir.join('transaction.json').read())
+    assert stored['fingerprint'] == plugin_command.fingerprint
+    assert sorted(item['nevra'] for item in stored['transaction']['rpms']) == expected
+
+    command = type(plugin_command)(CliMocked(base))
+    _set_stage(command, 'upgrade', tmpdir)
+
+    def install_bulk_mocked(specs):
+        pytest.fail('The packages should be marked just by the replay of the stored transaction')
+
+    command._install_bulk = install_bulk_mocked
+    command.run()
+    assert 'Replaying the transaction' in capsys.readouterr().out
+    assert command.replay is not None
+    assert _resolve(base) == expected
+
+    post_transaction_calls = []
+    command.replay.post_transaction = lambda: post_transaction_calls.append(True)
+    command.run_transaction()
+    assert post_transaction_calls == [True]
+
+
+def test_fingerprint(plugin_command, tmpdir, monkeypatch):
+    _set_stage(plugin_command, 'download', tmpdir)
+    fingerprint = plugin_command._get_fingerprint()
+    assert fingerprint
+
+    _set_stage(plugin_command, 'download', tmpdir, to_install=['pkg1'])
+    assert plugin_command._get_fingerprint() != fingerprint
+
+    # different installed packages
+    _set_stage(plugin_command, 'download', tmpdir)
+
+    class QueryMocked(object):
+        def installed(self):
+            return ['oldpkg-0.1-1.noarch']
+
+    sack_cls = type(plugin_command.base.sack)
+    with monkeypatch.context() as m:
+        m.setattr(sack_cls, 'query', lambda self, flags=0: QueryMocked())
+        assert plugin_command._get_fingerprint() != fingerprint
+    assert plugin_command._get_fingerprint() == fingerprint
+
+    # the same and updated metadata of the repository
+    for revision, same in ((1, True), (2, False)):
+        repo_dir = tmpdir.mkdir('repo{}'.format(revision))
+        _create_fake_repo(repo_dir, REPO_PACKAGES, obsoletes=REPO_OBSOLETES, revision=revision)
+        base = dnf.Base()
+        try:
+            base.conf.cachedir = str(tmpdir.mkdir('cache{}'.format(revision)))
+            base.conf.installroot = str(tmpdir.mkdir('installroot{}'.format(revision)))
+            base.repos.add_new_repo('fake', base.conf, baseurl=['file://{}'.format(repo_dir)])
+            base.fill_sack(load_system_repo=False)
+            command = type(plugin_command)(CliMocked(base))
+            _set_stage(command, 'download', tmpdir)
+            assert (command._get_fingerprint() == fingerprint) is same
+        finally:
+            base.close()
+
+
+def test_replay_outdated_transaction(plugin_command, tmpdir, capsys):
+    base = plugin_command.base
+    _run_download(plugin_command, tmpdir)
+
+    command = type(plugin_command)(CliMocked(base))
+    _set_stage(command, 'upgrade', tmpdir, to_install=['pkg1', 'pkg3'])
+    command.run()
+    assert 'The stored transaction is outdated' in capsys.readouterr().out
+    assert command.replay is None
+    assert _resolve(base) == ['pkg1-1.0-1.noarch', 'pkg3-1.0-1.noarch']
+
+
+def test_replay_transaction_failed(plugin_command, tmpdir, capsys):
+    base = plugin_command.base
+    expected = _run_download(plugin_command, tmpdir)
+
+    # pkg5 is marked by the replay before the missing package fails it
+    stored = json.loads(tmpdir.join('transaction.json').read())
+    rpms = stored['transaction']['rpms']
+    for nevra in ('pkg5-1.0-1.noarch', 'missing-1.0-1.noarch'):
+        rpms.append(dict(rpms[0], nevra=nevra))
+    tmpdir.join('transaction.json').write(json.dumps(stored))
+
+    command = type(plugin_command)(CliMocked(base))
+    _set_stage(command, 'upgrade', tmpdir)
+    assert not command._replay_transaction()
+    assert 'Cannot replay the stored transaction' in capsys.readouterr().err
+    assert command.replay is None
+    assert _resolve(base) == []
+
+    base.reset(goal=True)
+    command.run()
+    assert command.replay is None
+    assert _resolve(base) == expected
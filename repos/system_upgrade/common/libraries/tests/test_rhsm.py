@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 from collections import namedtuple
 
 import pytest
@@ -385,3 +387,80 @@ def test_get_existing_product_certificates_missing_cert_directory(monkeypatch, a
     assert len(existing_product_certificates) == 1, fail_description
     fail_description = 'Library failed to identify certificate from mocked outputs.'
     assert existing_product_certificates[0] == '/etc/pki/product-default/cert', fail_description
+
+
+class ConcurrentIsolatedActionsMocked(IsolatedActionsMocked):
+    """
+    Simulate slow subscription-manager calls and track how many run at once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ConcurrentIsolatedActionsMocked, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def call(self, cmd, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.1)
+            return super(ConcurrentIsolatedActionsMocked, self).call(cmd, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_scan_rhsm_info_concurrent_and_cached(monkeypatch, actor_mocked):
+    context = ConcurrentIsolatedActionsMocked()
+    context.add_mocked_command_call_with_stdout(CMD_RHSM_LIST_CONSUMED, 'SKU: 598339696910')
+    context.add_mocked_command_call_with_stdout(CMD_RHSM_LIST_ENABLED_REPOS, 'Repo ID: rhel-7-server-rpms')
+    context.add_mocked_command_call_with_stdout(CMD_RHSM_RELEASE, 'Release: 7.9')
+    context.add_mocked_command_call_with_stdout(CMD_RHSM_STATUS, RHSM_STATUS_OUTPUT_SCA)
+    monkeypatch.setattr(rhsm, 'get_available_repo_ids', lambda context: ['rhel-7-server-rpms'])
+    monkeypatch.setattr(rhsm, 'get_existing_product_certificates', lambda context: ['/etc/pki/product/69.pem'])
+
+    info = rhsm.scan_rhsm_info(context)
+
+    assert info.attached_skus == ['598339696910']
+    assert info.available_repos == ['rhel-7-server-rpms']
+    assert info.enabled_repos == ['rhel-7-server-rpms']
+    assert info.release == '7.9'
+    assert info.sca_detected
+    assert info.existing_product_certificates == ['/etc/pki/product/69.pem']
+    assert context.max_running > 1
+    assert len(context.commands_called) == 4
+
+    # the outputs are cached for the context until the configuration is changed
+    assert rhsm.get_release(context) == '7.9'
+    assert rhsm.is_manifest_sca(context)
+    assert len(context.commands_called) == 4
+    rhsm.set_release(context, '7.8')
+    context.add_mocked_command_call_with_stdout(CMD_RHSM_RELEASE, 'Release: 7.8')
+    assert rhsm.get_release(context) == '7.8'
+    assert len(context.commands_called) == 6
+
+
+class RootedIsolatedActionsMocked(IsolatedActionsMocked):
+    def __init__(self, root):
+        super(RootedIsolatedActionsMocked, self).__init__()
+        self.root = root
+
+    def is_isolated(self):
+        return True
+
+    def full_path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+
+def test_set_container_mode_already_set(tmpdir):
+    """Tests that links are not created again, e.g. in the reused target userspace."""
+    tmpdir.mkdir('etc').mkdir('rhsm')
+    tmpdir.join('etc').mkdir('pki').mkdir('entitlement')
+    os.symlink('/etc/rhsm', str(tmpdir.join('etc', 'rhsm-host')))
+    context = RootedIsolatedActionsMocked(str(tmpdir))
+
+    rhsm.set_container_mode(context)
+
+    assert context.commands_called == [['ln', '-s', '/etc/pki/entitlement', '/etc/pki/entitlement-host']]
@@ -1,8 +1,17 @@
+
 import pytest
 
-from leapp.libraries.common.rpms import _parse_config_modification, get_leapp_dep_packages, get_leapp_packages
+from leapp.libraries import stdlib
+from leapp.libraries.common import rpms
+from leapp.libraries.common.rpms import (
+    _parse_config_modification,
+    get_files_owners,
+    get_leapp_dep_packages,
+    get_leapp_packages
+)
 from leapp.libraries.common.testutils import CurrentActorMocked
 from leapp.libraries.stdlib import api
+from leapp.models import DistributionSignedRPM, InstalledUnsignedRPM, RPM
 
 
 def test_parse_config_modification():
@@ -95,3 +104,239 @@ def test_get_leapp_dep_packages(major_version, component, result, monkeypatch):
         kwargs["component"] = component
 
     assert frozenset(get_leapp_dep_packages(**kwargs)) == frozenset(result)
+
+
+class MockedRpmContext(object):
+    """
+    Mocked rpm -qf calls for get_files_owners
+    """
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.calls = []
+
+    def call(self, cmd, split=False, checked=True):
+        paths = cmd[4:]
+        self.calls.append(paths)
+        stdout = []
+        stderr = []
+        for path in paths:
+            if path not in self.owners:
+                stderr.append('error: file {}: No such file or directory'.format(path))
+            elif not self.owners[path]:
+                stdout.append('file {} is not owned by any package'.format(path))
+            else:
+                stdout.extend(self.owners[path])
+        return {'stdout': stdout, 'stderr': '\n'.join(stderr), 'exit_code': 1 if stderr else 0}
+
+
+def test_get_files_owners_batched():
+    owners = {'/etc/pki/file{}'.format(i): ['pkg{}'.format(i % 3)] for i in range(10)}
+    owners['/etc/pki/custom'] = []
+    context = MockedRpmContext(owners)
+
+    result = get_files_owners(sorted(owners), context=context, batch_size=4)
+
+    assert len(context.calls) == 3
+    assert result == {path: pkgs for path, pkgs in owners.items() if pkgs}
+
+
+def test_get_files_owners_ambiguous_output():
+    owners = {
+        '/etc/a': ['pkgA'],
+        '/etc/b': ['pkgB', 'pkgC'],
+        '/etc/c': [],
+        '/etc/d': ['pkgD'],
+    }
+    # /etc/missing prints just an error so the number of lines matches
+    # the number of paths anyway
+    paths = ['/etc/a', '/etc/missing', '/etc/b', '/etc/c', '/etc/d']
+    context = MockedRpmContext(owners)
+
+    result = get_files_owners(paths, context=context)
+
+    assert len(context.calls) > 1
+    assert result == {'/etc/a': ['pkgA'], '/etc/b': ['pkgB', 'pkgC'], '/etc/d': ['pkgD']}
+
+
+def _make_rpms(count):
+    return [
+        RPM(name='pkg{}'.format(i), version='1.{}'.format(i % 7), release='1.el8', epoch='0',
+            packager='packager', arch='noarch' if i % 2 else 'x86_64', pgpsig='sig')
+        for i in range(count)
+    ]
+
+
+class ConsumeCounter(CurrentActorMocked):
+    def __init__(self, *args, **kwargs):
+        super(ConsumeCounter, self).__init__(*args, **kwargs)
+        self.consumed = 0
+
+    def consume(self, model):
+        self.consumed += 1
+        return super(ConsumeCounter, self).consume(model)
+
+
+def test_package_index_lookups(monkeypatch):
+    monkeypatch.setattr(rpms, '_package_indexes', {})
+    actor = ConsumeCounter(msgs=[DistributionSignedRPM(items=_make_rpms(10))])
+    monkeypatch.setattr(api, 'current_actor', actor)
+
+    index = rpms.get_package_index(DistributionSignedRPM)
+
+    assert len(index) == 10
+    assert 'pkg3' in index
+    assert [pkg.arch for pkg in index.get('pkg3')] == ['noarch']
+    assert index.has('pkg4', arch='x86_64')
+    assert not index.has('pkg4', arch='noarch')
+    assert index.has_nevra('pkg5', '0', '1.5', '1.el8', 'noarch')
+    assert not index.has_nevra('pkg5', '1', '1.5', '1.el8', 'noarch')
+    assert index.has_any(['nosuchpkg', 'pkg9'])
+    assert not index.has_any(['nosuchpkg'])
+    assert index.present({'pkg1', 'pkg2', 'nosuchpkg'}) == {'pkg1', 'pkg2'}
+    assert ('pkg1', 'noarch') in index.lookup(('name', 'arch'))
+
+    assert rpms.has_package(DistributionSignedRPM, 'pkg1', arch='noarch', version='1.1', release='1.el8')
+    assert not rpms.has_package(DistributionSignedRPM, 'pkg1', arch='x86_64')
+    assert rpms.has_any_package(DistributionSignedRPM, ('nosuchpkg', 'pkg0'))
+    assert rpms.create_lookup(DistributionSignedRPM, 'items', keys=('name',)) == {
+        ('pkg{}'.format(i),) for i in range(10)
+    }
+    # the index of the consumed message is reused by all the queries
+    assert actor.consumed == 5
+    assert rpms.get_package_index(DistributionSignedRPM) is index
+    assert actor.consumed == 6
+
+    assert not rpms.has_package(InstalledUnsignedRPM, 'pkg1')
+    assert actor.consumed == 7
+
+
+def test_package_index_not_shared_between_actors(monkeypatch):
+    monkeypatch.setattr(rpms, '_package_indexes', {})
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[DistributionSignedRPM(items=_make_rpms(2))]))
+    assert rpms.has_package(DistributionSignedRPM, 'pkg1')
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[DistributionSignedRPM(items=[])]))
+    assert not rpms.has_package(DistributionSignedRPM, 'pkg1')
+
+
+def test_package_index_of_different_message(monkeypatch):
+    monkeypatch.setattr(rpms, '_package_indexes', {})
+    msgs = [DistributionSignedRPM(items=_make_rpms(2))]
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=msgs))
+    assert rpms.has_package(DistributionSignedRPM, 'pkg1')
+
+    # e.g. the same actor consuming a different message
+    msgs[0] = DistributionSignedRPM(items=_make_rpms(1))
+    assert not rpms.has_package(DistributionSignedRPM, 'pkg1')
+
+
+def test_has_package_many_packages(monkeypatch):
+    monkeypatch.setattr(rpms, '_package_indexes', {})
+    packages = _make_rpms(5000)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[DistributionSignedRPM(items=packages)]))
+    names = ['pkg{}'.format(i) for i in range(0, 10000, 50)]
+
+    def uncached_has_package(model, package_name, arch=None, context=api):
+        lookup = {(pkg.name, pkg.arch) for pkg in next(context.consume(model)).items}
+        return (package_name, arch) in lookup
+
+    assert ([rpms.has_package(DistributionSignedRPM, name, arch='noarch') for name in names] ==
+            [uncached_has_package(DistributionSignedRPM, name, arch='noarch') for name in names])
+    assert len(rpms._package_indexes[DistributionSignedRPM][1]._lookups) == 1
+
+
+class MockedRpmRun(object):
+    """
+    Mocked rpm calls for the verification of files on the host
+    """
+
+    def __init__(self, packages, verify_lines):
+        self.packages = packages
+        self.verify_lines = verify_lines
+        self.calls = []
+
+    def __call__(self, cmd, split=False, checked=True):
+        self.calls.append(cmd)
+        stdout = []
+        if cmd[:2] == ['rpm', '-qf']:
+            for path in cmd[4:]:
+                owners = [pkg for pkg, files in self.packages.items() if path in files]
+                stdout.extend(owners or ['file {} is not owned by any package'.format(path)])
+        elif cmd[:2] == ['rpm', '-q']:
+            for pkg in cmd[4:]:
+                if pkg not in self.packages:
+                    stdout.append('package {} is not installed'.format(pkg))
+                stdout.extend('{}\t{}'.format(pkg, path) for path in self.packages.get(pkg, []))
+        elif cmd[:2] == ['rpm', '-V']:
+            for pkg in cmd[4:]:
+                stdout.extend(line for line in self.verify_lines if line.split()[-1] in self.packages.get(pkg, []))
+        return {'stdout': stdout, 'stderr': '', 'exit_code': 0}
+
+
+@pytest.mark.parametrize('line,expected', [
+    ('S.5....T.  c /etc/ssh/sshd_config', ('S.5....T.', 'c', '/etc/ssh/sshd_config')),
+    ('..5......    /usr/bin/tool', ('..5......', '', '/usr/bin/tool')),
+    ('missing     /usr/share/doc/file with spaces', ('missing', '', '/usr/share/doc/file with spaces')),
+    ('missing   d /usr/share/doc/README', ('missing', 'd', '/usr/share/doc/README')),
+    ('package foo is not installed', None),
+])
+def test_parse_verify_line(line, expected):
+    verified = rpms._parse_verify_line(line)
+    if expected is None:
+        assert verified is None
+    else:
+        assert (verified.flags, verified.attribute, verified.path) == expected
+        assert verified.line == line
+
+
+def test_verify_files_batched(monkeypatch):
+    packages = {
+        'openssh-server': ['/etc/ssh/sshd_config', '/usr/sbin/sshd'],
+        'openssl-libs': ['/etc/pki/tls/openssl.cnf'],
+        'glibc': ['/etc/ld.so.conf', '/usr/lib64/libc.so.6'],
+    }
+    verify_lines = [
+        'S.5....T.  c /etc/ssh/sshd_config',
+        'missing     /usr/lib64/libc.so.6',
+    ]
+    run_mocked = MockedRpmRun(packages, verify_lines)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    monkeypatch.setattr(stdlib, 'run', run_mocked)
+
+    paths = ['/etc/ssh/sshd_config', '/etc/pki/tls/openssl.cnf', '/etc/ld.so.conf', '/etc/custom.conf']
+    verified = rpms.verify_files(paths)
+
+    assert list(verified) == ['/etc/ssh/sshd_config']
+    assert verified['/etc/ssh/sshd_config'].flags == 'S.5....T.'
+    # one call to resolve owners and one call to verify them
+    assert len(run_mocked.calls) == 2
+
+    # all the results are remembered
+    assert rpms.get_files_owners(paths) == {
+        '/etc/ssh/sshd_config': ['openssh-server'],
+        '/etc/pki/tls/openssl.cnf': ['openssl-libs'],
+        '/etc/ld.so.conf': ['glibc'],
+    }
+    assert rpms.check_file_modification('/etc/ssh/sshd_config')
+    assert not rpms.check_file_modification('/etc/pki/tls/openssl.cnf')
+    assert len(run_mocked.calls) == 2
+
+    modifications = rpms.verify_packages(['glibc', 'openssh-server', 'nosuchpkg'])
+    assert {pkg: [f.path for f in files] for pkg, files in modifications.items()} == {
+        'glibc': ['/usr/lib64/libc.so.6'],
+        'openssh-server': ['/etc/ssh/sshd_config'],
+    }
+    # just the list of files is queried, packages have been verified already
+    assert len(run_mocked.calls) == 3
+
+
+def test_rpm_files_cache_not_shared_between_actors(monkeypatch):
+    run_mocked = MockedRpmRun({'pkg': ['/etc/file']}, [])
+    monkeypatch.setattr(stdlib, 'run', run_mocked)
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    assert rpms.get_files_owners(['/etc/file']) == {'/etc/file': ['pkg']}
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    assert rpms.get_files_owners(['/etc/file']) == {'/etc/file': ['pkg']}
+    assert len(run_mocked.calls) == 2
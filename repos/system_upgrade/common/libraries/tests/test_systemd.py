@@ -1,3 +1,4 @@
+import fnmatch
 import os
 from functools import partial
 
@@ -5,7 +6,7 @@ import pytest
 
 from leapp.libraries.common import systemd
 from leapp.libraries.common.testutils import logger_mocked
-from leapp.libraries.stdlib import api
+from leapp.libraries.stdlib import api, CalledProcessError
 from leapp.models import SystemdServiceFile, SystemdServicePreset
 
 CURR_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -65,6 +66,78 @@ def test_get_service_files(monkeypatch):
     assert service_files == expected
 
 
+class SystemctlMocked(object):
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.commands = []
+
+    def __call__(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        if any(unit in self.failing for unit in cmd[2:]):
+            raise CalledProcessError('Command {} failed with exit code 1.'.format(cmd), cmd, 1)
+        return {'stdout': '', 'stderr': '', 'exit_code': 0}
+
+
+def test_enable_units_batched(monkeypatch):
+    run_mocked = SystemctlMocked(failing=['bad.service'])
+    monkeypatch.setattr(systemd, 'run', run_mocked)
+    monkeypatch.setattr(systemd, '_SYSTEMCTL_BATCH_SIZE', 3)
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    units = ['unit{}.service'.format(i) for i in range(5)] + ['bad.service']
+
+    assert systemd.enable_units(units) == ['bad.service']
+    assert run_mocked.commands == [
+        ['systemctl', 'enable', 'unit0.service', 'unit1.service', 'unit2.service'],
+        ['systemctl', 'enable', 'unit3.service', 'unit4.service', 'bad.service'],
+        ['systemctl', 'enable', 'unit3.service'],
+        ['systemctl', 'enable', 'unit4.service'],
+        ['systemctl', 'enable', 'bad.service'],
+    ]
+    assert len(api.current_logger.errmsg) == 1
+    assert 'Failed to enable systemd unit "bad.service"' in api.current_logger.errmsg[0]
+
+
+def _write_unit(path, install):
+    path.write('[Unit]\nDescription=Test\n\n[Service]\nExecStart=/bin/true\n\n[Install]\n' + install)
+
+
+def test_enable_disable_units_offline(monkeypatch, tmpdir):
+    etc_dir = tmpdir.mkdir('etc')
+    usr_dir = tmpdir.mkdir('usr')
+    monkeypatch.setattr(systemd, 'SYSTEMD_SYMLINKS_DIR', str(etc_dir) + '/')
+    monkeypatch.setattr(systemd, 'SYSTEMD_SYSTEM_LOAD_PATH', [str(etc_dir), str(usr_dir)])
+    monkeypatch.setattr(api, 'current_logger', logger_mocked())
+    run_mocked = SystemctlMocked()
+    monkeypatch.setattr(systemd, 'run', run_mocked)
+
+    _write_unit(usr_dir.join('a.service'), 'WantedBy=multi-user.target\nAlias=alias-a.service\nAlso=b.socket\n')
+    _write_unit(usr_dir.join('b.socket'), 'WantedBy=sockets.target\nRequiredBy=a.service\n')
+    _write_unit(usr_dir.join('tpl@.service'), 'WantedBy=multi-user.target\nDefaultInstance=default\n')
+    _write_unit(usr_dir.join('spec.service'), 'WantedBy=%N.target\n')
+    etc_dir.join('masked.service').mksymlinkto('/dev/null')
+
+    units = ['a.service', 'tpl@.service', 'tpl@one.service', 'spec.service', 'masked.service']
+    assert systemd.enable_units(units, offline=True) == []
+
+    expected_links = {
+        'multi-user.target.wants/a.service': 'a.service',
+        'alias-a.service': 'a.service',
+        'sockets.target.wants/b.socket': 'b.socket',
+        'a.service.requires/b.socket': 'b.socket',
+        'multi-user.target.wants/tpl@default.service': 'tpl@.service',
+        'multi-user.target.wants/tpl@one.service': 'tpl@.service',
+    }
+    for link, unit_file in expected_links.items():
+        assert etc_dir.join(link).readlink() == str(usr_dir.join(unit_file))
+    # units which cannot be handled offline are enabled by systemctl
+    assert run_mocked.commands == [['systemctl', 'enable', 'spec.service', 'masked.service']]
+
+    assert systemd.disable_units(['a.service', 'tpl@.service'], offline=True) == []
+    for link in expected_links:
+        assert not etc_dir.join(link).check(link=True)
+    assert etc_dir.join('masked.service').check(link=True)
+
+
 def test_preset_files_overrides():
     etc_files = [
         '/etc/systemd/system-preset/00-abc.preset',
@@ -150,7 +223,7 @@ _PARSE_PRESET_ENTRIES_TEST_DEFINITION = (
 @pytest.mark.parametrize('entry,expected', _PARSE_PRESET_ENTRIES_TEST_DEFINITION)
 def test_parse_preset_entry(monkeypatch, entry, expected):
     presets = {}
-    systemd._parse_preset_entry(entry, presets, TEST_SYSTEMD_LOAD_PATH)
+    systemd._parse_preset_entry(entry, presets, systemd._UnitFilesIndex(TEST_SYSTEMD_LOAD_PATH))
     assert presets == expected
 
 
@@ -165,7 +238,7 @@ def test_parse_preset_entry(monkeypatch, entry, expected):
 def test_parse_preset_entry_invalid(monkeypatch, entry):
     presets = {}
     with pytest.raises(ValueError, match=r'^Invalid preset file entry: '):
-        systemd._parse_preset_entry(entry, presets, TEST_SYSTEMD_LOAD_PATH)
+        systemd._parse_preset_entry(entry, presets, systemd._UnitFilesIndex(TEST_SYSTEMD_LOAD_PATH))
 
 
 def test_parse_preset_files(monkeypatch):
@@ -209,6 +282,56 @@ def test_parse_preset_files_ignore_invalid(monkeypatch):
     assert presets == {'example.service': 'disable'}
 
 
+def test_parse_preset_files_many_units(monkeypatch, tmpdir):
+    """
+    Parse presets for thousands of unit files and check the unit files are not scanned for every entry
+    """
+    load_path = [str(tmpdir.mkdir('etc')), str(tmpdir.mkdir('usr'))]
+    for i in range(1000):
+        unit_dir = tmpdir.join('usr' if i % 4 else 'etc', 'dir{}'.format(i % 10))
+        unit_dir.ensure('unit{}.service'.format(i))
+        unit_dir.ensure('unit{}.socket'.format(i))
+    tmpdir.join('usr', 'template@.service').ensure()
+
+    entries = ['enable unit{}.service'.format(i) for i in range(0, 2000, 6)]
+    entries += ['disable unit1{}*.socket'.format(i) for i in range(20)]
+    entries += ['enable template@.service one two', 'disable *']
+    preset_file = tmpdir.join('90-default.preset')
+    preset_file.write('\n'.join(entries))
+
+    def parse_preset_entries_naive():
+        presets = {}
+        for entry in entries:
+            columns = entry.split()
+            for path in load_path:
+                for _, _, filenames in os.walk(path):
+                    for filename in filenames:
+                        if not fnmatch.fnmatch(filename, columns[1]):
+                            continue
+                        if len(columns) > 2:
+                            for instance in columns[2:]:
+                                presets.setdefault(filename.replace('@', '@' + instance), columns[0])
+                        else:
+                            presets.setdefault(filename, columns[0])
+        return presets
+
+    walked = []
+    walk = os.walk
+
+    def walk_mocked(path):
+        walked.append(path)
+        return walk(path)
+
+    with monkeypatch.context() as m:
+        m.setattr(systemd.os, 'walk', walk_mocked)
+        presets = systemd._parse_preset_files([str(preset_file)], load_path, False)
+    # each directory is scanned just once
+    assert sorted(walked) == sorted(load_path)
+    assert presets == parse_preset_entries_naive()
+    assert len(presets) == 2003
+    assert presets['template@one.service'] == 'enable'
+
+
 def parse_preset_files_mocked():
     mocked = partial(systemd._parse_preset_files, load_path=TEST_SYSTEMD_LOAD_PATH)
 
@@ -0,0 +1,59 @@
+from leapp.libraries.common import udev
+from leapp.libraries.common.testutils import CurrentActorMocked
+from leapp.libraries.stdlib import api
+from leapp.models import UdevAdmInfoData, UdevDevice, UdevProperty
+
+UUID = '4a5b2c18-ac4c-4ad2-b3bc-3c8e5f8ae0ec'
+
+
+def _get_udevadm_info():
+    return UdevAdmInfoData(devices=[
+        UdevDevice(
+            devpath='/devices/virtual/block/dm-0',
+            devname='/dev/dm-0',
+            subsystem='block',
+            devlinks=['/dev/mapper/mpatha', '/dev/disk/by-uuid/{}'.format(UUID)],
+            properties=[UdevProperty(name='ID_FS_UUID', value=UUID), UdevProperty(name='ID_FS_TYPE', value='xfs')],
+        ),
+        UdevDevice(
+            devpath='/devices/pci0000:00/0000:00:04.0/host0/target0:0:0/0:0:0:0/block/sda',
+            devname='/dev/sda',
+            subsystem='block',
+            properties=[UdevProperty(name='ID_FS_UUID', value=UUID),
+                        UdevProperty(name='ID_PATH', value='pci-0000:00:04.0-scsi-0:0:0:0')],
+        ),
+        UdevDevice(devpath='/devices/virtual/net/lo', subsystem='net'),
+    ])
+
+
+def test_get_property():
+    device = _get_udevadm_info().devices[0]
+    assert udev.get_property(device, 'ID_FS_TYPE') == 'xfs'
+    assert udev.get_property(device, 'ID_PATH') is None
+    assert udev.get_property(device, 'ID_PATH', '') == ''
+
+
+def test_udev_database():
+    devices = _get_udevadm_info().devices
+    db = udev.UdevDatabase(_get_udevadm_info())
+
+    assert db.get_device('/devices/virtual/net/lo') == devices[2]
+    assert db.get_device('/devices/virtual/net/eth0') is None
+    assert db.get_device_by_node('/dev/sda') == devices[1]
+    assert db.get_device_by_node('/dev/mapper/mpatha') == devices[0]
+    assert db.get_device_by_node('/dev/disk/by-uuid/{}'.format(UUID)) == devices[0]
+    assert db.get_device_by_node('/dev/sdb') is None
+    assert db.get_devices_by_subsystem('block') == devices[:2]
+    assert db.get_devices_by_subsystem('usb') == []
+    assert db.get_devices_by_fs_uuid(UUID) == devices[:2]
+    assert db.get_devices_by_id_path('pci-0000:00:04.0-scsi-0:0:0:0') == [devices[1]]
+    assert db.get_devices_by_id_path('pci-0000:00:05.0') == []
+
+
+def test_udev_database_from_messages(monkeypatch):
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked(msgs=[_get_udevadm_info()]))
+    db = udev.UdevDatabase.from_messages()
+    assert len(db.devices) == 3
+
+    monkeypatch.setattr(api, 'current_actor', CurrentActorMocked())
+    assert udev.UdevDatabase.from_messages() is None
@@ -0,0 +1,97 @@
+from leapp.libraries.stdlib import api
+from leapp.models import UdevAdmInfoData
+
+_INDEXED_PROPERTIES = ('ID_FS_UUID', 'ID_PATH')
+
+
+def get_property(device, name, default=None):
+    """
+    Return the value of the given property of the udev device
+
+    :param device: The udev device
+    :type device: leapp.models.UdevDevice
+    :param name: Name of the property, e.g. ID_FS_TYPE
+    :type name: str
+    """
+    for prop in device.properties:
+        if prop.name == name:
+            return prop.value
+    return default
+
+
+class UdevDatabase(object):
+    """
+    Devices of the udev database indexed for lookups
+
+    Devices are indexed by their devpath, device node, symlinks, subsystem
+    and by the ID_FS_UUID and ID_PATH properties.
+    """
+
+    def __init__(self, udevadm_info):
+        """
+        :param udevadm_info: The udev database data
+        :type udevadm_info: leapp.models.UdevAdmInfoData
+        """
+        self.devices = udevadm_info.devices
+        self._by_devpath = {}
+        self._by_node = {}
+        self._by_subsystem = {}
+        self._by_property = {name: {} for name in _INDEXED_PROPERTIES}
+        for device in self.devices:
+            self._by_devpath[device.devpath] = device
+            if device.devname:
+                self._by_node[device.devname] = device
+            for link in device.devlinks:
+                self._by_node[link] = device
+            if device.subsystem:
+                self._by_subsystem.setdefault(device.subsystem, []).append(device)
+            for prop in device.properties:
+                if prop.name in self._by_property:
+                    self._by_property[prop.name].setdefault(prop.value, []).append(device)
+
+    @classmethod
+    def from_messages(cls):
+        """
+        Create the database from the consumed UdevAdmInfoData message
+
+        :return: The database or None if the message is not available
+        """
+        udevadm_info = next(api.consume(UdevAdmInfoData), None)
+        if udevadm_info is None:
+            return None
+        return cls(udevadm_info)
+
+    def get_device(self, devpath):
+        """
+        Return the device with the given devpath (e.g. /devices/virtual/block/dm-0) or None
+        """
+        return self._by_devpath.get(devpath)
+
+    def get_device_by_node(self, path):
+        """
+        Return the device with the given device node or symlink or None
+
+        :param path: Path to the device node or symlink, e.g. /dev/sda or /dev/disk/by-uuid/<uuid>
+        :type path: str
+        """
+        return self._by_node.get(path)
+
+    def get_devices_by_subsystem(self, subsystem):
+        """
+        Return the list of devices of the given subsystem (e.g. block)
+        """
+        return list(self._by_subsystem.get(subsystem, ()))
+
+    def get_devices_by_fs_uuid(self, uuid):
+        """
+        Return the list of devices containing a file system with the given UUID
+
+        Multiple devices can report the same UUID, e.g. multipath paths.
+        """
+        return list(self._by_property['ID_FS_UUID'].get(uuid, ()))
+
+    def get_devices_by_id_path(self, id_path):
+        """
+        Return the list of devices with the given persistent path (ID_PATH)
+        """
+        return list(self._by_property['ID_PATH'].get(id_path, ()))
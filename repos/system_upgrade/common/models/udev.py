@@ -2,8 +2,54 @@ from leapp.models import fields, Model
 from leapp.topics import SystemInfoTopic
 
 
+class UdevProperty(Model):
+    """
+    Property of a device stored in the udev database (the "E:" record)
+    """
+    topic = SystemInfoTopic
+
+    name = fields.String()
+    value = fields.String()
+
+
+class UdevDevice(Model):
+    """
+    Device stored in the udev database
+
+    Properties which duplicate other fields of the model (DEVPATH, DEVNAME,
+    SUBSYSTEM and DEVLINKS) are not included in properties.
+    """
+    topic = SystemInfoTopic
+
+    devpath = fields.String()
+    """Path of the device in /sys, e.g. /devices/virtual/block/dm-0 (the "P:" record)."""
+
+    devname = fields.Nullable(fields.String(default=None))
+    """Path of the device node, e.g. /dev/dm-0."""
+
+    subsystem = fields.Nullable(fields.String(default=None))
+    """Kernel subsystem of the device, e.g. block."""
+
+    devlinks = fields.List(fields.String(), default=[])
+    """Symlinks to the device node, e.g. /dev/disk/by-uuid/<uuid> (the "S:" records)."""
+
+    properties = fields.List(fields.Model(UdevProperty), default=[])
+
+
 class UdevAdmInfoData(Model):
     topic = SystemInfoTopic
 
-    db = fields.String()
-    """Database export obtained by executing 'udevadm info -e'."""
+    db = fields.Nullable(fields.String(default=None))
+    """
+    Database export obtained by executing 'udevadm info -e'.
+
+    The export is kept only when leapp is executed in the debug mode. Use
+    devices instead.
+    """
+
+    devices = fields.List(fields.Model(UdevDevice), default=[])
+    """
+    Devices parsed from the database export.
+
+    See leapp.libraries.common.udev for helpers to look up the devices.
+    """